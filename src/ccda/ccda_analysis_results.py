@@ -0,0 +1,131 @@
+"""
+CCDA Analysis Results
+
+Compact in-memory model for per-file information richness metrics.
+
+Section templateIds (long OID strings repeated across every file) are
+interned once into an integer symbol table. Each file keeps its section
+scores and counts in typed arrays indexed by position, inside a __slots__
+record. The JSON view used by checkpoints and analysis.json is only built
+when a result is written out.
+"""
+
+from array import array
+from typing import Dict, List, Optional
+
+class SectionSymbolTable:
+    """Interns section IDs into small integers."""
+
+    __slots__ = ('ids', 'names')
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+
+    def intern(self, section_id: str) -> int:
+        """Return the integer symbol for a section ID, adding it if new."""
+        symbol = self.ids.get(section_id)
+        if symbol is None:
+            symbol = len(self.names)
+            self.ids[section_id] = symbol
+            self.names.append(section_id)
+        return symbol
+
+    def name(self, symbol: int) -> str:
+        """Return the section ID for an integer symbol."""
+        return self.names[symbol]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+# Process-wide table; pickled results carry section IDs, not symbols,
+# so pool workers and the parent can each keep their own table
+SECTION_SYMBOLS = SectionSymbolTable()
+
+class FileMetrics:
+    """Information richness metrics for one analyzed file."""
+
+    __slots__ = ('file_size', 'error', 'sections', 'scores',
+                 'word_counts', 'char_counts', 'token_counts', 'coded_elements', 'entries')
+
+    def __init__(self, file_size: int = 0, error: Optional[str] = None):
+        self.file_size = file_size
+        self.error = error
+        self.sections = array('I')        # interned section IDs, first-seen order
+        self.scores = array('d')
+        self.word_counts = array('I')
+        self.char_counts = array('I')
+        self.token_counts = array('I')
+        self.coded_elements = array('I')
+        self.entries = array('I')
+
+    def add_section(self, section_id: str, score: float, details: Dict):
+        """
+        Record a section's score and counts. A repeated section ID overwrites
+        the earlier values but keeps its original position.
+        """
+        symbol = SECTION_SYMBOLS.intern(section_id)
+        try:
+            i = self.sections.index(symbol)
+        except ValueError:
+            self.sections.append(symbol)
+            self.scores.append(score)
+            self.word_counts.append(details['word_count'])
+            # Results checkpointed before character and token counts were kept
+            self.char_counts.append(details.get('char_count', 0))
+            self.token_counts.append(details.get('token_count', 0))
+            self.coded_elements.append(details['coded_elements'])
+            self.entries.append(details['entries'])
+            return
+
+        self.scores[i] = score
+        self.word_counts[i] = details['word_count']
+        self.char_counts[i] = details.get('char_count', 0)
+        self.token_counts[i] = details.get('token_count', 0)
+        self.coded_elements[i] = details['coded_elements']
+        self.entries[i] = details['entries']
+
+    # Files that failed part way keep their partial sections but rank last
+    @property
+    def total_score(self) -> float:
+        return 0.0 if self.error else sum(self.scores)
+
+    @property
+    def unique_sections(self) -> int:
+        return 0 if self.error else len(self.sections)
+
+    def to_json(self) -> Dict:
+        """Build the JSON view written to checkpoints and analysis.json."""
+        names = [SECTION_SYMBOLS.name(symbol) for symbol in self.sections]
+        return {
+            'file_size': self.file_size,
+            'section_scores': dict(zip(names, self.scores)),
+            'section_details': {
+                name: {
+                    'word_count': self.word_counts[i],
+                    'char_count': self.char_counts[i],
+                    'token_count': self.token_counts[i],
+                    'coded_elements': self.coded_elements[i],
+                    'entries': self.entries[i]
+                }
+                for i, name in enumerate(names)
+            },
+            'total_score': self.total_score,
+            'unique_sections': self.unique_sections,
+            'error': self.error
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict) -> 'FileMetrics':
+        """Rebuild a compact record from its JSON view."""
+        metrics = cls(data.get('file_size', 0), data.get('error'))
+        details = data.get('section_details', {})
+        for section_id, score in data.get('section_scores', {}).items():
+            metrics.add_section(section_id, score, details.get(
+                section_id, {'word_count': 0, 'coded_elements': 0, 'entries': 0}
+            ))
+        return metrics
+
+    def __reduce__(self):
+        # Symbols are only valid in the process that interned them
+        return (FileMetrics.from_json, (self.to_json(),))
@@ -0,0 +1,381 @@
+"""
+CCDA Canonical XML
+
+Streaming C14N 2.0 serialization of CCDA documents, used to store documents
+compactly (ccda_xml_reformatter.py --mode storage) and to compare them by
+digest (ccda_content_verifier.py).
+
+The canonical form is that of the document as the CCDA scripts parse it:
+whitespace-only text between elements, which the parser drops as ignorable
+(remove_blank_text), is left out and all other text is kept exactly.
+Comments and processing instructions are kept; the XML declaration and any
+DOCTYPE are not part of C14N. Pretty printing a document does not change its
+canonical form, and a canonical document is its own canonical form.
+
+The document is read with iterparse and its events are written in document
+order; every element is released once it has been written, so memory is
+bounded by the document depth, not its size. The events go to CanonicalWriter,
+which writes the same text as lxml's C14NWriterTarget (with comments, no other
+options) but resolves each qualified name once per namespace scope rather than
+for every element, several times faster on large documents.
+
+canonical_digest() hashes the canonical form as it is produced, never holding
+it. Besides the SHA-256 of the whole form it keeps a short digest per
+DIGEST_BLOCK_SIZE bytes, so the first difference between two documents can be
+found afterwards by re-reading only the block it is in (canonical_excerpt).
+"""
+
+import hashlib
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from lxml import etree
+
+# Bytes of canonical form per block digest
+DIGEST_BLOCK_SIZE = 64 * 1024
+
+XML_NAMESPACE = 'http://www.w3.org/XML/1998/namespace'
+
+def _escape_text(text: str) -> str:
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    if '\r' in text:
+        text = text.replace('\r', '&#xD;')
+    return text
+
+def _escape_attribute(value: str) -> str:
+    if '&' in value:
+        value = value.replace('&', '&amp;')
+    if '<' in value:
+        value = value.replace('<', '&lt;')
+    if '"' in value:
+        value = value.replace('"', '&quot;')
+    if '\t' in value:
+        value = value.replace('\t', '&#x9;')
+    if '\n' in value:
+        value = value.replace('\n', '&#xA;')
+    if '\r' in value:
+        value = value.replace('\r', '&#xD;')
+    return value
+
+def _name_order(name: str) -> List[str]:
+    return name.split('}', 1)
+
+class _NamespaceScope:
+    """Namespace declarations written on an element, and tags written under them."""
+
+    __slots__ = ('parent', 'declared', 'tags', 'children')
+
+    def __init__(self, parent: Optional['_NamespaceScope'], declared: List[Tuple[str, str]]):
+        self.parent = parent
+        # (uri, prefix) in declaration order
+        self.declared = declared
+        # (source declarations, tag, attribute names) -> _Tag
+        self.tags: Dict[Tuple, '_Tag'] = {}
+        # Declarations -> scope of a child element that writes them
+        self.children: Dict[Tuple[Tuple[str, str], ...], '_NamespaceScope'] = {}
+
+class _Tag(NamedTuple):
+    """How an element with a given name and attribute names is written."""
+    # '<' + qualified name + namespace declarations
+    start: str
+    # (attribute name, written name) in canonical order
+    attributes: List[Tuple[str, str]]
+    end: str
+    scope: _NamespaceScope
+
+class CanonicalWriter:
+    """
+    C14N 2.0 writer for parse events (the parser target interface), with
+    comments. C14N 2.0 declares a namespace on the first element that uses
+    it, so how a tag is written depends only on its names, the declarations
+    written on its ancestors and those of the source: it is worked out once
+    per namespace scope and reused.
+    """
+
+    __slots__ = ('write', 'text', 'scopes', 'source_namespaces', 'source_contexts', 'ends',
+                 'root_seen', 'root_done')
+
+    def __init__(self, write: Callable[[str], None]):
+        self.write = write
+        self.text = []
+        # Written declarations per open element
+        self.scopes = [_NamespaceScope(None, [(XML_NAMESPACE, 'xml')])]
+        # Source declarations per open element, then those of the next element
+        self.source_namespaces = [[]]
+        # Source declarations in scope per open element, as nested tuples
+        self.source_contexts = [()]
+        self.ends = []
+        self.root_seen = False
+        self.root_done = False
+
+    def _qname(self, name: str, new: List[Tuple[str, str]]) -> Tuple[str, str]:
+        """(qualified name, uri) of a name, resolved as by C14NWriterTarget."""
+        if name[:1] == '{':
+            uri, local = name[1:].rsplit('}', 1)
+        else:
+            uri, local = '', name
+
+        prefixes_seen = set()
+        scope = self.scopes[-1]
+        for u, prefix in new:
+            if u == uri and prefix not in prefixes_seen:
+                return f'{prefix}:{local}' if prefix else local, uri
+            prefixes_seen.add(prefix)
+        while scope is not None:
+            for u, prefix in scope.declared:
+                if u == uri and prefix not in prefixes_seen:
+                    return f'{prefix}:{local}' if prefix else local, uri
+                prefixes_seen.add(prefix)
+            scope = scope.parent
+
+        if not uri and '' not in prefixes_seen:
+            # No default namespace declared => no prefix needed
+            return local, uri
+
+        # Declare the source's prefix for it on this element
+        for namespaces in reversed(self.source_namespaces):
+            for u, prefix in namespaces:
+                if u == uri:
+                    new.append((uri, prefix))
+                    return f'{prefix}:{local}' if prefix else local, uri
+
+        if not uri:
+            return local, uri
+        raise ValueError(f'Namespace "{uri}" is not declared in scope')
+
+    def _tag(self, tag: str, names: Tuple[str, ...]) -> _Tag:
+        parent = self.scopes[-1]
+        new = []
+        # In C14NWriterTarget's order, which decides the order of declarations
+        qnames = {name: self._qname(name, new) for name in sorted({tag, *names}, key=_name_order)}
+
+        start = '<' + qnames[tag][0]
+        for name, uri in sorted(('xmlns:' + prefix if prefix else 'xmlns', uri) for uri, prefix in new):
+            start += f' {name}="{_escape_attribute(uri)}"'
+        # No prefix for attributes in no namespace
+        attributes = [(name, qnames[name][0] if qnames[name][1] else name) for name in sorted(names)]
+
+        scope = parent
+        if new:
+            declared = tuple(new)
+            scope = parent.children.get(declared)
+            if scope is None:
+                scope = parent.children[declared] = _NamespaceScope(parent, new)
+        # The end tag is resolved under the element's own declarations
+        self.scopes.append(scope)
+        end = f'</{self._qname(tag, [])[0]}>'
+        self.scopes.pop()
+        return _Tag(start, attributes, end, scope)
+
+    def _flush(self):
+        text = ''.join(self.text)
+        self.text.clear()
+        if text and self.root_seen:
+            self.write(_escape_text(text))
+
+    def data(self, data: str):
+        self.text.append(data)
+
+    def start_ns(self, prefix: str, uri: str):
+        if self.text:
+            self._flush()
+        self.source_namespaces[-1].append((uri, prefix))
+
+    def start(self, tag: str, attrs):
+        if self.text:
+            self._flush()
+
+        context = self.source_contexts[-1]
+        if self.source_namespaces[-1]:
+            # Repeated declarations (xmlns:sdtc on every sdtc element) give equal contexts
+            context = (tuple(self.source_namespaces[-1]), context)
+        names = tuple(attrs.keys()) if attrs else ()
+        signature = (context, tag, names)
+        tags = self.scopes[-1].tags
+        written = tags.get(signature)
+        if written is None:
+            written = tags[signature] = self._tag(tag, names)
+
+        if written.attributes:
+            self.write(written.start + ''.join([
+                f' {qname}="{_escape_attribute(attrs[name])}"' for name, qname in written.attributes
+            ]) + '>')
+        else:
+            self.write(written.start + '>')
+
+        self.scopes.append(written.scope)
+        self.source_contexts.append(context)
+        self.ends.append(written.end)
+        self.root_seen = True
+        self.source_namespaces.append([])
+
+    def end(self, tag: str):
+        if self.text:
+            self._flush()
+        self.write(self.ends.pop())
+        self.scopes.pop()
+        self.source_contexts.pop()
+        self.source_namespaces.pop()
+        self.root_done = len(self.scopes) == 1
+
+    def comment(self, text: str):
+        if self.root_done:
+            self.write('\n')
+        elif self.root_seen and self.text:
+            self._flush()
+        self.write(f'<!--{_escape_text(text)}-->')
+        if not self.root_seen:
+            self.write('\n')
+
+    def pi(self, target: str, data: Optional[str]):
+        if self.root_done:
+            self.write('\n')
+        elif self.root_seen and self.text:
+            self._flush()
+        self.write(f'<?{target} {_escape_text(data)}?>' if data else f'<?{target}?>')
+        if not self.root_seen:
+            self.write('\n')
+
+def write_canonical(source, write: Callable[[str], None]):
+    """Write the canonical form of a document (a path or binary stream) as text."""
+    target = CanonicalWriter(write)
+    # [element, last child node] per open element
+    stack = []
+    # Declarations of the next element, reported before its start event
+    namespaces = []
+
+    for event, node in etree.iterparse(source, events=('start-ns', 'start', 'end', 'comment', 'pi'),
+                                       remove_blank_text=True):
+        if event == 'start-ns':
+            namespaces.append(node)
+            continue
+
+        if event == 'end':
+            last_child = stack.pop()[1]
+            text = node.text if last_child is None else last_child.tail
+            if text:
+                target.data(text)
+            target.end(node.tag)
+            if stack:
+                stack[-1][1] = node
+            # Written; the parent still needs the tail
+            node.clear(keep_tail=True)
+            continue
+
+        if stack:
+            # The text before a new child is complete when it starts
+            frame = stack[-1]
+            parent, last_child = frame
+            if last_child is None:
+                text = parent.text
+            else:
+                text = last_child.tail
+                # Earlier siblings are written; release them
+                while parent[0] is not node:
+                    del parent[0]
+            if text:
+                target.data(text)
+            frame[1] = node
+
+        if event == 'start':
+            for prefix, uri in namespaces:
+                target.start_ns(prefix or '', uri)
+            namespaces.clear()
+            target.start(node.tag, node.attrib)
+            stack.append([node, None])
+        elif event == 'comment':
+            target.comment(node.text)
+        else:
+            target.pi(node.target, node.text)
+
+class CanonicalDigest(NamedTuple):
+    """SHA-256 of a canonical form, its length and its block digests."""
+    sha256: str
+    size: int
+    blocks: List[bytes]
+
+    def first_difference(self, other: 'CanonicalDigest') -> int:
+        """Index of the first block that differs from other's."""
+        for i, (block, other_block) in enumerate(zip(self.blocks, other.blocks)):
+            if block != other_block:
+                return i
+        return min(len(self.blocks), len(other.blocks))
+
+class _DigestWriter:
+    """Hashes written text as UTF-8, in total and per block."""
+
+    __slots__ = ('digest', 'size', 'blocks', 'block', 'block_left', 'buffer', 'buffered')
+
+    # The C14N target writes many short strings; hash them in batches
+    BUFFER_CHARS = 64 * 1024
+
+    def __init__(self):
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.blocks = []
+        self.block = hashlib.blake2b(digest_size=16)
+        self.block_left = DIGEST_BLOCK_SIZE
+        self.buffer = []
+        self.buffered = 0
+
+    def write(self, text: str):
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= self.BUFFER_CHARS:
+            self._flush()
+
+    def _flush(self):
+        data = ''.join(self.buffer).encode('utf-8')
+        self.buffer.clear()
+        self.buffered = 0
+        self.digest.update(data)
+        self.size += len(data)
+        while len(data) >= self.block_left:
+            self.block.update(data[:self.block_left])
+            data = data[self.block_left:]
+            self.blocks.append(self.block.digest())
+            self.block = hashlib.blake2b(digest_size=16)
+            self.block_left = DIGEST_BLOCK_SIZE
+        self.block.update(data)
+        self.block_left -= len(data)
+
+    def result(self) -> CanonicalDigest:
+        self._flush()
+        if self.block_left < DIGEST_BLOCK_SIZE:
+            self.blocks.append(self.block.digest())
+        return CanonicalDigest(self.digest.hexdigest(), self.size, self.blocks)
+
+def canonical_digest(source) -> CanonicalDigest:
+    """Digest of a document's canonical form, computed in constant memory."""
+    writer = _DigestWriter()
+    write_canonical(source, writer.write)
+    return writer.result()
+
+class _ExcerptComplete(Exception):
+    pass
+
+def canonical_excerpt(source, start: int, length: int) -> bytes:
+    """Bytes start to start + length of a document's canonical form."""
+    parts = []
+    position = 0
+
+    def write(text: str):
+        nonlocal position
+        data = text.encode('utf-8')
+        end = position + len(data)
+        if end > start:
+            parts.append(data[max(start - position, 0):start + length - position])
+        position = end
+        if position >= start + length:
+            # Stop reading the rest of the document
+            raise _ExcerptComplete
+
+    try:
+        write_canonical(source, write)
+    except _ExcerptComplete:
+        pass
+    return b''.join(parts)
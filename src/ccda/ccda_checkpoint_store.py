@@ -0,0 +1,222 @@
+"""
+CCDA Checkpoint Store
+
+Append-only checkpoint storage for long-running CCDA analysis jobs.
+
+Results are appended to a compact JSONL log and every record gets a line in
+a small tab-separated index (offset, length, score, file key). Resuming a run
+only needs the index, so startup cost stays flat no matter how many metrics
+the log holds. Records are read back from the log on demand.
+
+Layout inside the checkpoint directory:
+- <name>_log.jsonl: one {"file": ..., "metrics": ...} record per line
+- <name>_index.tsv: offset<TAB>length<TAB>score<TAB>file per record
+"""
+
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+class CheckpointStore:
+    """Append-only JSONL result log with an offset index for fast resume."""
+
+    def __init__(self, checkpoint_dir: str, name: str = 'analysis'):
+        self.checkpoint_dir = Path(checkpoint_dir)
+        self.checkpoint_dir.mkdir(exist_ok=True, parents=True)
+        self.log_file = self.checkpoint_dir / f'{name}_log.jsonl'
+        self.index_file = self.checkpoint_dir / f'{name}_index.tsv'
+
+        # file key -> (offset, length, score) of its latest record
+        self.index: Dict[str, Tuple[int, int, float]] = {}
+        self._log_end = 0
+
+        self._load_index()
+        self._recover_tail()
+
+    def _load_index(self):
+        """Read the offset index written by previous runs."""
+        if not self.index_file.exists():
+            return
+
+        with open(self.index_file, encoding='utf-8') as f:
+            for line in f:
+                parts = line.rstrip('\n').split('\t', 3)
+                if len(parts) != 4:
+                    # Partial line from an interrupted write
+                    continue
+                offset, length, score, key = int(parts[0]), int(parts[1]), float(parts[2]), parts[3]
+                self.index[key] = (offset, length, score)
+                self._log_end = max(self._log_end, offset + length)
+
+    def _recover_tail(self):
+        """
+        Index log records written after the last index update and drop a
+        trailing partial record left behind by a crash.
+        """
+        if not self.log_file.exists():
+            self.log_file.touch()
+            return
+
+        log_size = self.log_file.stat().st_size
+        if log_size < self._log_end:
+            # The index got ahead of the log; keep only entries that fit
+            logger.warning(f"Checkpoint index is ahead of {self.log_file}, dropping missing entries")
+            self.index = {
+                key: entry for key, entry in self.index.items()
+                if entry[0] + entry[1] <= log_size
+            }
+            self._log_end = max((o + l for o, l, _ in self.index.values()), default=0)
+            self._rewrite_index()
+
+        if log_size == self._log_end:
+            return
+
+        recovered = []
+        with open(self.log_file, 'rb') as f:
+            f.seek(self._log_end)
+            offset = self._log_end
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                score = record['metrics'].get('total_score', 0) or 0
+                recovered.append((record['file'], offset, len(line), score))
+                offset += len(line)
+
+        if offset < log_size:
+            logger.warning(f"Truncating partial record at offset {offset} in {self.log_file}")
+            with open(self.log_file, 'r+b') as f:
+                f.truncate(offset)
+
+        if recovered:
+            logger.info(f"Recovered {len(recovered)} unindexed records from {self.log_file}")
+            self._append_index(recovered)
+
+    def _rewrite_index(self):
+        """Rewrite the index file from the in-memory index."""
+        entries = sorted(self.index.items(), key=lambda x: x[1][0])
+        tmp_file = self.index_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            for key, (offset, length, score) in entries:
+                f.write(f"{offset}\t{length}\t{score!r}\t{key}\n")
+        os.replace(tmp_file, self.index_file)
+
+    def _append_index(self, entries: List[Tuple[str, int, int, float]]):
+        """Append (key, offset, length, score) entries to the index."""
+        with open(self.index_file, 'a', encoding='utf-8') as f:
+            for key, offset, length, score in entries:
+                f.write(f"{offset}\t{length}\t{score!r}\t{key}\n")
+                self.index[key] = (offset, length, score)
+                self._log_end = max(self._log_end, offset + length)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def keys(self):
+        """Return the keys of all stored records."""
+        return self.index.keys()
+
+    def append(self, results: Dict[str, Dict]):
+        """
+        Append a batch of results to the log, then index them.
+        The log is flushed before the index so the index never points at
+        records that were not written.
+        """
+        if not results:
+            return
+
+        entries = []
+        with open(self.log_file, 'ab') as f:
+            offset = self._log_end
+            for key, metrics in results.items():
+                line = json.dumps(
+                    {'file': key, 'metrics': metrics},
+                    separators=(',', ':')
+                ).encode('utf-8') + b'\n'
+                f.write(line)
+                score = metrics.get('total_score', 0) or 0
+                entries.append((key, offset, len(line), score))
+                offset += len(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._append_index(entries)
+
+    def rewrite(self, results: Iterable[Tuple[str, Dict]]):
+        """
+        Replace the whole log with new records, e.g. after rescoring.
+        results may stream from this store's own log; it is only replaced
+        once every record has been written.
+        The index is removed before the log is swapped, so a crash part way
+        leaves a log that is re-indexed from scratch on the next open.
+        """
+        tmp_log = self.log_file.with_name(self.log_file.name + '.tmp')
+        entries = []
+        try:
+            with open(tmp_log, 'wb') as f:
+                offset = 0
+                for key, metrics in results:
+                    line = json.dumps(
+                        {'file': key, 'metrics': metrics},
+                        separators=(',', ':')
+                    ).encode('utf-8') + b'\n'
+                    f.write(line)
+                    score = metrics.get('total_score', 0) or 0
+                    entries.append((key, offset, len(line), score))
+                    offset += len(line)
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            # results may be a stream that fails part way; keep the old log
+            tmp_log.unlink(missing_ok=True)
+            raise
+
+        if self.index_file.exists():
+            self.index_file.unlink()
+        os.replace(tmp_log, self.log_file)
+        self.index = {}
+        self._log_end = 0
+        self._append_index(entries)
+        logger.info(f"Rewrote {self.log_file} with {len(entries)} records")
+
+    def iter_records(self) -> Iterator[Tuple[str, Dict]]:
+        """Stream the latest (file key, metrics) record for every key in log order."""
+        with open(self.log_file, 'rb') as f:
+            for key, (offset, length, _) in sorted(self.index.items(), key=lambda x: x[1][0]):
+                f.seek(offset)
+                yield key, json.loads(f.read(length))['metrics']
+
+    def get(self, key: str) -> Dict:
+        """Read the stored metrics for a single file key."""
+        offset, length, _ = self.index[key]
+        with open(self.log_file, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.read(length))['metrics']
+
+    def ranked(self) -> List[Tuple[str, float]]:
+        """
+        Return (key, score) pairs ordered by score, highest first.
+        Ties keep log order. Only the index is sorted, never the metrics.
+        """
+        entries = sorted(self.index.items(), key=lambda x: (-x[1][2], x[1][0]))
+        return [(key, score) for key, (_, _, score) in entries]
+
+    def iter_ranked(self, keys: Optional[Set[str]] = None) -> Iterator[Tuple[str, Dict]]:
+        """Stream (file key, metrics) records in score order, optionally only for keys."""
+        with open(self.log_file, 'rb') as f:
+            for key, _ in self.ranked():
+                if keys is not None and key not in keys:
+                    continue
+                offset, length, _ = self.index[key]
+                f.seek(offset)
+                yield key, json.loads(f.read(length))['metrics']
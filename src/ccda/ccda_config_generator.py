@@ -6,6 +6,7 @@ This script reads the section analysis results and generates a configuration fil
 containing all CCDA sections with their weights and metadata.
 """
 
+import sys
 import json
 import logging
 from pathlib import Path
@@ -18,10 +19,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def calculate_section_weight(section_data):
+def calculate_section_weight(section_data, text_measure='words'):
     """
     Calculate an appropriate weight for a section based on its metrics.
     Uses a combination of frequency, content density, and clinical importance.
+    text_measure ('words' or 'tokens') selects how narrative size counts.
     """
     # Base weight starts at 0.3
     weight = 0.3
@@ -32,11 +34,15 @@ def calculate_section_weight(section_data):
     elif section_data['frequency'] >= 0.75:  # Present in 75%+ of files
         weight += 0.1
     
-    # Content density bonus (up to 0.3)
+    # Content density bonus (up to 0.3); a token is about 0.75 words
+    if text_measure == 'tokens':
+        text_score = section_data['avg_tokens'] * 0.00075
+    else:
+        text_score = section_data['avg_text_length'] * 0.001
     content_score = (
         section_data['avg_entries'] * 0.1 +
         section_data['avg_coded_elements'] * 0.05 +
-        section_data['avg_text_length'] * 0.001
+        text_score
     )
     weight += min(0.3, content_score)
     
@@ -79,18 +85,30 @@ def calculate_section_weight(section_data):
     # Round to 2 decimal places and cap at 1.0
     return min(1.0, round(weight, 2))
 
-def generate_config(analysis_file: str, output_file: str):
+def generate_config(analysis_file: str, output_file: str, text_measure: str = 'words'):
     """
     Generate CCDA configuration file from analysis results.
+    With text_measure 'tokens', weights and the information analyzer's
+    narrative scoring use model-token counts instead of word counts.
+    
+    Raises ValueError if text_measure is 'tokens' and the analysis has no
+    token counts (written before the section analyzer collected them).
     """
     # Read analysis results
     with open(analysis_file) as f:
         analysis_data = json.load(f)
     
+    if text_measure == 'tokens' and any('avg_tokens' not in data for data in analysis_data.values()):
+        raise ValueError(
+            f"{analysis_file} has no token counts; re-run ccda_section_analyzer.py "
+            f"to collect them, or use --text-measure words"
+        )
+    
     # Generate configuration
     config = {
         "version": "1.0",
         "description": "CCDA sections configuration generated from analysis of actual CCDA files",
+        "text_measure": text_measure,
         "sections": {}
     }
     
@@ -107,7 +125,7 @@ def generate_config(analysis_file: str, output_file: str):
         data['id'] = section_id
         
         # Process main section
-        weight = calculate_section_weight(data)
+        weight = calculate_section_weight(data, text_measure)
         title = data['titles'][0] if data['titles'] else 'Unknown Section'
         
         # Create base section entry
@@ -118,7 +136,8 @@ def generate_config(analysis_file: str, output_file: str):
             "metrics": {
                 "avg_entries": data['avg_entries'],
                 "avg_coded_elements": data['avg_coded_elements'],
-                "avg_text_length": data['avg_text_length']
+                "avg_text_length": data['avg_text_length'],
+                "avg_tokens": data.get('avg_tokens', 0)
             },
             "template_ids": list(data['template_ids']),
             "codes": data['codes'],
@@ -143,7 +162,7 @@ def generate_config(analysis_file: str, output_file: str):
                         subsection_data['titles'] = [loinc_sections[loinc_code]]
                         
                         # Calculate subsection weight
-                        subsection_weight = calculate_section_weight(subsection_data)
+                        subsection_weight = calculate_section_weight(subsection_data, text_measure)
                         
                         # Create subsection entry
                         config['sections'][subsection_id] = {
@@ -154,7 +173,8 @@ def generate_config(analysis_file: str, output_file: str):
                             "metrics": {
                                 "avg_entries": data['avg_entries'],
                                 "avg_coded_elements": data['avg_coded_elements'],
-                                "avg_text_length": data['avg_text_length']
+                                "avg_text_length": data['avg_text_length'],
+                                "avg_tokens": data.get('avg_tokens', 0)
                             },
                             "loinc_code": loinc_code,
                             "template_ids": list(data['template_ids']),
@@ -217,8 +237,19 @@ def main():
         help='Output configuration file'
     )
     
+    parser.add_argument(
+        '--text-measure',
+        choices=['words', 'tokens'],
+        default='words',
+        help='Measure narrative size in words or model tokens'
+    )
+    
     args = parser.parse_args()
-    generate_config(args.analysis_file, args.output_file)
+    try:
+        generate_config(args.analysis_file, args.output_file, args.text_measure)
+    except ValueError as e:
+        logger.error(str(e))
+        sys.exit(1)
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
@@ -5,16 +5,29 @@ CCDA Reformatting Verification Script
 This script:
 1. Randomly selects files from the reformatted directory
 2. Compares them with their original versions
-3. Reports any differences after removing whitespace
+3. Reports any differences in their canonical (C14N 2.0) form
+
+Reformatted documents may be pretty-printed XML or the reformatter's storage
+outputs (compressed canonical files or bundles); both are read through
+ccda_document_source.
+
+Documents are compared by the SHA-256 of their canonical form, which
+ccda_canonical_xml hashes as it streams it, so each file is read once in
+constant memory. Ignorable whitespace between elements is not part of the
+canonical form; whitespace inside text is, so a change to text content is a
+difference. For a differing pair only the block of canonical form holding the
+first difference is re-read, to show it in context.
 """
 
 import os
 import random
 import logging
 import argparse
+from multiprocessing import Pool
 from pathlib import Path
-from lxml import etree
-import difflib
+
+from ccda_canonical_xml import DIGEST_BLOCK_SIZE, canonical_digest, canonical_excerpt
+from ccda_document_source import document_basename, document_name, list_documents, open_document
 
 # Configure logging
 logging.basicConfig(
@@ -23,38 +36,61 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def normalize_xml(file_path):
-    """Parse XML and return normalized string without whitespace."""
+# Bytes of canonical form shown on each side of a first difference
+CONTEXT_BYTES = 80
+
+def digest_document(uri):
+    """Canonical digest of a document, or None if it cannot be parsed."""
     try:
-        parser = etree.XMLParser(remove_blank_text=True)
-        tree = etree.parse(file_path, parser)
-        # Convert to string and remove all whitespace
-        xml_str = etree.tostring(tree, encoding='utf-8', xml_declaration=True)
-        return xml_str.decode('utf-8').replace(' ', '').replace('\n', '')
+        with open_document(uri) as source:
+            return canonical_digest(source)
     except Exception as e:
-        logger.error(f"Failed to parse {file_path}: {str(e)}")
+        logger.error(f"Failed to parse {uri}: {str(e)}")
         return None
 
+def describe_difference(original_path, reformatted_path, original, reformatted):
+    """Offset and context of the first difference between two canonical forms."""
+    start = original.first_difference(reformatted) * DIGEST_BLOCK_SIZE
+    with open_document(original_path) as source:
+        original_block = canonical_excerpt(source, start, DIGEST_BLOCK_SIZE)
+    with open_document(reformatted_path) as source:
+        reformatted_block = canonical_excerpt(source, start, DIGEST_BLOCK_SIZE)
+
+    offset = 0
+    for a, b in zip(original_block, reformatted_block):
+        if a != b:
+            break
+        offset += 1
+    lo = max(offset - CONTEXT_BYTES, 0)
+    hi = offset + CONTEXT_BYTES
+
+    def context(block):
+        return block[lo:hi].decode('utf-8', errors='replace')
+
+    return (
+        f"Canonical forms differ at byte {start + offset} "
+        f"(sizes {original.size} and {reformatted.size}, "
+        f"SHA-256 {original.sha256[:12]} and {reformatted.sha256[:12]})\n"
+        f"  original:    ...{context(original_block)}...\n"
+        f"  reformatted: ...{context(reformatted_block)}..."
+    )
+
 def compare_files(original_path, reformatted_path):
-    """Compare two XML files after normalizing."""
-    original_xml = normalize_xml(original_path)
-    reformatted_xml = normalize_xml(reformatted_path)
-    
-    if original_xml is None or reformatted_xml is None:
+    """Compare two XML files by canonical digest."""
+    original = digest_document(original_path)
+    reformatted = digest_document(reformatted_path)
+
+    if original is None or reformatted is None:
         return False, "Failed to parse one or both files"
-    
-    if original_xml == reformatted_xml:
+
+    if original.sha256 == reformatted.sha256:
         return True, None
-    
-    # If different, generate diff
-    diff = difflib.unified_diff(
-        original_xml.splitlines(),
-        reformatted_xml.splitlines(),
-        fromfile=str(original_path),
-        tofile=str(reformatted_path),
-        lineterm=''
-    )
-    return False, '\n'.join(list(diff)[:10])  # Show first 10 lines of diff
+
+    return False, describe_difference(original_path, reformatted_path, original, reformatted)
+
+def _compare_pair(pair):
+    """Pool task: compare_files for an (original, reformatted) pair."""
+    return compare_files(*pair)
 
 def main():
     parser = argparse.ArgumentParser(
@@ -74,7 +110,13 @@ def main():
         '--sample-size',
         type=int,
         default=20,
-        help='Number of files to randomly sample for verification'
+        help='Number of files to randomly sample for verification (0 = all)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Number of worker processes for comparing files (1 = no pool)'
     )
     parser.add_argument(
         '--debug',
@@ -91,12 +133,19 @@ def main():
     original_dir = Path(args.original_dir.rstrip('/*'))  # Remove trailing /* if present
     reformatted_dir = Path(args.reformatted_dir)
     
-    # Get all reformatted files
-    reformatted_files = list(reformatted_dir.glob("*.xml"))
+    # Get all reformatted documents, including compressed files and bundle members
+    reformatted_files = list_documents(reformatted_dir)
+    
+    # Originals by output name; they may be compressed or archive members
+    originals = {document_name(uri): uri for uri in list_documents(original_dir)}
     
     # Randomly select files
-    sample_size = min(args.sample_size, len(reformatted_files))
-    selected_files = random.sample(reformatted_files, sample_size)
+    if args.sample_size > 0:
+        sample_size = min(args.sample_size, len(reformatted_files))
+        selected_files = random.sample(reformatted_files, sample_size)
+    else:
+        sample_size = len(reformatted_files)
+        selected_files = reformatted_files
     
     # Compare each file
     results = {
@@ -106,18 +155,29 @@ def main():
         'errors': 0
     }
     
-    logger.info(f"Comparing {sample_size} randomly selected files...")
+    logger.info(f"Comparing {sample_size} {'randomly selected ' if args.sample_size > 0 else ''}files...")
     
+    pairs = []
     for reformatted_file in selected_files:
-        original_file = original_dir / reformatted_file.name
+        name = document_basename(reformatted_file)
+        original_file = originals.get(name)
         
-        if not original_file.exists():
-            logger.error(f"Original file not found: {original_file}")
+        if original_file is None:
+            logger.error(f"Original file not found: {original_dir / name}")
             results['errors'] += 1
             continue
-        
-        logger.info(f"Comparing {reformatted_file.name}...")
-        identical, diff = compare_files(original_file, reformatted_file)
+        pairs.append((name, original_file, reformatted_file))
+    
+    pool = None
+    if args.workers > 1 and len(pairs) > 1:
+        pool = Pool(processes=args.workers)
+        comparisons = pool.imap(_compare_pair, [pair[1:] for pair in pairs])
+    else:
+        comparisons = (compare_files(original_file, reformatted_file)
+                       for _, original_file, reformatted_file in pairs)
+    
+    for (name, _, _), (identical, diff) in zip(pairs, comparisons):
+        logger.info(f"Comparing {name}...")
         
         if identical:
             logger.info("✓ Files are identical")
@@ -128,6 +188,10 @@ def main():
                 logger.error(diff)
             results['differences'] += 1
     
+    if pool is not None:
+        pool.close()
+        pool.join()
+    
     # Print summary
     logger.info("\nVerification Summary:")
     logger.info(f"Total files checked: {results['total']}")
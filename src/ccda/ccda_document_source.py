@@ -0,0 +1,261 @@
+"""
+CCDA Document Sources
+
+One input layer for every stage, so CCDA drops are read where they land
+instead of being extracted first. An input directory may hold:
+- plain .xml files
+- single compressed documents: .xml.gz, and .xml.zst (needs zstandard)
+- zip archives, including IHE XDM packages, and tar archives (.tar, .tar.gz,
+  .tgz, .tar.bz2, .tar.xz) whose .xml members, compressed or not, are documents
+
+Every document has a stable URI, which is what analysis.json, checkpoints and
+fingerprints record:
+- a file's own path, as before (input/ccda/a.xml, input/ccda/b.xml.gz)
+- <archive path>!/<member name> for archive members
+  (input/ccda/drop.zip!/IHE_XDM/SUBSET01/DOC0001.XML)
+
+Documents are streamed, never extracted: open_document() gives lxml the path
+of a plain file (parsed natively) and a decompressing stream otherwise. XDM
+METADATA.XML submission sets are not documents and are skipped. Archives are
+opened once per process and their member tables cached.
+
+Members of a compressed tar archive can only be reached by decompressing the
+archive up to them. Reading them in listed order is cheap, jumping back is
+not, so zip or plain tar suits parallel runs better.
+
+Extensions are matched case-insensitively, so DOC.XML is a document too.
+Documents that map to the same output name (a.xml next to a.xml.gz) are
+reported when listed.
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+import tarfile
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Separates an archive's path from a member name in a document URI
+ARCHIVE_SEPARATOR = '!/'
+
+ZIP_SUFFIXES = ('.zip',)
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+COMPRESSED_SUFFIXES = ('.gz', '.zst')
+
+# XDM submission set metadata (ebXML, not CDA)
+XDM_METADATA = 'METADATA.XML'
+
+# Archives kept open per process
+MAX_OPEN_ARCHIVES = 16
+
+class DocumentStat(NamedTuple):
+    """Size and mtime of a document, as recorded in fingerprints."""
+    st_size: int
+    st_mtime_ns: int
+
+def _strip_compression(name: str) -> str:
+    for suffix in COMPRESSED_SUFFIXES:
+        if name.lower().endswith('.xml' + suffix):
+            return name[:-len(suffix)]
+    return name
+
+def _archive_kind(name: str) -> Optional[str]:
+    lower = name.lower()
+    if lower.endswith(ZIP_SUFFIXES):
+        return 'zip'
+    if lower.endswith(TAR_SUFFIXES):
+        return 'tar'
+    return None
+
+def _is_document(name: str) -> bool:
+    return _strip_compression(name).lower().endswith('.xml')
+
+def _is_member_document(member: str) -> bool:
+    name = member.rsplit('/', 1)[-1]
+    return _is_document(name) and _strip_compression(name).upper() != XDM_METADATA
+
+def split_uri(uri: str) -> Tuple[str, Optional[str]]:
+    """(file path, archive member name or None) of a document URI."""
+    start = uri.find(ARCHIVE_SEPARATOR)
+    while start != -1:
+        if _archive_kind(uri[:start]):
+            return uri[:start], uri[start + len(ARCHIVE_SEPARATOR):]
+        start = uri.find(ARCHIVE_SEPARATOR, start + 1)
+    return uri, None
+
+class _Archive:
+    """An open archive and its document members."""
+
+    __slots__ = ('kind', 'handle', 'members', 'mtime_ns', 'size')
+
+    def __init__(self, path: str):
+        stat = os.stat(path)
+        self.mtime_ns = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.kind = _archive_kind(path)
+        if self.kind == 'zip':
+            self.handle = zipfile.ZipFile(path)
+            members = self.handle.infolist()
+            self.members = {info.filename: info for info in members
+                            if not info.is_dir() and _is_member_document(info.filename)}
+        else:
+            self.handle = tarfile.open(path, 'r:*')
+            self.members = {info.name: info for info in self.handle.getmembers()
+                            if info.isfile() and _is_member_document(info.name)}
+
+    def member_size(self, member: str) -> int:
+        info = self.members[member]
+        return info.file_size if self.kind == 'zip' else info.size
+
+    def open(self, member: str) -> BinaryIO:
+        if self.kind == 'zip':
+            return self.handle.open(self.members[member])
+        return self.handle.extractfile(self.members[member])
+
+# (pid, path) -> open archive; forked workers open their own handles
+_archives: Dict[Tuple[int, str], _Archive] = {}
+
+def _archive(path: str) -> _Archive:
+    pid = os.getpid()
+    key = (pid, path)
+    archive = _archives.get(key)
+    if archive is not None:
+        stat = os.stat(path)
+        if stat.st_mtime_ns == archive.mtime_ns and stat.st_size == archive.size:
+            return archive
+        # Replaced since it was opened
+        archive.handle.close()
+        del _archives[key]
+    if len(_archives) >= MAX_OPEN_ARCHIVES:
+        for other_key in list(_archives):
+            if other_key[0] != pid:
+                # Inherited from the parent across fork: its file offsets are
+                # shared with the parent, so never use it; dropping it only
+                # closes this process's copy of the descriptor
+                del _archives[other_key]
+    if len(_archives) >= MAX_OPEN_ARCHIVES:
+        for other_key in list(_archives):
+            _archives.pop(other_key).handle.close()
+    archive = _archives[key] = _Archive(path)
+    return archive
+
+def _zstd_reader(raw: BinaryIO) -> BinaryIO:
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstandard is required to read .zst documents (pip install zstandard)")
+    return zstandard.ZstdDecompressor().stream_reader(raw, closefd=False)
+
+def list_documents(input_dir: str) -> List[str]:
+    """Sorted URIs of the documents in a directory and in its archives."""
+    uris = []
+    for path in Path(input_dir).iterdir():
+        if not path.is_file():
+            continue
+        if _archive_kind(path.name):
+            uris.extend(f'{path}{ARCHIVE_SEPARATOR}{member}' for member in _archive(str(path)).members)
+        elif _is_document(path.name):
+            uris.append(str(path))
+    uris.sort()
+    _warn_name_collisions(uris)
+    return uris
+
+def _warn_name_collisions(uris: List[str]) -> None:
+    """Warn about documents whose outputs would overwrite each other's."""
+    owners: Dict[str, str] = {}
+    for uri in uris:
+        name = document_name(uri)
+        if name in owners:
+            logger.warning(f"{owners[name]} and {uri} both write outputs named {name}; "
+                           f"the later one overwrites the earlier")
+        else:
+            owners[name] = uri
+
+@contextmanager
+def open_stream(uri: str) -> Iterator[BinaryIO]:
+    """Binary stream of a document's (decompressed) XML."""
+    path, member = split_uri(uri)
+    raw = open(path, 'rb') if member is None else _archive(path).open(member)
+    name = (member or path).lower()
+    try:
+        if name.endswith('.gz'):
+            with gzip.GzipFile(fileobj=raw) as stream:
+                yield stream
+        elif name.endswith('.zst'):
+            with _zstd_reader(raw) as stream:
+                yield stream
+        else:
+            yield raw
+    finally:
+        raw.close()
+
+@contextmanager
+def open_document(uri: str) -> Iterator[Union[str, BinaryIO]]:
+    """
+    What lxml should parse for a document: the path of a plain XML file,
+    which libxml2 reads natively, otherwise a stream of its XML.
+    """
+    path, member = split_uri(uri)
+    if member is None and not path.lower().endswith(COMPRESSED_SUFFIXES):
+        yield path
+    else:
+        with open_stream(uri) as stream:
+            yield stream
+
+def document_stat(uri: str) -> DocumentStat:
+    """
+    Size and mtime of a document: those of its file, or for an archive
+    member its uncompressed size and the archive's mtime.
+    """
+    path, member = split_uri(uri)
+    if member is None:
+        stat = os.stat(path)
+        return DocumentStat(stat.st_size, stat.st_mtime_ns)
+    archive = _archive(path)
+    return DocumentStat(archive.member_size(member), archive.mtime_ns)
+
+def document_digest(uri: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    SHA-256 hex digest of a document's XML. For a plain file it equals
+    file_digest(), and a compressed copy of a document has the same digest.
+    """
+    digest = hashlib.sha256()
+    with open_stream(uri) as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def document_name(uri: str) -> str:
+    """
+    File name for a document's outputs: a plain file keeps its name, a
+    compressed one loses its compression suffix and an archive member is
+    prefixed with the archive's name (XDM members are named DOC0001.XML in
+    every submission set) and gets a lowercase .xml extension.
+    """
+    path, member = split_uri(uri)
+    if member is None:
+        return _strip_compression(os.path.basename(path))
+
+    archive = os.path.basename(path)
+    for suffix in ZIP_SUFFIXES + TAR_SUFFIXES:
+        if archive.lower().endswith(suffix):
+            archive = archive[:-len(suffix)]
+            break
+    name = f"{archive}__{_strip_compression(member).replace('/', '__')}"
+    if name.endswith('.XML'):
+        name = name[:-4] + '.xml'
+    return name
+
+def document_basename(uri: str) -> str:
+    """
+    A document's own file name without compression suffix: the member's
+    name for an archive member. Outputs bundled by the reformatter are
+    members named after their document's document_name().
+    """
+    path, member = split_uri(uri)
+    return _strip_compression((member or path).rsplit('/', 1)[-1])
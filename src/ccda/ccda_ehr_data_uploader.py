@@ -25,6 +25,9 @@ from botocore.exceptions import ClientError
 from tqdm import tqdm
 import sys
 
+from ccda_document_source import document_name, open_stream, split_uri
+from ccda_score_index import top_n_with_count
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -103,17 +106,19 @@ class EHRDataUploader:
         )
 
     def upload_to_s3(self, file_path: str, s3_key: str) -> bool:
-        """Upload a file to S3.
+        """Upload a document's XML to S3.
         
         Args:
-            file_path: Local path to the file
+            file_path: Document URI (a local path or an archive member,
+                see ccda_document_source); compressed documents are
+                uploaded decompressed
             s3_key: S3 object key for the upload
             
         Returns:
             bool: True if upload was successful, False otherwise
         """
         # Ensure the file exists
-        if not os.path.exists(file_path):
+        if not os.path.exists(split_uri(file_path)[0]):
             logger.error(f"File not found: {file_path}")
             self.failed_uploads += 1
             return False
@@ -122,7 +127,8 @@ class EHRDataUploader:
             # Add folder to s3_key
             full_s3_key = f"{self.s3_folder}{s3_key}"
             
-            self.s3.upload_file(file_path, self.s3_bucket, full_s3_key)
+            with open_stream(file_path) as f:
+                self.s3.upload_fileobj(f, self.s3_bucket, full_s3_key)
             logger.info(f"Successfully uploaded to s3://{self.s3_bucket}/{full_s3_key}")
             self.successful_uploads += 1
             return True
@@ -149,23 +155,12 @@ class EHRDataUploader:
             raise ValueError(f"Analysis file not found: {analysis_file}")
             
         try:
-            with open(analysis_file, 'r') as f:
-                analysis_data = json.load(f)
+            # Take top N files by total_score from the score index
+            top_files, total_files = top_n_with_count(analysis_file, self.top_n)
         except json.JSONDecodeError as e:
             raise ValueError(f"Invalid JSON in analysis file: {str(e)}")
         except Exception as e:
             raise ValueError(f"Error reading analysis file: {str(e)}")
-
-        # Sort files by total_score in descending order
-        sorted_files = sorted(
-            analysis_data.items(),
-            key=lambda x: x[1].get('total_score', 0),
-            reverse=True
-        )
-
-        # Take top N files
-        top_files = sorted_files[:self.top_n]
-        total_files = len(sorted_files)
         
         if not top_files:
             logger.warning("No files to process")
@@ -178,7 +173,7 @@ class EHRDataUploader:
             self.processed_files += 1
             
             # Generate S3 key from file path
-            s3_key = Path(file_path).name
+            s3_key = document_name(file_path)
             
             # Upload to S3 (no need to catch exceptions here as they're handled in upload_to_s3)
             self.upload_to_s3(file_path, s3_key)
@@ -0,0 +1,83 @@
+"""
+CCDA File Fingerprints
+
+Content fingerprints for incremental analysis runs.
+
+Each analyzed file is recorded with its size, mtime and SHA-256 content hash
+in an append-only TSV (size, mtime_ns, sha256, path; the last line for a path
+wins). On the next run:
+- A file whose path, size and mtime match its record is unchanged and is not
+  even read.
+- Any other file is hashed. If the hash is already known (a moved, copied or
+  touched file), its cached metrics are reused; otherwise it is re-analyzed.
+"""
+
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (size, mtime_ns, sha256 hex digest)
+Fingerprint = Tuple[int, int, str]
+
+def file_digest(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Return the SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class FileFingerprints:
+    """Append-only path -> (size, mtime, content hash) records."""
+
+    def __init__(self, checkpoint_dir: str, name: str = 'file_fingerprints'):
+        self.fingerprint_file = Path(checkpoint_dir) / f'{name}.tsv'
+        self.by_path: Dict[str, Fingerprint] = {}
+        self.by_hash: Dict[str, str] = {}
+
+        if self.fingerprint_file.exists():
+            with open(self.fingerprint_file, encoding='utf-8') as f:
+                for line in f:
+                    parts = line.rstrip('\n').split('\t', 3)
+                    if len(parts) != 4:
+                        # Partial line from an interrupted write
+                        continue
+                    self._set(parts[3], (int(parts[0]), int(parts[1]), parts[2]))
+            logger.info(f"Loaded fingerprints for {len(self.by_path)} files")
+
+    def _set(self, file_path: str, fingerprint: Fingerprint):
+        self.by_path[file_path] = fingerprint
+        self.by_hash[fingerprint[2]] = file_path
+
+    def is_unchanged(self, file_path: str, stat: os.stat_result) -> bool:
+        """Fast pre-check: same path, size and mtime as the recorded file."""
+        fingerprint = self.by_path.get(file_path)
+        return (fingerprint is not None
+                and fingerprint[0] == stat.st_size
+                and fingerprint[1] == stat.st_mtime_ns)
+
+    def has_digest(self, digest: str) -> bool:
+        """Whether any recorded file had this content, now or before."""
+        return digest in self.by_hash
+
+    def path_for_digest(self, digest: str) -> Optional[str]:
+        """Return a recorded path whose current content has this digest."""
+        file_path = self.by_hash.get(digest)
+        if file_path is not None and self.by_path[file_path][2] == digest:
+            return file_path
+        return None
+
+    def record(self, fingerprints: Dict[str, Fingerprint]):
+        """Append fingerprints for files whose metrics are checkpointed."""
+        if not fingerprints:
+            return
+        with open(self.fingerprint_file, 'a', encoding='utf-8') as f:
+            for file_path, (size, mtime_ns, digest) in fingerprints.items():
+                f.write(f"{size}\t{mtime_ns}\t{digest}\t{file_path}\n")
+                self._set(file_path, (size, mtime_ns, digest))
+            f.flush()
+            os.fsync(f.fileno())
@@ -19,13 +19,26 @@ import logging
 import gc
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Set, Tuple, Generator
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Generator
 import xml.etree.ElementTree as ET
-from collections import defaultdict
+from collections import deque
+from itertools import islice
+from contextlib import nullcontext
 import argparse
+from multiprocessing import Pool
+import numpy as np
 from lxml import etree
 from tqdm import tqdm
 
+from ccda_analysis_results import FileMetrics
+from ccda_checkpoint_store import CheckpointStore
+from ccda_document_source import document_digest, document_stat, list_documents, open_document
+from ccda_file_fingerprints import FileFingerprints
+from ccda_memory_governor import MemoryGovernor
+from ccda_score_index import write_score_index
+from ccda_text_stats import TextStats, clear_token_cache
+from ccda_xml_core import SECTION_TAG, TEMPLATE_ID_TAG, ENTRY_TAG, TEXT_TAG
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -33,22 +46,38 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# CCDA namespace
-CCDA_NS = {
-    'h': 'urn:hl7-org:v3',
-    'xsi': 'http://www.w3.org/2001/XMLSchema-instance'
+# Narrative size measures the config can score by (its "text_measure" key):
+# section_details key and the rich / moderate / some narrative thresholds.
+# Token thresholds are the word thresholds at about 1.3 tokens per word.
+TEXT_MEASURES = {
+    'words': ('word_count', (800, 300, 50)),
+    'tokens': ('token_count', (1000, 400, 65)),
 }
 
+# Records rescored per vectorized pass
+RESCORE_CHUNK_SIZE = 10000
+
+class _SectionCounts:
+    """Counts attributed to one open section while a document is walked."""
+    
+    __slots__ = ('section_id', 'entries', 'coded_elements', 'text')
+    
+    def __init__(self):
+        self.section_id = None
+        self.entries = 0
+        self.coded_elements = 0
+        self.text = TextStats()
+
 class CCDAAnalyzer:
     """Analyzes CCDA XML files for information richness."""
     
-    def __init__(self, checkpoint_dir: str = 'output/temp/analysis_checkpoints',
-                 config_file: str = 'output/analysis/metrics/ccda_config.json'):
-        self.checkpoint_dir = Path(checkpoint_dir)
-        self.checkpoint_dir.mkdir(exist_ok=True, parents=True)
-        self.results = {}
-        self.current_batch = 0
+    def __init__(self, checkpoint_dir: Optional[str] = 'output/temp/analysis_checkpoints',
+                 config_file: str = 'output/analysis/metrics/ccda_config.json',
+                 incremental: bool = False):
+        self.config_file = config_file
         self.processed_files = set()
+        self.fingerprints = None
+        self.pending_fingerprints = {}
         
         # Load section configuration
         try:
@@ -58,101 +87,365 @@ class CCDAAnalyzer:
         except Exception as e:
             logger.error(f"Error loading config file {config_file}: {str(e)}")
             self.config = {"sections": {}}
+        self.text_measure, self.text_thresholds = TEXT_MEASURES[self.config.get("text_measure", "words")]
         
-        self.load_checkpoints()
+        # Pool workers only score files; the parent owns the checkpoints
+        self.checkpoint_dir = None
+        self.store = None
+        if checkpoint_dir is not None:
+            self.checkpoint_dir = Path(checkpoint_dir)
+            self.checkpoint_dir.mkdir(exist_ok=True, parents=True)
+            self.load_checkpoints()
+            
+            # Incremental runs key reuse on content hashes, not paths
+            if incremental:
+                self.fingerprints = FileFingerprints(self.checkpoint_dir)
     
     def load_checkpoints(self):
-        """Load any existing checkpoint files."""
-        checkpoint_files = list(self.checkpoint_dir.glob('analysis_batch_*.json'))
-        if checkpoint_files:
-            logger.info(f"Found {len(checkpoint_files)} checkpoint files")
-            for cp_file in checkpoint_files:
+        """Open the checkpoint store and index the files it already covers."""
+        self.store = CheckpointStore(self.checkpoint_dir)
+        
+        # Import batch files written by older versions of the analyzer
+        legacy_files = sorted(self.checkpoint_dir.glob('analysis_batch_*.json'))
+        if legacy_files:
+            logger.info(f"Importing {len(legacy_files)} legacy checkpoint files")
+            for cp_file in legacy_files:
                 with open(cp_file) as f:
                     batch_results = json.load(f)
-                self.results.update(batch_results)
-                self.processed_files.update(batch_results.keys())
-            self.current_batch = len(checkpoint_files)
-            logger.info(f"Loaded {len(self.results)} analyzed files from checkpoints")
+                self.store.append({
+                    file_path: metrics for file_path, metrics in batch_results.items()
+                    if file_path not in self.store
+                })
+                cp_file.rename(cp_file.with_name(cp_file.name + '.imported'))
+        
+        # Live view of the store index, so resume never loads the metrics
+        self.processed_files = self.store.keys()
+        if self.processed_files:
+            logger.info(f"Loaded {len(self.processed_files)} analyzed files from checkpoints")
     
-    def save_checkpoint(self, batch_results: Dict, batch_num: int):
-        """Save analysis results for the current batch."""
-        checkpoint_file = self.checkpoint_dir / f'analysis_batch_{batch_num}.json'
-        with open(checkpoint_file, 'w') as f:
-            json.dump(batch_results, f, indent=2)
+    def save_checkpoint(self, batch_results: Dict[str, FileMetrics], batch_num: int):
+        """Append analysis results for the current batch to the checkpoint store."""
+        self.store.append({
+            file_path: metrics.to_json() for file_path, metrics in batch_results.items()
+        })
+        
+        # Fingerprints go in only once their metrics are checkpointed
+        if self.fingerprints is not None:
+            self.fingerprints.record({
+                file_path: self.pending_fingerprints.pop(file_path)
+                for file_path in batch_results
+                if file_path in self.pending_fingerprints
+            })
         logger.debug(f"Saved checkpoint {batch_num} with {len(batch_results)} files")
     
-    def merge_checkpoints(self, output_file: str):
-        """Merge all checkpoint files into final results file."""
+    def merge_checkpoints(self, output_file: str, file_keys: Optional[Set[str]] = None):
+        """
+        Write checkpointed results to the final results file, ranked by score.
+        If file_keys is given, only those files are written.
+        """
         logger.info("Merging checkpoint files...")
-        
-        # Sort results by score
-        sorted_results = dict(sorted(
-            self.results.items(),
-            key=lambda x: x[1].get('total_score', 0),
-            reverse=True
-        ))
-        
-        # Save merged results
+        self.write_results(output_file, self.store.iter_ranked(file_keys))
+    
+    def write_results(self, output_file: str, ranked_results: Iterable[Tuple[str, Dict]]) -> int:
+        """
+        Write (file path, metrics) pairs, already in score order, to the
+        results file along with its score index. Returns the number of
+        files written.
+        """
+        # Stream records, matching json.dump(..., indent=2)
+        top_files = []
+        ranked = []
         with open(output_file, 'w') as f:
-            json.dump(sorted_results, f, indent=2)
+            f.write('{')
+            for i, (file_path, metrics) in enumerate(ranked_results):
+                body = json.dumps(metrics, indent=2).replace('\n', '\n  ')
+                f.write(f'{"," if i else ""}\n  {json.dumps(file_path)}: {body}')
+                ranked.append((file_path, metrics.get('total_score', 0)))
+                if i < 10:
+                    top_files.append((file_path, metrics))
+            f.write('\n}' if top_files else '}')
+        
+        # Score-ordered index lets top-N consumers skip loading analysis.json
+        write_score_index(output_file, ranked)
         
         logger.info(f"Analysis results saved to {output_file}")
         
         # Print summary of top files
         logger.info("\nTop 10 Most Information-Rich Files:")
-        for i, (file_path, metrics) in enumerate(list(sorted_results.items())[:10], 1):
+        for i, (file_path, metrics) in enumerate(top_files, 1):
             logger.info(f"{i}. {file_path}")
             logger.info(f"   Score: {metrics['total_score']:.2f}")
             logger.info(f"   Unique Sections: {metrics['unique_sections']}")
+        return len(ranked)
+    
+    def rescore(self, output_file: str, input_dir: Optional[str] = None):
+        """
+        Recompute every score from stored section_details with the current
+        config, without reparsing any XML, and rewrite the ranking.
+        
+        Metrics come from the checkpoint store when it has any, otherwise
+        from the existing output_file. The store is streamed and rewritten
+        RESCORE_CHUNK_SIZE records at a time, so later merges keep the new
+        scores without the metrics ever being loaded at once. The store
+        keeps files that have since moved or been deleted; if input_dir is
+        given, only documents currently in it are written to output_file.
+        
+        Raises ValueError if input_dir does not exist or the stored metrics
+        lack the config's text measure (checkpoints written before it
+        existed).
+        """
+        if self.store is not None and len(self.store):
+            current_files = None
+            if input_dir is not None:
+                if not os.path.isdir(input_dir):
+                    raise ValueError(f"Input directory {input_dir} not found")
+                current_files = set(list_documents(input_dir))
+            
+            logger.info(f"Rescoring {len(self.store)} files from checkpoints")
+            self.store.rewrite(self._rescore_chunks(self.store.iter_records()))
+            written = self.write_results(output_file, self.store.iter_ranked(current_files))
+            if current_files is not None and not written:
+                logger.warning(f"None of the {len(self.store)} checkpointed files are in {input_dir}; "
+                               f"{output_file} is empty")
+        else:
+            logger.info(f"Rescoring files from {output_file}")
+            with open(output_file) as f:
+                records = list(self._rescore_chunks(json.load(f).items()))
+            records.sort(key=lambda x: x[1].get('total_score', 0), reverse=True)
+            self.write_results(output_file, records)
+    
+    def _rescore_chunks(self, records: Iterable[Tuple[str, Dict]]) -> Iterator[Tuple[str, Dict]]:
+        """Rescore (file path, metrics) records a chunk at a time, in order."""
+        records = iter(records)
+        while True:
+            chunk = list(islice(records, RESCORE_CHUNK_SIZE))
+            if not chunk:
+                return
+            self._rescore_chunk(chunk)
+            yield from chunk
+    
+    def _rescore_chunk(self, records: List[Tuple[str, Dict]]):
+        """
+        Recompute the scores of a list of records in place. All section
+        scores are computed in one vectorized pass with the same thresholds,
+        weights and bonus as calculate_section_score.
+        """
+        # Flatten every (file, section) pair into columns
+        section_weights = {}
+        weights, entries, coded, text_sizes = [], [], [], []
+        for file_path, metrics in records:
+            for section_id, details in metrics.get('section_details', {}).items():
+                if self.text_measure not in details:
+                    raise ValueError(
+                        f"Stored metrics for {file_path} have no {self.text_measure}, which "
+                        f"text_measure '{self.config.get('text_measure', 'words')}' scores by; "
+                        f"re-run the analysis without --rescore to collect it"
+                    )
+                weight = section_weights.get(section_id)
+                if weight is None:
+                    section_config = self.config.get("sections", {}).get(section_id, {})
+                    weight = section_weights[section_id] = section_config.get("weight", 0.2)
+                weights.append(weight)
+                entries.append(details['entries'])
+                coded.append(details['coded_elements'])
+                text_sizes.append(details[self.text_measure])
+        
+        weights = np.array(weights, dtype=np.float64)
+        entries = np.array(entries, dtype=np.float64)
+        coded = np.array(coded, dtype=np.float64)
+        text_sizes = np.array(text_sizes, dtype=np.float64)
+        
+        # Same arithmetic, in the same order, as calculate_section_score;
+        # rounding and totals stay in Python, as np.round rounds halfway
+        # cases differently from round()
+        rich, moderate, some = self.text_thresholds
+        text_score = np.select(
+            [text_sizes > rich, text_sizes > moderate, text_sizes > some],
+            [0.5, 0.3, 0.1],
+            default=text_sizes * 0.001
+        )
+        scores = (entries * 0.3 + coded * 0.2 + text_score) * weights
+        scores = np.where((text_sizes > moderate) & (coded > 15), scores * 1.2, scores)
+        scores = [round(score, 3) for score in scores.tolist()]
+        
+        # Write the new scores back into the records
+        position = 0
+        for _, metrics in records:
+            section_ids = list(metrics.get('section_details', {}))
+            section_scores = scores[position:position + len(section_ids)]
+            position += len(section_ids)
+            metrics['section_scores'] = dict(zip(section_ids, section_scores))
+            if metrics.get('error'):
+                metrics['total_score'] = 0.0
+            elif section_ids:
+                metrics['total_score'] = sum(section_scores)
+            else:
+                metrics['total_score'] = 0
+    
+    def plan_incremental(self, xml_files: List[str]) -> List[str]:
+        """
+        Decide which files need analysis in incremental mode.
+        Files with the same path, size and mtime as last time are skipped
+        without being read. Other files are hashed: known content (moved,
+        copied or touched files) reuses the cached metrics under the current
+        path, and only new or changed content is returned for analysis.
+        """
+        pending_files = []
+        reused = {}
+        reused_fingerprints = {}
+        unchanged = 0
+        reused_count = 0
+        
+        for file_path in tqdm(xml_files, desc="Checking fingerprints"):
+            stat = document_stat(file_path)
+            if file_path in self.store:
+                if self.fingerprints.is_unchanged(file_path, stat):
+                    unchanged += 1
+                    continue
+            
+            digest = document_digest(file_path)
+            fingerprint = (stat.st_size, stat.st_mtime_ns, digest)
+            
+            if file_path in self.store and file_path not in self.fingerprints.by_path:
+                # Checkpointed before incremental mode was used; adopt it as is
+                reused_fingerprints[file_path] = fingerprint
+                unchanged += 1
+                continue
+            
+            cached_path = self.fingerprints.path_for_digest(digest)
+            if cached_path is not None and cached_path in self.store:
+                if cached_path != file_path:
+                    reused[file_path] = self.store.get(cached_path)
+                reused_fingerprints[file_path] = fingerprint
+                reused_count += 1
+            else:
+                self.pending_fingerprints[file_path] = fingerprint
+                pending_files.append(file_path)
+            
+            # Write reused records in chunks to keep memory flat on moved corpora
+            if len(reused) >= 1000:
+                self.store.append(reused)
+                reused = {}
+        
+        self.store.append(reused)
+        self.fingerprints.record(reused_fingerprints)
+        
+        logger.info(
+            f"Incremental check: {unchanged} unchanged, {reused_count} reused by content hash, "
+            f"{len(pending_files)} new or changed"
+        )
+        return pending_files
+    
+    def iter_section_metrics(self, source) -> Iterator[Tuple[Optional[str], Dict]]:
+        """
+        Stream (section templateId, details) for every section of a document,
+        in the order the sections close.
+        
+        The document is walked once with start/end events and a stack of open
+        sections. Each element's entry, coded element and narrative text counts
+        go to its innermost enclosing section only, so a parent section neither
+        re-counts its subsections nor loses content when they are released.
+        
+        source is a file path or stream (parsed incrementally, sections released as they
+        close) or an already parsed root element (walked in place, left intact).
+        """
+        if isinstance(source, etree._Element):
+            events = etree.iterwalk(source, events=('start', 'end'))
+            release = False
+        else:
+            events = etree.iterparse(source, events=('start', 'end'))
+            release = True
+        
+        open_sections = []
+        text_depth = 0
+        
+        for event, elem in events:
+            tag = elem.tag
+            
+            if event == 'start':
+                if open_sections:
+                    current = open_sections[-1]
+                    if tag == ENTRY_TAG:
+                        current.entries += 1
+                    elif tag == TEMPLATE_ID_TAG:
+                        if current.section_id is None:
+                            current.section_id = elem.get('root')
+                    elif tag == TEXT_TAG:
+                        text_depth += 1
+                    
+                    if elem.get('code') is not None:
+                        current.coded_elements += 1
+                
+                if tag == SECTION_TAG:
+                    open_sections.append(_SectionCounts())
+                continue
+            
+            if text_depth:
+                # Narrative text is complete at end: own text plus child tails
+                text = open_sections[-1].text
+                if elem.text:
+                    text.add(elem.text)
+                for child in elem:
+                    if child.tail:
+                        text.add(child.tail)
+                if tag == TEXT_TAG:
+                    text_depth -= 1
+            
+            if tag == SECTION_TAG:
+                counts = open_sections.pop()
+                yield counts.section_id, {
+                    'word_count': counts.text.words,
+                    'char_count': counts.text.chars,
+                    'token_count': counts.text.tokens,
+                    'coded_elements': counts.coded_elements,
+                    'entries': counts.entries
+                }
+                
+                # Everything in the section is counted; release it
+                if release:
+                    elem.clear()
+                    while elem.getprevious() is not None:
+                        del elem.getparent()[0]
     
-    def calculate_section_score(self, section_elem: etree._Element) -> float:
+    def calculate_section_score(self, section_id: str, section_details: Dict) -> float:
         """
         Calculate a score for a single section using configuration weights.
         Prioritizes sections with high value for ML/LLM training.
         """
         try:
-            score = 0.0
-            
-            # Get section template ID
-            template_ids = section_elem.xpath('.//h:templateId/@root', namespaces=CCDA_NS)
-            if not template_ids:
-                return 0.0
-                
-            section_id = template_ids[0]
             section_config = self.config.get("sections", {}).get(section_id, {})
             
             # Base weight from configuration (default: 0.2 if not found)
             base_weight = section_config.get("weight", 0.2)
             
             # Count entries
-            entries = section_elem.xpath('.//h:entry', namespaces=CCDA_NS)
-            entry_score = len(entries) * 0.3  # Reduced from 0.5
+            entry_score = section_details['entries'] * 0.3  # Reduced from 0.5
             
             # Check for coded elements
-            coded_elements = section_elem.xpath('.//*[@code]', namespaces=CCDA_NS)
-            coded_score = len(coded_elements) * 0.2  # Reduced from 0.3
+            coded_elements = section_details['coded_elements']
+            coded_score = coded_elements * 0.2  # Reduced from 0.3
             
-            # Analyze text content (more weight for narrative content)
-            text_elements = section_elem.xpath('.//h:text//text()', namespaces=CCDA_NS)
-            text_content = ' '.join(text for text in text_elements if text.strip())
-            word_count = len(text_content.split())
+            # Analyze text content (more weight for narrative content),
+            # in words or tokens as the config's text_measure selects
+            text_size = section_details.get(self.text_measure, 0)
+            rich, moderate, some = self.text_thresholds
             
             # Text length bonus based on thresholds
-            if word_count > 800:
+            if text_size > rich:
                 text_score = 0.5  # Increased weight for rich narrative
-            elif word_count > 300:
+            elif text_size > moderate:
                 text_score = 0.3
-            elif word_count > 50:
+            elif text_size > some:
                 text_score = 0.1
             else:
-                text_score = word_count * 0.001
+                text_score = text_size * 0.001
             
             # Combined score using section weight
             raw_score = (entry_score + coded_score + text_score)
             final_score = raw_score * base_weight
             
             # Bonus for sections with both narrative and structured data
-            if word_count > 300 and len(coded_elements) > 15:
+            if text_size > moderate and coded_elements > 15:
                 final_score *= 1.2  # 20% bonus
             
             return round(final_score, 3)
@@ -161,62 +454,40 @@ class CCDAAnalyzer:
             logger.error(f"Error calculating section score: {str(e)}")
             return 0.0
     
-    def analyze_file(self, file_path: str) -> Dict:
-        """Analyze a single CCDA XML file."""
+    def analyze_file(self, file_path: str, root: Optional[etree._Element] = None) -> FileMetrics:
+        """
+        Analyze a single CCDA XML file. If root is given, the already parsed
+        document is scored instead of parsing file_path again.
+        """
+        metrics = FileMetrics()
         try:
-            metrics = {
-                'file_size': os.path.getsize(file_path),
-                'section_scores': defaultdict(float),
-                'section_details': defaultdict(dict),  # New: store detailed metrics
-                'total_score': 0.0,
-                'unique_sections': 0,
-                'error': None
-            }
-            
-            # Use iterparse for memory efficiency
-            context = etree.iterparse(file_path, events=('end',), tag='{urn:hl7-org:v3}section')
-            
-            for event, elem in context:
-                if elem.tag.endswith('section'):
-                    template_ids = elem.xpath('.//h:templateId/@root', namespaces=CCDA_NS)
-                    if template_ids:
-                        section_id = template_ids[0]
-                        section_score = self.calculate_section_score(elem)
-                        metrics['section_scores'][section_id] = section_score
-                        
-                        # Store detailed metrics for analysis
-                        text_elements = elem.xpath('.//h:text//text()', namespaces=CCDA_NS)
-                        text_content = ' '.join(text for text in text_elements if text.strip())
-                        metrics['section_details'][section_id] = {
-                            'word_count': len(text_content.split()),
-                            'coded_elements': len(elem.xpath('.//*[@code]', namespaces=CCDA_NS)),
-                            'entries': len(elem.xpath('.//h:entry', namespaces=CCDA_NS))
-                        }
-                
-                # Clear element to free memory
-                elem.clear()
-                while elem.getprevious() is not None:
-                    del elem.getparent()[0]
+            metrics.file_size = document_stat(file_path).st_size
             
-            # Calculate final metrics
-            metrics['unique_sections'] = len(metrics['section_scores'])
-            metrics['total_score'] = sum(metrics['section_scores'].values())
+            # Stream sections with iterparse for memory efficiency
+            with open_document(file_path) if root is None else nullcontext(root) as source:
+                for section_id, section_details in self.iter_section_metrics(source):
+                    if section_id is not None:
+                        metrics.add_section(
+                            section_id,
+                            self.calculate_section_score(section_id, section_details),
+                            section_details
+                        )
             
             return metrics
             
         except Exception as e:
             logger.error(f"Error processing {file_path}: {str(e)}")
-            metrics['error'] = str(e)
+            metrics.error = str(e)
             return metrics
     
-    def process_batch(self, files: List[Path], batch_num: int) -> Dict:
-        """Process a batch of files and return their results."""
+    def process_batch(self, files: List[str], batch_num: int) -> Dict:
+        """
+        Process a batch of files and return their results.
+        Callers pass only files that need (re)analysis.
+        """
         batch_results = {}
         
         for xml_file in tqdm(files, desc=f"Batch {batch_num}", leave=False):
-            if str(xml_file) in self.processed_files:
-                continue
-                
             try:
                 metrics = self.analyze_file(str(xml_file))
                 batch_results[str(xml_file)] = metrics
@@ -229,38 +500,108 @@ class CCDAAnalyzer:
                          input_dir: str,
                          output_file: str = 'ccda_analysis.json',
                          batch_size: int = 100,
-                         memory_limit: int = 8000) -> None:
+                         memory_limit: int = 8000,
+                         workers: int = 1) -> None:
         """
-        Analyze all XML files in the input directory with memory-efficient batch processing.
+        Analyze all CCDA documents in the input directory (plain, compressed or
+        in archives, see ccda_document_source) with memory-efficient batch processing.
+        Batch sizes are adapted by a MemoryGovernor to stay within memory_limit (MB).
+        In incremental mode only new or changed files (by content hash) are analyzed.
+        With workers > 1 batches are scored in a process pool, while checkpoints
+        are still written by this process in batch order.
         """
-        input_path = Path(input_dir)
-        xml_files = list(input_path.glob('*.xml'))
+        xml_files = list_documents(input_dir)
         total_files = len(xml_files)
         
-        logger.info(f"Found {total_files} XML files in {input_dir}")
+        logger.info(f"Found {total_files} CCDA documents in {input_dir}")
         logger.info(f"Already processed: {len(self.processed_files)} files")
         
-        # Process files in batches
-        for i in range(0, total_files, batch_size):
-            batch = xml_files[i:i+batch_size]
-            batch_num = self.current_batch + (i // batch_size) + 1
-            
-            # Skip if all files in batch are already processed
-            if all(str(f) in self.processed_files for f in batch):
-                continue
+        # Only files that still have work to do are batched
+        if self.fingerprints is not None:
+            pending_files = self.plan_incremental(xml_files)
+        else:
+            pending_files = [f for f in xml_files if str(f) not in self.processed_files]
+        governor = MemoryGovernor(memory_limit, batch_size)
+        
+        if workers > 1 and pending_files:
+            logger.info(f"Scoring {len(pending_files)} files with {workers} workers")
+            pool = Pool(
+                processes=workers,
+                initializer=_init_worker,
+                initargs=(self.config_file,)
+            )
+            # Batches in submission order; draining from the left keeps checkpoints ordered
+            in_flight = deque()
+            progress = tqdm(total=len(pending_files), desc="Processing files")
             
-            logger.debug(f"Processing batch {batch_num} ({len(batch)} files)")
-            batch_results = self.process_batch(batch, batch_num)
+            def drain_batch():
+                batch_num, async_result = in_flight.popleft()
+                batch_results = async_result.get()
+                self.save_checkpoint(batch_results, batch_num)
+                progress.update(len(batch_results))
             
-            # Update results and save checkpoint
-            self.results.update(batch_results)
-            self.save_checkpoint(batch_results, batch_num)
+            def spill():
+                # Pause intake until in-flight batches are checkpointed
+                while in_flight:
+                    drain_batch()
             
-            # Clear memory
-            gc.collect()
+            try:
+                for batch_num, batch in enumerate(governor.batches(pending_files, spill), 1):
+                    while len(in_flight) >= workers * 2:
+                        drain_batch()
+                    logger.debug(f"Submitting batch {batch_num} ({len(batch)} files)")
+                    in_flight.append((
+                        batch_num,
+                        pool.apply_async(_process_batch_worker, ([str(f) for f in batch],))
+                    ))
+                while in_flight:
+                    drain_batch()
+                pool.close()
+            except BaseException:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+                progress.close()
+        else:
+            # Batches are checkpointed as they finish; under pressure the
+            # memoized token counts are released
+            for batch_num, batch in enumerate(governor.batches(pending_files, clear_token_cache), 1):
+                logger.debug(f"Processing batch {batch_num} ({len(batch)} files)")
+                batch_results = self.process_batch(batch, batch_num)
+                
+                # Results live only in the checkpoint store
+                self.save_checkpoint(batch_results, batch_num)
+                
+                # Clear memory
+                gc.collect()
+        
+        governor.log_summary()
         
-        # Merge all checkpoints into final results
-        self.merge_checkpoints(output_file)
+        # Merge all checkpoints into final results; incremental runs report
+        # the current corpus only, not files that moved or disappeared
+        file_keys = None
+        if self.fingerprints is not None:
+            file_keys = {str(f) for f in xml_files}
+        self.merge_checkpoints(output_file, file_keys)
+
+# Per-process analyzer used by pool workers, created once by _init_worker
+_worker_analyzer = None
+
+def _init_worker(config_file: str):
+    """Load the section configuration once for this worker process."""
+    global _worker_analyzer
+    _worker_analyzer = CCDAAnalyzer(checkpoint_dir=None, config_file=config_file)
+
+def _process_batch_worker(files: List[str]) -> Dict:
+    """Analyze a batch of files inside a pool worker."""
+    batch_results = {}
+    for xml_file in files:
+        try:
+            batch_results[xml_file] = _worker_analyzer.analyze_file(xml_file)
+        except Exception as e:
+            logger.error(f"Error in worker processing {xml_file}: {str(e)}")
+    return batch_results
 
 def main():
     parser = argparse.ArgumentParser(
@@ -268,8 +609,8 @@ def main():
     )
     parser.add_argument(
         '--input-dir',
-        default='input/ccda',
-        help='Directory containing CCDA XML files'
+        help='Directory containing CCDA XML files (default: input/ccda); '
+             'with --rescore, only files found there are written'
     )
     parser.add_argument(
         '--output-file',
@@ -298,6 +639,22 @@ def main():
         default=8000,
         help='Memory limit in MB for processing'
     )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Number of worker processes for scoring files (1 = no pool)'
+    )
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Only analyze new or changed files, matched by content hash'
+    )
+    parser.add_argument(
+        '--rescore',
+        action='store_true',
+        help='Recompute scores from stored section metrics with the current config, without parsing XML'
+    )
     parser.add_argument(
         '--debug',
         action='store_true',
@@ -311,13 +668,23 @@ def main():
     
     analyzer = CCDAAnalyzer(
         checkpoint_dir=args.checkpoint_dir,
-        config_file=args.config_file
+        config_file=args.config_file,
+        incremental=args.incremental
     )
+    if args.rescore:
+        try:
+            analyzer.rescore(args.output_file, args.input_dir)
+        except ValueError as e:
+            logger.error(str(e))
+            sys.exit(1)
+        return
+    
     analyzer.analyze_directory(
-        args.input_dir,
+        args.input_dir or 'input/ccda',
         args.output_file,
         args.batch_size,
-        args.memory_limit
+        args.memory_limit,
+        args.workers
     )
 
 if __name__ == '__main__':
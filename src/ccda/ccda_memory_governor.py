@@ -0,0 +1,162 @@
+"""
+CCDA Memory Governor
+
+Shared memory control for the batch stages that hold state across files
+(information analyzer, section analyzer). The reformatter streams each
+document on its own and does not need it.
+
+The governor measures the RSS of the current process and its worker
+processes before every batch and adapts to what it sees:
+- Above the high watermark it halves the batch size, runs garbage collection
+  and asks the stage to spill in-memory state to disk.
+- Still above the limit with worker processes running, it pauses intake and
+  re-checks while memory keeps dropping, so in-flight work can finish and be
+  released, instead of stopping the run.
+- Well below the limit it grows the batch size again, up to a maximum.
+
+Every decision is logged so a run can be tuned after the fact.
+"""
+
+import gc
+import logging
+import os
+import time
+from typing import Callable, Iterator, List, Optional, Sequence
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+class MemoryGovernor:
+    """Adapts batch sizes to keep a batch stage within its memory budget."""
+
+    def __init__(self,
+                 memory_limit_mb: int,
+                 batch_size: int,
+                 min_batch_size: int = 1,
+                 max_batch_size: Optional[int] = None,
+                 high_water: float = 0.85,
+                 low_water: float = 0.5,
+                 pause_seconds: float = 1.0,
+                 max_pauses: int = 30):
+        self.memory_limit_mb = memory_limit_mb
+        self.min_batch_size = max(1, min_batch_size)
+        self.max_batch_size = max_batch_size or max(batch_size * 4, self.min_batch_size)
+        self.batch_size = min(max(batch_size, self.min_batch_size), self.max_batch_size)
+        self.high_water = high_water
+        self.low_water = low_water
+        self.pause_seconds = pause_seconds
+        self.max_pauses = max_pauses
+        self.process = psutil.Process(os.getpid())
+        self.has_workers = False
+
+        # Counters for the end-of-run summary
+        self.peak_rss_mb = 0.0
+        self.shrinks = 0
+        self.grows = 0
+        self.spills = 0
+        self.pauses = 0
+
+    def rss_mb(self) -> float:
+        """Resident memory of this process and its children, in MB."""
+        rss = self.process.memory_info().rss
+        children = self.process.children(recursive=True)
+        self.has_workers = bool(children)
+        for child in children:
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                # Worker exited between listing and measuring
+                continue
+        rss_mb = rss / 1024 / 1024
+        self.peak_rss_mb = max(self.peak_rss_mb, rss_mb)
+        return rss_mb
+
+    def _relieve(self, spill: Optional[Callable[[], None]]):
+        """Collect garbage and let the stage spill its state to disk."""
+        gc.collect()
+        if spill is not None:
+            spill()
+            self.spills += 1
+            logger.info("Spilled in-memory state to disk")
+
+    def regulate(self, spill: Optional[Callable[[], None]] = None) -> int:
+        """
+        Check memory before the next batch and return the batch size to use.
+
+        Args:
+            spill: Optional callback that writes in-memory state to disk
+                (or drains in-flight work) to release memory
+
+        Returns:
+            int: Number of items to take in the next batch
+        """
+        rss = self.rss_mb()
+        high_mark = self.memory_limit_mb * self.high_water
+
+        if rss >= high_mark:
+            new_size = max(self.min_batch_size, self.batch_size // 2)
+            logger.warning(
+                f"Memory usage {rss:.1f} MB is above {self.high_water:.0%} of the "
+                f"{self.memory_limit_mb} MB limit, batch size {self.batch_size} -> {new_size}"
+            )
+            if new_size != self.batch_size:
+                self.shrinks += 1
+            self.batch_size = new_size
+            self._relieve(spill)
+            rss = self.rss_mb()
+
+            # Waiting only helps while worker processes can finish and release memory
+            pauses = 0
+            while rss >= self.memory_limit_mb and self.has_workers and pauses < self.max_pauses:
+                logger.warning(
+                    f"Memory usage {rss:.1f} MB over the {self.memory_limit_mb} MB limit, "
+                    f"pausing intake for {self.pause_seconds:.1f}s"
+                )
+                time.sleep(self.pause_seconds)
+                self._relieve(spill)
+                previous_rss, rss = rss, self.rss_mb()
+                pauses += 1
+                if rss >= previous_rss:
+                    # Nothing left to release by waiting
+                    break
+            self.pauses += pauses
+
+            if rss >= self.memory_limit_mb:
+                logger.warning(
+                    f"Memory usage {rss:.1f} MB still over the limit after {pauses} pauses, "
+                    f"continuing with batch size {self.batch_size}"
+                )
+        elif rss < self.memory_limit_mb * self.low_water and self.batch_size < self.max_batch_size:
+            new_size = min(self.max_batch_size, max(self.batch_size + 1, int(self.batch_size * 1.5)))
+            logger.info(
+                f"Memory usage {rss:.1f} MB is below {self.low_water:.0%} of the "
+                f"{self.memory_limit_mb} MB limit, batch size {self.batch_size} -> {new_size}"
+            )
+            self.grows += 1
+            self.batch_size = new_size
+        else:
+            logger.debug(f"Memory usage {rss:.1f} MB, batch size {self.batch_size}")
+
+        return self.batch_size
+
+    def batches(self,
+                items: Sequence,
+                spill: Optional[Callable[[], None]] = None) -> Iterator[List]:
+        """
+        Yield consecutive batches of items, sizing each one from the memory
+        observed just before it is taken.
+        """
+        i = 0
+        while i < len(items):
+            size = self.regulate(spill)
+            yield list(items[i:i+size])
+            i += size
+
+    def log_summary(self):
+        """Log the decisions taken over the run."""
+        logger.info(
+            f"Memory governor: peak {self.peak_rss_mb:.1f} MB of {self.memory_limit_mb} MB, "
+            f"{self.shrinks} shrinks, {self.grows} grows, {self.spills} spills, "
+            f"{self.pauses} pauses, final batch size {self.batch_size}"
+        )
@@ -28,6 +28,10 @@ import boto3
 from opensearchpy import OpenSearch, RequestsHttpConnection
 from requests_aws4auth import AWS4Auth
 
+from ccda_document_source import open_document
+from ccda_score_index import top_n as load_top_n
+from ccda_xml_core import birth_date, find_patient, parse, patient_name
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -35,11 +39,33 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# CCDA namespace
-CCDA_NS = {
-    'h': 'urn:hl7-org:v3',
-    'xsi': 'http://www.w3.org/2001/XMLSchema-instance'
-}
+def extract_patient_demographics(root: etree._Element, xml_file: str) -> Optional[Dict]:
+    """Extract patient demographics from a parsed CCDA document."""
+    # Find recordTarget/patientRole/patient
+    patient = find_patient(root)
+    if patient is None:
+        logger.warning(f"No patient information found in {xml_file}")
+        return None
+    
+    # Extract name components
+    name = patient_name(patient)
+    if name is None:
+        logger.warning(f"No patient name found in {xml_file}")
+        return None
+    given, family = name
+    
+    # Extract birth date
+    dob = birth_date(patient)
+    if dob is None:
+        logger.warning(f"No birth date found in {xml_file}")
+        return None
+    
+    return {
+        'firstName': given,
+        'lastName': family,
+        'dob': dob,
+        'source_file': xml_file
+    }
 
 class CCDAPatientMatcher:
     """Matches CCDA patients with OpenSearch records."""
@@ -91,41 +117,9 @@ class CCDAPatientMatcher:
     def extract_patient_info(self, xml_file: str) -> Optional[Dict]:
         """Extract patient demographics from CCDA file."""
         try:
-            parser = etree.XMLParser(remove_blank_text=True)
-            tree = etree.parse(xml_file, parser)
-            root = tree.getroot()
-            
-            # Find recordTarget/patientRole/patient
-            patient = root.find('.//h:recordTarget/h:patientRole/h:patient', namespaces=CCDA_NS)
-            if patient is None:
-                logger.warning(f"No patient information found in {xml_file}")
-                return None
-            
-            # Extract name components
-            name = patient.find('.//h:name', namespaces=CCDA_NS)
-            if name is None:
-                logger.warning(f"No patient name found in {xml_file}")
-                return None
-                
-            given = name.findtext('.//h:given', namespaces=CCDA_NS)
-            family = name.findtext('.//h:family', namespaces=CCDA_NS)
-            
-            # Extract birth date
-            birth_time = patient.find('.//h:birthTime', namespaces=CCDA_NS)
-            if birth_time is None or 'value' not in birth_time.attrib:
-                logger.warning(f"No birth date found in {xml_file}")
-                return None
-                
-            # Convert CCDA date format (YYYYMMDD) to ISO format (YYYY-MM-DD)
-            dob_str = birth_time.get('value')
-            dob = f"{dob_str[:4]}-{dob_str[4:6]}-{dob_str[6:8]}"
-            
-            return {
-                'firstName': given,
-                'lastName': family,
-                'dob': dob,
-                'source_file': xml_file
-            }
+            with open_document(xml_file) as source:
+                tree = parse(source)
+            return extract_patient_demographics(tree.getroot(), xml_file)
             
         except Exception as e:
             logger.error(f"Error processing {xml_file}: {str(e)}")
@@ -256,16 +250,8 @@ class CCDAPatientMatcher:
             
     def process_files(self, analysis_file: str, top_n: int, output_file: str):
         """Process top N files from analysis results."""
-        # Load analysis results
-        with open(analysis_file) as f:
-            analysis = json.load(f)
-            
-        # Sort files by information score and get top N
-        sorted_files = sorted(
-            analysis.items(),
-            key=lambda x: x[1].get('total_score', 0),
-            reverse=True
-        )[:top_n]
+        # Get top N files by information score from the score index
+        sorted_files = load_top_n(analysis_file, top_n)
         
         logger.info(f"Processing top {len(sorted_files)} files...")
         
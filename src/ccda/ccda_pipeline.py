@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+CCDA Document Pipeline
+
+This script parses each CCDA document once and runs every registered
+consumer against that single parse, instead of having each stage (section
+analyzer, information analyzer, PHI extractor, patient matcher, reformatter)
+parse the same file again.
+
+Consumers:
+- sections: section index (section_analysis.json), as ccda_section_analyzer.py
+- scoring: information richness scores (analysis.json), as ccda_information_analyzer.py
+- demographics: patient demographics used by ccda_patient_matcher.py
+- phi: PHI extraction, as phi/ccda_phi_extractor.py
+- reformat: pretty-printed copies, as ccda_xml_reformatter.py
+
+Consumers only read the shared tree; each one writes its own output when the
+run finishes. Most consumers read the same results whether or not blank text
+was removed (scoring counts no whitespace, section titles and patient names
+ignore blank text), so they share whichever parse the others need. Only phi,
+which keeps blank text like the standalone extractor, and reformat, which
+pretty prints without it, ask for one; running both parses a document twice. Scoring uses an existing config file, so on a fresh corpus run
+the config generator on the new section index and then --rescore the analysis.
+"""
+
+import sys
+import json
+import logging
+import argparse
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional
+from lxml import etree
+from tqdm import tqdm
+
+from ccda_document_source import document_name, list_documents, open_document
+from ccda_information_analyzer import CCDAAnalyzer
+from ccda_section_analyzer import CCDASectionAnalyzer
+from ccda_xml_reformatter import CCDAReformatter
+from ccda_xml_core import parse
+
+# PHI tools live in their own directory
+sys.path.append(str(Path(__file__).resolve().parent / 'phi'))
+from ccda_phi_extractor import CCDAPHIExtractor
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+class DocumentConsumer(ABC):
+    """A pipeline stage that runs against the shared parse of each document."""
+
+    name = 'consumer'
+    # remove_blank_text the consumer needs to match its standalone stage,
+    # or None if its results do not depend on it
+    remove_blank_text: Optional[bool] = None
+
+    @abstractmethod
+    def process(self, file_path: str, tree: etree._ElementTree):
+        """Handle one parsed document. The tree must not be modified."""
+
+    @abstractmethod
+    def finish(self, total_files: int):
+        """Write this consumer's output once all documents are processed."""
+
+class SectionIndexConsumer(DocumentConsumer):
+    """Builds the section index written by ccda_section_analyzer.py."""
+
+    name = 'sections'
+
+    def __init__(self, output_file: str):
+        self.output_file = output_file
+        self.analyzer = CCDASectionAnalyzer()
+
+    def process(self, file_path: str, tree: etree._ElementTree):
+        self.analyzer.analyze_tree(tree.getroot(), file_path)
+
+    def finish(self, total_files: int):
+        self.analyzer.total_files = total_files
+        self.analyzer.save_index(self.output_file)
+
+class ScoringConsumer(DocumentConsumer):
+    """Scores documents and writes analysis.json through the checkpoint store."""
+
+    name = 'scoring'
+
+    def __init__(self, output_file: str, checkpoint_dir: str, config_file: str, batch_size: int = 100):
+        self.output_file = output_file
+        self.batch_size = batch_size
+        self.analyzer = CCDAAnalyzer(checkpoint_dir=checkpoint_dir, config_file=config_file)
+        self.batch_results = {}
+        self.batch_num = 0
+
+    def process(self, file_path: str, tree: etree._ElementTree):
+        if file_path in self.analyzer.processed_files:
+            return
+        self.batch_results[file_path] = self.analyzer.analyze_file(file_path, tree.getroot())
+        if len(self.batch_results) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        self.batch_num += 1
+        self.analyzer.save_checkpoint(self.batch_results, self.batch_num)
+        self.batch_results = {}
+
+    def finish(self, total_files: int):
+        if self.batch_results:
+            self._flush()
+        self.analyzer.merge_checkpoints(self.output_file)
+
+class DemographicsConsumer(DocumentConsumer):
+    """Extracts the patient demographics the patient matcher searches on."""
+
+    name = 'demographics'
+
+    def __init__(self, output_file: str):
+        # The matcher module pulls in the AWS clients, so import it on demand
+        from ccda_patient_matcher import extract_patient_demographics
+        self.extract = extract_patient_demographics
+        self.output_file = output_file
+        self.results = []
+
+    def process(self, file_path: str, tree: etree._ElementTree):
+        patient_info = self.extract(tree.getroot(), file_path)
+        if patient_info:
+            self.results.append(patient_info)
+
+    def finish(self, total_files: int):
+        Path(self.output_file).parent.mkdir(parents=True, exist_ok=True)
+        with open(self.output_file, 'w') as f:
+            json.dump(self.results, f, indent=2)
+        logger.info(f"Demographics for {len(self.results)} patients saved to {self.output_file}")
+
+class PHIConsumer(DocumentConsumer):
+    """Extracts PHI as written by phi/ccda_phi_extractor.py."""
+
+    name = 'phi'
+    # The extractor reads element text as is, blank text included
+    remove_blank_text = False
+
+    def __init__(self, output_file: str):
+        self.output_file = output_file
+        self.extractor = CCDAPHIExtractor()
+        self.results = []
+
+    def process(self, file_path: str, tree: etree._ElementTree):
+        self.results.append(self.extractor.extract_phi_from_tree(tree.getroot(), file_path))
+
+    def finish(self, total_files: int):
+        Path(self.output_file).parent.mkdir(parents=True, exist_ok=True)
+        with open(self.output_file, 'w') as f:
+            json.dump(self.results, f, indent=2)
+        logger.info(f"PHI for {self.extractor.processed_files} files saved to {self.output_file}")
+
+class ReformatConsumer(DocumentConsumer):
+    """Writes pretty-printed copies, as ccda_xml_reformatter.py does."""
+
+    name = 'reformat'
+    # Pretty printing only indents trees without blank text
+    remove_blank_text = True
+
+    def __init__(self, output_dir: str):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.reformatter = CCDAReformatter()
+
+    def process(self, file_path: str, tree: etree._ElementTree):
+        output_path = str(self.output_dir / document_name(file_path))
+        self.reformatter.write_tree(tree, output_path)
+        self.reformatter.record_output(output_path)
+
+    def finish(self, total_files: int):
+        logger.info(
+            f"Reformatted {self.reformatter.processed_files} files "
+            f"({self.reformatter.total_size / (1024*1024):.2f} MB) into {self.output_dir}"
+        )
+
+class CCDAPipeline:
+    """Parses each document once and hands the tree to every consumer."""
+
+    def __init__(self, consumers: List[DocumentConsumer]):
+        self.consumers = consumers
+        # Consumers grouped by parser option, one parse per group; those
+        # without a preference share the first parse another one needs
+        options = [c.remove_blank_text for c in consumers if c.remove_blank_text is not None]
+        shared = options[0] if options else True
+        self.parse_groups: Dict[bool, List[DocumentConsumer]] = {}
+        for consumer in consumers:
+            option = shared if consumer.remove_blank_text is None else consumer.remove_blank_text
+            self.parse_groups.setdefault(option, []).append(consumer)
+        self.failed_files = 0
+        self.consumer_errors: Dict[str, int] = {consumer.name: 0 for consumer in consumers}
+
+    def run(self, input_dir: str):
+        """Run all consumers over the CCDA documents in input_dir."""
+        xml_files = list_documents(input_dir)
+        logger.info(
+            f"Running {', '.join(c.name for c in self.consumers)} "
+            f"over {len(xml_files)} CCDA XML files"
+        )
+
+        for file_path in tqdm(xml_files, desc="Processing files"):
+            for remove_blank_text, consumers in self.parse_groups.items():
+                try:
+                    with open_document(file_path) as source:
+                        tree = parse(source, remove_blank_text)
+                except Exception as e:
+                    logger.error(f"Error parsing {file_path}: {str(e)}")
+                    self.failed_files += 1
+                    break
+
+                for consumer in consumers:
+                    try:
+                        consumer.process(file_path, tree)
+                    except Exception as e:
+                        logger.error(f"{consumer.name} failed on {file_path}: {str(e)}")
+                        self.consumer_errors[consumer.name] += 1
+
+                del tree
+
+        for consumer in self.consumers:
+            consumer.finish(len(xml_files))
+
+        logger.info(f"\nPipeline complete:")
+        logger.info(f"- Documents parsed: {len(xml_files) - self.failed_files}")
+        logger.info(f"- Parse failures: {self.failed_files}")
+        for name, errors in self.consumer_errors.items():
+            logger.info(f"- {name} errors: {errors}")
+
+CONSUMER_NAMES = ['sections', 'scoring', 'demographics', 'phi', 'reformat']
+
+def build_consumers(names: List[str], args) -> List[DocumentConsumer]:
+    """Create the selected consumers from command line arguments."""
+    consumers = []
+    for name in names:
+        if name == 'sections':
+            consumers.append(SectionIndexConsumer(args.section_output))
+        elif name == 'scoring':
+            consumers.append(ScoringConsumer(
+                args.analysis_output, args.checkpoint_dir, args.config_file, args.batch_size
+            ))
+        elif name == 'demographics':
+            consumers.append(DemographicsConsumer(args.demographics_output))
+        elif name == 'phi':
+            consumers.append(PHIConsumer(args.phi_output))
+        elif name == 'reformat':
+            consumers.append(ReformatConsumer(args.reformatted_dir))
+        else:
+            raise ValueError(f"Unknown consumer '{name}', choose from {', '.join(CONSUMER_NAMES)}")
+    return consumers
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Parse each CCDA document once and run several stages against it'
+    )
+    parser.add_argument(
+        '--input-dir',
+        default='input/ccda',
+        help='Directory containing CCDA XML files'
+    )
+    parser.add_argument(
+        '--consumers',
+        default='sections,scoring,demographics,phi',
+        help=f'Comma-separated consumers to run ({", ".join(CONSUMER_NAMES)})'
+    )
+    parser.add_argument(
+        '--section-output',
+        default='output/analysis/metrics/section_analysis.json',
+        help='Output JSON file for the section index'
+    )
+    parser.add_argument(
+        '--analysis-output',
+        default='output/analysis/metrics/analysis.json',
+        help='Output JSON file for information richness scores'
+    )
+    parser.add_argument(
+        '--config-file',
+        default='output/analysis/metrics/ccda_config.json',
+        help='Path to CCDA section configuration file with weights'
+    )
+    parser.add_argument(
+        '--checkpoint-dir',
+        default='output/temp/analysis_checkpoints',
+        help='Directory for storing analysis checkpoints'
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=100,
+        help='Number of scored files per checkpoint'
+    )
+    parser.add_argument(
+        '--demographics-output',
+        default='output/analysis/metrics/patient_demographics.json',
+        help='Output JSON file for patient demographics'
+    )
+    parser.add_argument(
+        '--phi-output',
+        default='output/phi/phi_data.json',
+        help='Output JSON file for PHI data'
+    )
+    parser.add_argument(
+        '--reformatted-dir',
+        default='output/reformatted',
+        help='Output directory for reformatted files'
+    )
+    parser.add_argument(
+        '--debug',
+        action='store_true',
+        help='Enable debug logging'
+    )
+
+    args = parser.parse_args()
+
+    if args.debug:
+        logger.setLevel(logging.DEBUG)
+
+    names = [name.strip() for name in args.consumers.split(',') if name.strip()]
+    try:
+        consumers = build_consumers(names, args)
+    except ValueError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+    pipeline = CCDAPipeline(consumers)
+    pipeline.run(args.input_dir)
+
+if __name__ == '__main__':
+    main()
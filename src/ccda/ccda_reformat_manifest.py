@@ -0,0 +1,165 @@
+"""
+CCDA Reformat Manifest
+
+Output manifest that makes reformat runs idempotent.
+
+Every written output gets a record of the source it was made from (size,
+mtime and SHA-256), the reformat settings and the output itself (size, mtime
+and SHA-256). Records are appended to a JSONL file in the output directory
+(the last record for an output wins). On the next run an output is up to date,
+and is not rewritten, when:
+- its source has the recorded content hash (a source whose path, size and
+  mtime match its record is not even read)
+- the settings are the same
+- the output file still has the recorded content (checked by size and mtime,
+  and by hash when those differ)
+
+A bundle (several documents in one archive) has one record listing its
+members' sources; its source hash covers every member's name and content, so
+the bundle is up to date only if all of its members are.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from ccda_document_source import document_digest, document_stat
+from ccda_file_fingerprints import Fingerprint, file_digest
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = '.reformat_manifest.jsonl'
+
+class ReformatManifest:
+    """Append-only output name -> (source, settings, output) records."""
+
+    def __init__(self, output_dir: str):
+        self.manifest_file = Path(output_dir) / MANIFEST_NAME
+        self.entries: Dict[str, Dict] = {}
+        self.pending: Dict[str, Dict] = {}
+        # Source path -> fingerprint from the latest records
+        self.sources: Dict[str, Fingerprint] = {}
+
+        if self.manifest_file.exists():
+            lines = 0
+            with open(self.manifest_file, encoding='utf-8') as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Partial line from an interrupted write
+                        continue
+                    self._set(entry)
+            logger.info(f"Loaded reformat manifest with {len(self.entries)} outputs")
+            if lines > 2 * len(self.entries):
+                self._compact()
+
+    def _set(self, entry: Dict):
+        self.entries[entry['output']] = entry
+        for member in entry.get('members', [entry]):
+            self.sources[member['source']] = (
+                member['source_size'], member['source_mtime_ns'], member['source_sha256']
+            )
+
+    def source_fingerprint(self, source_path: str) -> Fingerprint:
+        """
+        (size, mtime_ns, sha256) of a source, reusing the recorded hash if
+        the source is unchanged.
+        """
+        stat = document_stat(source_path)
+        recorded = self.sources.get(source_path)
+        if recorded is not None and recorded[:2] == (stat.st_size, stat.st_mtime_ns):
+            return recorded
+        return stat.st_size, stat.st_mtime_ns, document_digest(source_path)
+
+    @staticmethod
+    def bundle_digest(members: List[Tuple[str, str, Fingerprint]]) -> str:
+        """Source hash of a bundle of (member name, source path, fingerprint)."""
+        digest = hashlib.sha256()
+        for name, _, source in members:
+            digest.update(f'{name}\t{source[2]}\n'.encode('utf-8'))
+        return digest.hexdigest()
+
+    def is_current(self, output_path: Path, source_sha256: str, settings: Dict) -> bool:
+        """Whether output_path was made from this source content with these settings."""
+        entry = self.entries.get(output_path.name)
+        if entry is None or entry['source_sha256'] != source_sha256 or entry['settings'] != settings:
+            return False
+        try:
+            stat = os.stat(output_path)
+        except FileNotFoundError:
+            return False
+        if stat.st_size != entry['output_size']:
+            return False
+        if stat.st_mtime_ns != entry['output_mtime_ns']:
+            # Touched or copied: only the content matters
+            if file_digest(output_path) != entry['output_sha256']:
+                return False
+            entry['output_mtime_ns'] = stat.st_mtime_ns
+            self.pending[entry['output']] = entry
+        return True
+
+    def record(self, output_path: Path, source_path: str, source: Fingerprint, settings: Dict):
+        """Record a written output; saved by the next flush()."""
+        self._record_output(output_path, {
+            'source': source_path,
+            'source_size': source[0],
+            'source_mtime_ns': source[1],
+            'source_sha256': source[2],
+            'settings': settings
+        })
+
+    def record_bundle(self, output_path: Path, members: List[Tuple[str, str, Fingerprint]],
+                      settings: Dict):
+        """Record a written bundle of (member name, source path, fingerprint)."""
+        self._record_output(output_path, {
+            'members': [
+                {
+                    'name': name,
+                    'source': source_path,
+                    'source_size': source[0],
+                    'source_mtime_ns': source[1],
+                    'source_sha256': source[2]
+                }
+                for name, source_path, source in members
+            ],
+            'source_sha256': self.bundle_digest(members),
+            'settings': settings
+        })
+
+    def _record_output(self, output_path: Path, entry: Dict):
+        stat = os.stat(output_path)
+        entry = {
+            'output': output_path.name,
+            **entry,
+            'output_size': stat.st_size,
+            'output_mtime_ns': stat.st_mtime_ns,
+            'output_sha256': file_digest(output_path)
+        }
+        self._set(entry)
+        self.pending[entry['output']] = entry
+
+    def flush(self):
+        """Append the records made since the last flush."""
+        if not self.pending:
+            return
+        with open(self.manifest_file, 'a', encoding='utf-8') as f:
+            for entry in self.pending.values():
+                f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.pending.clear()
+
+    def _compact(self):
+        """Rewrite the manifest with only the latest record per output."""
+        tmp_file = self.manifest_file.with_name(self.manifest_file.name + '.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.manifest_file)
@@ -0,0 +1,105 @@
+"""
+CCDA Score Index
+
+Compact score-ordered index written beside analysis.json, so the stages that
+only need the top N files (reformatter, patient matcher, EHR uploader) can
+stream the first N lines instead of loading and sorting every entry.
+
+Format (analysis.json -> analysis.rank.tsv):
+- Header: #ccda-score-index<TAB>file count<TAB>size of analysis.json in
+  bytes<TAB>its st_mtime_ns
+- Then one score<TAB>file path line per file, highest score first
+
+If the index is missing, unreadable or does not match analysis.json (for
+example the analysis file was rewritten by --rescore, often with the same
+size), readers fall back to loading analysis.json.
+"""
+
+import json
+import logging
+import os
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, List, Optional, TextIO, Tuple
+
+logger = logging.getLogger(__name__)
+
+INDEX_MAGIC = '#ccda-score-index'
+
+def index_path(analysis_file: str) -> Path:
+    """Return the score index path for an analysis file."""
+    return Path(analysis_file).with_suffix('.rank.tsv')
+
+def write_score_index(analysis_file: str, ranked: Iterable[Tuple[str, float]]):
+    """
+    Write the score index for an analysis file that has already been saved.
+
+    Args:
+        analysis_file: Path of the written analysis.json
+        ranked: (file path, score) pairs, highest score first
+    """
+    ranked = list(ranked)
+    path = index_path(analysis_file)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        stat = os.stat(analysis_file)
+        f.write(f"{INDEX_MAGIC}\t{len(ranked)}\t{stat.st_size}\t{stat.st_mtime_ns}\n")
+        for file_path, score in ranked:
+            f.write(f"{score!r}\t{file_path}\n")
+    os.replace(tmp_path, path)
+    logger.debug(f"Wrote score index for {len(ranked)} files to {path}")
+
+def _open_index(analysis_file: str) -> Optional[Tuple[TextIO, int]]:
+    """Open a score index that matches analysis_file, or return None."""
+    path = index_path(analysis_file)
+    if not path.exists():
+        return None
+
+    f = open(path, encoding='utf-8')
+    parts = f.readline().rstrip('\n').split('\t')
+    stat = os.stat(analysis_file)
+    try:
+        matches = (len(parts) == 4 and parts[0] == INDEX_MAGIC
+                   and (int(parts[2]), int(parts[3])) == (stat.st_size, stat.st_mtime_ns))
+        count = int(parts[1])
+    except ValueError:
+        matches = False
+    if not matches:
+        f.close()
+        logger.warning(f"Score index {path} does not match {analysis_file}, ignoring it")
+        return None
+    return f, count
+
+def _load_ranked(analysis_file: str) -> List[Tuple[str, float]]:
+    """Fallback: load analysis.json and sort every entry by score."""
+    logger.info(f"No score index for {analysis_file}, loading the full analysis file")
+    with open(analysis_file) as f:
+        analysis = json.load(f)
+    return sorted(
+        ((file_path, metrics.get('total_score', 0)) for file_path, metrics in analysis.items()),
+        key=lambda x: x[1],
+        reverse=True
+    )
+
+def top_n_with_count(analysis_file: str, n: int) -> Tuple[List[Tuple[str, float]], int]:
+    """
+    Return the n highest scoring (file path, score) pairs from an analysis
+    file and the number of files it ranks. Only the first n index lines are
+    read when the score index is available.
+    """
+    opened = _open_index(analysis_file)
+    if opened is None:
+        ranked = _load_ranked(analysis_file)
+        return ranked[:n], len(ranked)
+
+    f, count = opened
+    with f:
+        top_files = []
+        for line in islice(f, n):
+            score, file_path = line.rstrip('\n').split('\t', 1)
+            top_files.append((file_path, float(score)))
+    return top_files, count
+
+def top_n(analysis_file: str, n: int) -> List[Tuple[str, float]]:
+    """Return the n highest scoring (file path, score) pairs from an analysis file."""
+    return top_n_with_count(analysis_file, n)[0]
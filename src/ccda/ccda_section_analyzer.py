@@ -10,14 +10,30 @@ This helps ensure completeness of section analysis and proper weight assignment.
 import os
 import sys
 import json
+import math
+import time
 import logging
 from pathlib import Path
-from typing import Dict, List, Set, Counter
-from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Set, Tuple, Counter
+from collections import deque
+from multiprocessing import Pool
 import argparse
 from lxml import etree
 from tqdm import tqdm
 
+from ccda_document_source import list_documents, open_document
+from ccda_memory_governor import MemoryGovernor
+from ccda_section_db import SectionIndexDB
+from ccda_section_index import SectionIndex
+from ccda_section_matrix import SectionMatrix, matrix_path
+from ccda_section_sampling import SectionSampler, sample_order
+from ccda_xml_core import (
+    SECTION_TAG, TEMPLATE_ID_TAG, CODE_TAG, TITLE_TAG, ENTRY_TAG, TEXT_TAG,
+    SECTIONS, SECTION_TEMPLATE_IDS, SECTION_CODES, SECTION_CODE_SYSTEMS, SECTION_TITLES,
+    SECTION_ENTRIES, CODED_ELEMENTS, is_blank, narrative_stats, section_id as get_section_id
+)
+from ccda_text_stats import TextStats, clear_token_cache, text_counts
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -25,44 +41,81 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# CCDA namespace
-CCDA_NS = {
-    'h': 'urn:hl7-org:v3',
-    'xsi': 'http://www.w3.org/2001/XMLSchema-instance'
-}
+class _OpenSection:
+    """Metadata collected for a section while it is being streamed."""
+    
+    __slots__ = ('order', 'depth', 'text_depth', 'template_ids', 'codes', 'code_systems',
+                 'titles', 'entry_count', 'coded_element_count', 'text')
+    
+    def __init__(self, order: int, depth: int, text_depth: int):
+        self.order = order              # document order of the section start tag
+        self.depth = depth              # element depth of the section
+        self.text_depth = text_depth    # open <text> elements outside the section
+        self.template_ids = []
+        self.codes = []
+        self.code_systems = []
+        self.titles = []
+        self.entry_count = 0
+        self.coded_element_count = 0
+        self.text = TextStats()
+    
+    def section_data(self) -> Dict:
+        """Return the same dict as analyze_section for this section."""
+        codes, code_systems = self.codes, self.code_systems
+        return {
+            'template_ids': self.template_ids,
+            'codes': list(zip(codes, code_systems)) if len(codes) == len(code_systems) else codes,
+            'titles': self.titles,
+            'entry_count': self.entry_count,
+            'coded_element_count': self.coded_element_count,
+            'text_length': self.text.words,
+            'char_count': self.text.chars,
+            'token_count': self.text.tokens
+        }
 
 class CCDASectionAnalyzer:
     """Analyzes CCDA sections across multiple files to build a comprehensive index."""
     
-    def __init__(self):
-        self.section_index = defaultdict(lambda: {
-            'count': 0,
-            'files': set(),
-            'template_ids': set(),
-            'codes': set(),
-            'titles': set(),
-            'total_entries': 0,
-            'total_coded_elements': 0,
-            'total_text_length': 0,
-            'example_files': []  # Will store up to 5 example files
-        })
-        self.total_files = 0
+    def __init__(self, max_values: Optional[int] = None, checkpoint_dir: Optional[str] = None,
+                 checkpoint_interval: float = 300, matrix: bool = False,
+                 top_k: Optional[int] = None):
+        # max_values caps the distinct codes and titles kept per section
+        self.max_values = max_values
+        # top_k sketches them instead (see ccda_section_sketches)
+        self.top_k = top_k
+        # matrix also keeps a file x section row per file (see ccda_section_matrix)
+        self.build_matrix = matrix
+        self.section_index = SectionIndex(max_values, matrix, top_k)
+        # Periodic snapshots of the partial index, used to resume a crashed run
+        self.snapshot_file = None
+        self.checkpoint_interval = checkpoint_interval
+        if checkpoint_dir:
+            self.snapshot_file = Path(checkpoint_dir) / 'section_index_snapshot.json'
+        # Set by analyze_sample to estimate confidence intervals
+        self.sampler: Optional[SectionSampler] = None
+    
+    @property
+    def total_files(self) -> int:
+        return self.section_index.total_files
+    
+    @total_files.setter
+    def total_files(self, value: int):
+        self.section_index.total_files = value
         
     def analyze_section(self, section: etree._Element, file_path: str) -> Dict:
         """
         Analyze a single section element and extract all relevant metadata.
         """
         # Get section identifiers
-        template_ids = section.xpath('.//h:templateId/@root', namespaces=CCDA_NS)
-        codes = section.xpath('./h:code/@code', namespaces=CCDA_NS)
-        code_systems = section.xpath('./h:code/@codeSystem', namespaces=CCDA_NS)
-        titles = section.xpath('./h:title/text()', namespaces=CCDA_NS)
+        template_ids = SECTION_TEMPLATE_IDS(section)
+        codes = SECTION_CODES(section)
+        code_systems = SECTION_CODE_SYSTEMS(section)
+        titles = SECTION_TITLES(section)
         
         # Get section content metrics
-        entries = section.xpath('.//h:entry', namespaces=CCDA_NS)
-        coded_elements = section.xpath('.//*[@code]', namespaces=CCDA_NS)
-        text_elements = section.xpath('.//h:text//text()', namespaces=CCDA_NS)
-        text_content = ' '.join(text for text in text_elements if text.strip())
+        entries = SECTION_ENTRIES(section)
+        coded_elements = CODED_ELEMENTS(section)
+        text = narrative_stats(section)
         
         return {
             'template_ids': template_ids,
@@ -70,91 +123,525 @@ class CCDASectionAnalyzer:
             'titles': titles,
             'entry_count': len(entries),
             'coded_element_count': len(coded_elements),
-            'text_length': len(text_content.split())
+            'text_length': text.words,
+            'char_count': text.chars,
+            'token_count': text.tokens
         }
         
-    def update_section_index(self, section_data: Dict, section_id: str, file_path: str):
+    def update_section_index(self, section_data: Dict, section_id: str, file_path: str, first_in_file: bool = True):
         """
         Update the section index with new section data.
         """
-        index_entry = self.section_index[section_id]
-        index_entry['count'] += 1
-        index_entry['files'].add(file_path)
-        index_entry['template_ids'].update(section_data['template_ids'])
-        index_entry['codes'].update(section_data['codes'])
-        index_entry['titles'].update(section_data['titles'])
-        index_entry['total_entries'] += section_data['entry_count']
-        index_entry['total_coded_elements'] += section_data['coded_element_count']
-        index_entry['total_text_length'] += section_data['text_length']
-        
-        # Keep track of example files (up to 5)
-        if len(index_entry['example_files']) < 5:
-            index_entry['example_files'].append(file_path)
+        self.section_index.add(section_id, section_data, file_path, first_in_file)
+        if self.sampler is not None:
+            self.sampler.add_occurrence(section_id, section_data)
     
     def analyze_file(self, file_path: str) -> Dict:
         """
         Analyze sections in a single CCDA XML file.
         """
         try:
-            # Parse the XML file
-            parser = etree.XMLParser(remove_blank_text=True)
-            tree = etree.parse(file_path, parser)
-            root = tree.getroot()
+            with open_document(file_path) as source:
+                return self.analyze_stream(file_path, source)
             
-            # Find all sections
-            sections = root.xpath('//h:section', namespaces=CCDA_NS)
+        except Exception as e:
+            logger.error(f"Error processing {file_path}: {str(e)}")
+            # Keep one matrix row per indexed file
+            if self.section_index.matrix is not None:
+                self.section_index.matrix.add_file(file_path, ())
+            return {}
+    
+    def analyze_stream(self, file_path: str, source=None) -> Dict:
+        """
+        Analyze sections in a CCDA XML file without building the whole tree.
+        
+        Gives the same results as analyze_tree, with memory bounded by the
+        depth of the document rather than its size. The file is read with
+        start/end events and a stack of open sections. As in the XPath queries
+        of analyze_section, each templateId, entry, coded element and narrative
+        text node counts for every open section that contains it, including
+        parents of nested sections. Text nodes are counted when their content
+        is complete and every element is cleared once it ends, so embedded
+        attachments and long narratives are released as they stream past.
+        
+        Sections are added to the index in document order once the whole file
+        has been read, so a file that fails to parse adds nothing. source is
+        what open_document gives for file_path (file_path itself by default).
+        """
+        open_sections: List[_OpenSection] = []
+        closed_sections: List[_OpenSection] = []
+        path = []          # [tag, text counted] for every open element
+        text_depth = 0     # open <text> elements
+        order = 0
+        
+        def count_text(text: str, parent_tag: str, parent_depth: int):
+            """Credit one text node, whose parent is open at parent_depth."""
+            if not open_sections:
+                return
+            innermost = open_sections[-1]
+            if parent_tag == TITLE_TAG and innermost.depth == parent_depth - 1 and not is_blank(text):
+                innermost.titles.append(text)
+            if text_depth:
+                counts = text_counts(text)
+                if counts[0]:
+                    for section in open_sections:
+                        # Only <text> elements inside the section count for it
+                        if text_depth > section.text_depth:
+                            section.text.add_counts(counts)
+        
+        for event, elem in etree.iterparse(file_path if source is None else source, events=('start', 'end'), remove_blank_text=True):
+            tag = elem.tag
             
-            file_sections = {}
-            for section in sections:
-                # Get section identifiers
-                template_ids = section.xpath('.//h:templateId/@root', namespaces=CCDA_NS)
-                codes = section.xpath('./h:code/@code', namespaces=CCDA_NS)
+            if event == 'start':
+                depth = len(path)
+                if depth:
+                    # The parent's text and the tails of earlier siblings are complete
+                    parent_frame = path[-1]
+                    parent = elem.getparent()
+                    if not parent_frame[1]:
+                        parent_frame[1] = True
+                        if parent.text is not None:
+                            count_text(parent.text, parent_frame[0], depth)
+                    while parent[0] is not elem:
+                        if parent[0].tail is not None:
+                            count_text(parent[0].tail, parent_frame[0], depth)
+                        del parent[0]
                 
-                # Use template ID or code as section identifier
-                section_id = template_ids[0] if template_ids else (codes[0] if codes else None)
+                if open_sections:
+                    is_template_id = tag == TEMPLATE_ID_TAG
+                    is_entry = tag == ENTRY_TAG
+                    has_code = elem.get('code') is not None
+                    for section in open_sections:
+                        if is_template_id and elem.get('root') is not None:
+                            section.template_ids.append(elem.get('root'))
+                        if is_entry:
+                            section.entry_count += 1
+                        if has_code:
+                            section.coded_element_count += 1
+                    
+                    innermost = open_sections[-1]
+                    if tag == CODE_TAG and innermost.depth == depth:
+                        if has_code:
+                            innermost.codes.append(elem.get('code'))
+                        if elem.get('codeSystem') is not None:
+                            innermost.code_systems.append(elem.get('codeSystem'))
                 
-                if section_id:
-                    section_data = self.analyze_section(section, file_path)
-                    self.update_section_index(section_data, section_id, file_path)
-                    file_sections[section_id] = section_data
+                path.append([tag, False])
+                if tag == SECTION_TAG:
+                    open_sections.append(_OpenSection(order, depth + 1, text_depth))
+                    order += 1
+                elif tag == TEXT_TAG:
+                    text_depth += 1
+                continue
             
-            return file_sections
+            # End: the element's own text (if it had no children) and its
+            # remaining child tails are complete
+            depth = len(path)
+            frame = path[-1]
+            if not frame[1] and elem.text is not None:
+                count_text(elem.text, tag, depth)
+            for child in elem:
+                if child.tail is not None:
+                    count_text(child.tail, tag, depth)
             
-        except Exception as e:
-            logger.error(f"Error processing {file_path}: {str(e)}")
-            return {}
+            path.pop()
+            if tag == SECTION_TAG:
+                closed_sections.append(open_sections.pop())
+            elif tag == TEXT_TAG:
+                text_depth -= 1
+            
+            # Everything inside the element has been counted; its tail is
+            # still needed by the parent
+            elem.clear(keep_tail=True)
+        
+        closed_sections.sort(key=lambda section: section.order)
+        file_sections = {}
+        occurrences = []
+        for section in closed_sections:
+            # Use template ID or code as section identifier
+            section_id = section.template_ids[0] if section.template_ids else (
+                section.codes[0] if section.codes else None
+            )
+            
+            if section_id:
+                section_data = section.section_data()
+                self.update_section_index(
+                    section_data, section_id, file_path, section_id not in file_sections
+                )
+                file_sections[section_id] = section_data
+                occurrences.append((section_id, section_data))
+        
+        if self.section_index.matrix is not None:
+            self.section_index.matrix.add_file(file_path, occurrences)
+        return file_sections
     
-    def analyze_directory(self, input_dir: str, output_file: str = 'ccda_section_index.json', batch_size: int = 15, memory_limit: int = 8000):
+    def analyze_tree(self, root: etree._Element, file_path: str) -> Dict:
         """
-        Analyze all XML files in the directory and build a comprehensive section index.
+        Analyze sections in an already parsed CCDA document.
         """
-        input_path = Path(input_dir)
-        xml_files = list(input_path.glob('*.xml'))
-        self.total_files = len(xml_files)
+        # Find all sections
+        sections = SECTIONS(root)
         
-        logger.info(f"Analyzing sections in {self.total_files} CCDA XML files...")
+        file_sections = {}
+        occurrences = []
+        for section in sections:
+            # Use template ID or code as section identifier
+            section_id = get_section_id(section)
+            
+            if section_id:
+                section_data = self.analyze_section(section, file_path)
+                self.update_section_index(
+                    section_data, section_id, file_path, section_id not in file_sections
+                )
+                file_sections[section_id] = section_data
+                occurrences.append((section_id, section_data))
         
-        for xml_file in tqdm(xml_files, desc="Processing files"):
-            self.analyze_file(str(xml_file))
+        if self.section_index.matrix is not None:
+            self.section_index.matrix.add_file(file_path, occurrences)
+        return file_sections
+    
+    def analyze_directory(self,
+                          input_dir: str,
+                          output_file: str = 'ccda_section_index.json',
+                          batch_size: int = 15,
+                          memory_limit: int = 8000,
+                          workers: int = 1,
+                          shard: Optional[Tuple[int, int]] = None,
+                          resume: bool = False):
+        """
+        Analyze all CCDA documents in the directory (plain, compressed or in
+        archives, see ccda_document_source) and build a comprehensive section index.
+        With workers > 1 each batch is indexed into a partial index in a process
+        pool and the partials are merged here in batch order. With a shard
+        (k, n) only the k-th of n contiguous slices of the sorted file list is
+        analyzed and the partial index is written to output_file for merge_partials.
         
-        # Convert sets to lists for JSON serialization
-        serializable_index = {}
-        for section_id, data in self.section_index.items():
-            serializable_index[section_id] = {
-                'count': data['count'],
-                'frequency': data['count'] / self.total_files,
-                'files': len(data['files']),
-                'template_ids': list(data['template_ids']),
-                'codes': list(data['codes']),
-                'titles': list(data['titles']),
-                'total_entries': data['total_entries'],
-                'avg_entries': data['total_entries'] / data['count'] if data['count'] > 0 else 0,
-                'total_coded_elements': data['total_coded_elements'],
-                'avg_coded_elements': data['total_coded_elements'] / data['count'] if data['count'] > 0 else 0,
-                'total_text_length': data['total_text_length'],
-                'avg_text_length': data['total_text_length'] / data['count'] if data['count'] > 0 else 0,
-                'example_files': data['example_files'][:5]  # Include up to 5 example files
+        Files are indexed in sorted order, so the files covered so far are
+        always a prefix of the list. With a checkpoint directory the partial
+        index is snapshotted every checkpoint_interval seconds, and resume
+        continues after the last file in the snapshot.
+        """
+        xml_files = list_documents(input_dir)
+        if shard is not None:
+            k, n = shard
+            xml_files = xml_files[k * len(xml_files) // n:(k + 1) * len(xml_files) // n]
+        total_files = len(xml_files)
+        
+        files_done = 0
+        last_file = None
+        if resume:
+            last_file = self.load_snapshot(input_dir, shard)
+            if last_file is not None:
+                files_done = self.total_files
+                pending_files = [f for f in xml_files if f > last_file]
+                if total_files - len(pending_files) != files_done:
+                    logger.warning(f"Snapshot covered {files_done} files but {total_files - len(pending_files)} "
+                                   f"current files sort before {last_file}; the directory has changed")
+                xml_files = pending_files
+        
+        logger.info(f"Analyzing sections in {len(xml_files)} of {total_files} CCDA XML files...")
+        
+        last_snapshot = time.monotonic()
+        
+        def snapshot():
+            """Snapshot the files covered so far, if checkpointing."""
+            nonlocal last_snapshot
+            if self.snapshot_file is not None and last_file is not None:
+                self.save_snapshot(input_dir, shard, files_done, last_file)
+                last_snapshot = time.monotonic()
+        
+        def covered(batch_files: List[str]):
+            """Record that a batch is in the index and snapshot if it is time."""
+            nonlocal files_done, last_file
+            files_done += len(batch_files)
+            last_file = str(batch_files[-1])
+            if time.monotonic() - last_snapshot >= self.checkpoint_interval:
+                snapshot()
+        
+        self.index_files(xml_files, batch_size, memory_limit, workers, covered, total_files, snapshot)
+        
+        snapshot()
+        self.total_files = total_files
+        
+        if shard is not None:
+            self.save_partial(output_file)
+        else:
+            self.save_index(output_file)
+    
+    def update_db(self,
+                  db_dir: str,
+                  input_dir: str,
+                  output_file: str,
+                  batch_size: int = 15,
+                  memory_limit: int = 8000,
+                  workers: int = 1):
+        """
+        Add the files of input_dir that are new to the section database and
+        write the section index from it. The database is committed every
+        checkpoint_interval seconds, so an interrupted update resumes after
+        the last committed batch.
+        """
+        db = SectionIndexDB(db_dir, self.max_values, self.build_matrix, self.top_k)
+        self.section_index = db.index
+        
+        xml_files = list_documents(input_dir)
+        new_files, fingerprints = db.pending(xml_files)
+        logger.info(f"{len(new_files)} of {len(xml_files)} files in {input_dir} are new to {db_dir}")
+        
+        base_files = self.total_files
+        files_done = 0
+        uncommitted: List[str] = []
+        last_commit = time.monotonic()
+        
+        def commit():
+            """Commit the merged batches not yet in the database."""
+            nonlocal last_commit
+            if uncommitted:
+                db.commit({str(f): fingerprints[str(f)] for f in uncommitted})
+                uncommitted.clear()
+            last_commit = time.monotonic()
+        
+        def covered(batch_files: List[str]):
+            """Count a merged batch and commit the database if it is time."""
+            nonlocal files_done
+            files_done += len(batch_files)
+            self.total_files = base_files + files_done
+            uncommitted.extend(batch_files)
+            if time.monotonic() - last_commit >= self.checkpoint_interval:
+                commit()
+        
+        self.index_files(new_files, batch_size, memory_limit, workers, covered, persist=commit)
+        commit()
+        
+        self.save_index(output_file)
+    
+    def report_from_db(self, db_dir: str, output_file: str):
+        """
+        Write the section index stored in the section database, without reading any XML.
+        """
+        self.section_index = SectionIndexDB(db_dir, self.max_values, self.build_matrix, self.top_k).index
+        self.save_index(output_file)
+    
+    def index_files(self,
+                    xml_files: List[str],
+                    batch_size: int = 15,
+                    memory_limit: int = 8000,
+                    workers: int = 1,
+                    covered: Optional[Callable[[List[str]], None]] = None,
+                    total: Optional[int] = None,
+                    persist: Optional[Callable[[], None]] = None):
+        """
+        Add files to the section index in memory-governed batches, optionally
+        in a process pool. covered is called with each batch, in order, once
+        it is part of the index. total is the run size shown in the progress
+        bar when only the remainder of a run is indexed.
+        
+        Under memory pressure the governor spills: in-flight partials are
+        merged, persist writes the index covered so far (a snapshot or a
+        database commit) and the memoized token counts are released.
+        """
+        if total is None:
+            total = len(xml_files)
+        
+        # Batch sizes adapt to observed memory so the run stays within memory_limit (MB)
+        governor = MemoryGovernor(memory_limit, batch_size)
+        
+        def release():
+            if persist is not None:
+                persist()
+            clear_token_cache()
+        
+        with tqdm(total=total, initial=total - len(xml_files), desc="Processing files") as progress:
+            if workers > 1 and xml_files:
+                logger.info(f"Indexing with {workers} workers")
+                pool = Pool(processes=workers, initializer=_init_worker,
+                            initargs=(self.max_values, self.build_matrix, self.top_k))
+                # Partials are merged in submission order so example files match a serial run
+                in_flight = deque()
+                
+                def drain_batch():
+                    batch, async_result = in_flight.popleft()
+                    self.section_index.merge(async_result.get())
+                    if covered is not None:
+                        covered(batch)
+                    progress.update(len(batch))
+                
+                def spill():
+                    # Pause intake until in-flight partials are merged
+                    while in_flight:
+                        drain_batch()
+                    release()
+                
+                try:
+                    for batch in governor.batches(xml_files, spill):
+                        while len(in_flight) >= workers * 2:
+                            drain_batch()
+                        in_flight.append((
+                            batch,
+                            pool.apply_async(_index_batch_worker, ([str(f) for f in batch],))
+                        ))
+                    while in_flight:
+                        drain_batch()
+                    pool.close()
+                except BaseException:
+                    pool.terminate()
+                    raise
+                finally:
+                    pool.join()
+            else:
+                for batch in governor.batches(xml_files, release):
+                    for xml_file in batch:
+                        self.analyze_file(str(xml_file))
+                        progress.update(1)
+                    if covered is not None:
+                        covered(batch)
+        governor.log_summary()
+    
+    def analyze_sample(self,
+                       input_dir: str,
+                       output_file: str,
+                       batch_size: int = 15,
+                       memory_limit: int = 8000,
+                       precision: float = 0.01,
+                       relative_precision: float = 0.05,
+                       confidence: float = 0.95,
+                       min_sample: int = 500,
+                       seed: int = 0):
+        """
+        Estimate the section index from a random sample of the files.
+        Files are analyzed in a seeded random order until every section's
+        frequency is within precision and its averages within
+        relative_precision at the given confidence (see SectionSampler).
+        The report has the usual format, computed over the sampled files,
+        plus the confidence half-widths of each estimate.
+        """
+        xml_files = sample_order(list_documents(input_dir), seed)
+        self.sampler = SectionSampler(
+            len(xml_files), precision, relative_precision, confidence, min_sample
+        )
+        
+        logger.info(f"Sampling sections from {len(xml_files)} CCDA XML files "
+                    f"(precision {precision}, relative precision {relative_precision}, "
+                    f"confidence {confidence:.0%})...")
+        
+        governor = MemoryGovernor(memory_limit, batch_size)
+        with tqdm(total=len(xml_files), desc="Sampling files") as progress:
+            for batch in governor.batches(xml_files, clear_token_cache):
+                for xml_file in batch:
+                    self.analyze_file(str(xml_file))
+                    self.sampler.end_file()
+                    progress.update(1)
+                if self.sampler.converged():
+                    break
+        governor.log_summary()
+        self.total_files = self.sampler.sampled_files
+        
+        if self.sampler.converged():
+            logger.info(f"Estimates converged after {self.total_files} of {len(xml_files)} files")
+        else:
+            logger.warning(f"Sampled all {self.total_files} files without reaching the target precision")
+        self.save_index(output_file)
+    
+    def section_summary(self, section_id: str, stats) -> Dict:
+        """
+        Build the report entry for a section; sampled runs add the
+        confidence half-width of each estimate.
+        """
+        summary = stats.summary(self.total_files)
+        if self.sampler is not None:
+            summary['confidence_intervals'] = {
+                name: round(half_width, 6) if math.isfinite(half_width) else None
+                for name, half_width in self.sampler.intervals(section_id).items()
             }
+        return summary
+    
+    def save_snapshot(self, input_dir: str, shard: Optional[Tuple[int, int]], files_done: int, last_file: str):
+        """
+        Atomically write the partial index covering the first files_done
+        files, up to and including last_file.
+        """
+        self.total_files = files_done
+        self.snapshot_file.parent.mkdir(exist_ok=True, parents=True)
+        # The matrix goes first; rows past the snapshot are cut on resume
+        if self.section_index.matrix is not None:
+            self.section_index.matrix.save(matrix_path(self.snapshot_file))
+        snapshot = {
+            'input_dir': str(input_dir),
+            'shard': list(shard) if shard else None,
+            'max_values': self.max_values,
+            'top_k': self.top_k,
+            'matrix': self.build_matrix,
+            'last_file': last_file,
+            'index': self.section_index.to_json()
+        }
+        tmp_file = self.snapshot_file.with_name(self.snapshot_file.name + '.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.snapshot_file)
+        logger.debug(f"Snapshot of {files_done} files saved to {self.snapshot_file}")
+    
+    def load_snapshot(self, input_dir: str, shard: Optional[Tuple[int, int]]) -> Optional[str]:
+        """
+        Load the partial index from a snapshot of the same run.
+        Returns the last file it covers, or None to start from scratch.
+        """
+        if self.snapshot_file is None or not self.snapshot_file.exists():
+            logger.info("No section index snapshot found, starting from scratch")
+            return None
+        
+        with open(self.snapshot_file) as f:
+            snapshot = json.load(f)
+        if (snapshot['input_dir'] != str(input_dir)
+                or snapshot['shard'] != (list(shard) if shard else None)
+                or snapshot['max_values'] != self.max_values
+                or snapshot.get('top_k') != self.top_k
+                or snapshot.get('matrix', False) != self.build_matrix):
+            logger.warning(f"Snapshot {self.snapshot_file} is from a different run "
+                           f"(input dir, shard, max values, top-k or matrix), starting from scratch")
+            return None
+        
+        self.section_index = SectionIndex.from_json(snapshot['index'], self.max_values, self.top_k)
+        if self.build_matrix:
+            self.section_index.matrix = SectionMatrix.load(matrix_path(self.snapshot_file))
+            self.section_index.matrix.truncate(self.total_files)
+        logger.info(f"Resuming after {self.total_files} files (last: {snapshot['last_file']})")
+        return snapshot['last_file']
+    
+    def save_partial(self, output_file: str):
+        """
+        Write the partial index of a shard, to be combined with merge_partials.
+        """
+        with open(output_file, 'w') as f:
+            json.dump(self.section_index.to_json(), f)
+        if self.section_index.matrix is not None:
+            self.section_index.matrix.save(matrix_path(output_file))
+        logger.info(f"Partial index for {self.total_files} files "
+                    f"({len(self.section_index)} sections) saved to {output_file}")
+    
+    def merge_partials(self, partial_files: List[str], output_file: str):
+        """
+        Merge shard partial indexes, in the given order, and write the section index.
+        """
+        for partial_file in partial_files:
+            with open(partial_file) as f:
+                partial = SectionIndex.from_json(json.load(f), self.max_values, self.top_k)
+            if self.build_matrix:
+                partial.matrix = SectionMatrix.load(matrix_path(partial_file))
+            self.section_index.merge(partial)
+            logger.info(f"Merged partial index {partial_file}")
+        self.save_index(output_file)
+    
+    def save_index(self, output_file: str):
+        """
+        Write the section index, sorted by frequency, and log a summary.
+        """
+        # Convert sets to lists for JSON serialization
+        serializable_index = {
+            section_id: self.section_summary(section_id, stats)
+            for section_id, stats in self.section_index.items()
+        }
         
         # Sort sections by frequency
         sorted_index = dict(sorted(
@@ -166,6 +653,11 @@ class CCDASectionAnalyzer:
         # Save the index
         with open(output_file, 'w') as f:
             json.dump(sorted_index, f, indent=2)
+        if self.section_index.matrix is not None:
+            matrix = self.section_index.matrix
+            matrix.save(matrix_path(output_file))
+            logger.info(f"Section matrix of {len(matrix)} files and {len(matrix.section_ids)} "
+                        f"sections saved to {matrix_path(output_file)}")
         
         # Print summary
         logger.info(f"\nAnalysis complete. Found {len(self.section_index)} unique sections across {self.total_files} files.")
@@ -179,6 +671,35 @@ class CCDASectionAnalyzer:
             logger.info(f"   Avg. Entries: {data['avg_entries']:.1f}")
             logger.info(f"   Avg. Coded Elements: {data['avg_coded_elements']:.1f}")
             logger.info(f"   Avg. Text Length: {data['avg_text_length']:.1f} words")
+            logger.info(f"   Avg. Tokens: {data['avg_tokens']:.1f}")
+
+# Per-process analyzer used by pool workers, created once by _init_worker
+_worker_analyzer = None
+
+def _init_worker(max_values: Optional[int] = None, matrix: bool = False, top_k: Optional[int] = None):
+    """Create the section analyzer for this worker process."""
+    global _worker_analyzer
+    _worker_analyzer = CCDASectionAnalyzer(max_values, matrix=matrix, top_k=top_k)
+
+def _index_batch_worker(files: List[str]) -> SectionIndex:
+    """Index a batch of files inside a pool worker and return the partial index."""
+    _worker_analyzer.section_index = SectionIndex(
+        _worker_analyzer.max_values, _worker_analyzer.build_matrix, _worker_analyzer.top_k
+    )
+    for xml_file in files:
+        _worker_analyzer.analyze_file(xml_file)
+    _worker_analyzer.total_files = len(files)
+    return _worker_analyzer.section_index
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """Parse a K/N shard specification."""
+    try:
+        k, n = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Shard must look like K/N, got '{value}'")
+    if n < 1 or not 0 <= k < n:
+        raise argparse.ArgumentTypeError(f"Shard K/N needs 0 <= K < N, got '{value}'")
+    return k, n
 
 def main():
     parser = argparse.ArgumentParser(
@@ -206,6 +727,99 @@ def main():
         default=8000,
         help='Memory limit in MB for processing'
     )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Number of worker processes used to index files'
+    )
+    parser.add_argument(
+        '--checkpoint-dir',
+        default='output/temp/section_checkpoints',
+        help='Directory for section index snapshots'
+    )
+    parser.add_argument(
+        '--checkpoint-interval',
+        type=float,
+        default=300,
+        help='Seconds between section index snapshots'
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='Resume from the last snapshot in --checkpoint-dir, skipping files it covers'
+    )
+    parser.add_argument(
+        '--db',
+        help='Persistent section database directory; only files new to it are analyzed'
+    )
+    parser.add_argument(
+        '--report-only',
+        action='store_true',
+        help='With --db, write the section index from the database without analyzing files'
+    )
+    parser.add_argument(
+        '--max-values',
+        type=int,
+        help='Keep at most this many distinct codes and titles per section (default: all)'
+    )
+    parser.add_argument(
+        '--top-k',
+        type=int,
+        help='Fixed memory per section: report the K most frequent templateIds, codes and '
+             'titles and estimate distinct counts instead of keeping every value'
+    )
+    parser.add_argument(
+        '--matrix',
+        action='store_true',
+        help='Also save a sparse file x section matrix next to the output (<output>.matrix)'
+    )
+    parser.add_argument(
+        '--sample',
+        action='store_true',
+        help='Estimate the index from a random sample of files, stopping once estimates converge'
+    )
+    parser.add_argument(
+        '--precision',
+        type=float,
+        default=0.01,
+        help='Sample mode: target confidence half-width of section frequencies'
+    )
+    parser.add_argument(
+        '--relative-precision',
+        type=float,
+        default=0.05,
+        help='Sample mode: target confidence half-width of averages, relative to the average'
+    )
+    parser.add_argument(
+        '--confidence',
+        type=float,
+        default=0.95,
+        help='Sample mode: confidence level of the intervals'
+    )
+    parser.add_argument(
+        '--min-sample',
+        type=int,
+        default=500,
+        help='Sample mode: minimum number of files to analyze before checking convergence'
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='Sample mode: random seed for the file order'
+    )
+    parser.add_argument(
+        '--shard',
+        type=parse_shard,
+        help='Only index shard K of N (e.g. 0/4) and write a partial index to --output-file'
+    )
+    parser.add_argument(
+        '--merge',
+        nargs='+',
+        metavar='PARTIAL',
+        help='Merge partial index files written with --shard, in shard order, and write the section index'
+    )
     parser.add_argument(
         '--debug',
         action='store_true',
@@ -213,16 +827,54 @@ def main():
     )
     
     args = parser.parse_args()
+    if args.top_k is not None and args.max_values is not None:
+        parser.error('--top-k and --max-values are alternative ways to bound memory; use one')
     
     if args.debug:
         logger.setLevel(logging.DEBUG)
     
-    analyzer = CCDASectionAnalyzer()
+    analyzer = CCDASectionAnalyzer(args.max_values, args.checkpoint_dir, args.checkpoint_interval,
+                                   args.matrix, args.top_k)
+    if args.merge:
+        analyzer.merge_partials(args.merge, args.output_file)
+        return
+    
+    if args.sample:
+        analyzer.analyze_sample(
+            args.input_dir,
+            args.output_file,
+            args.batch_size,
+            args.memory_limit,
+            args.precision,
+            args.relative_precision,
+            args.confidence,
+            args.min_sample,
+            args.seed
+        )
+        return
+    
+    if args.db:
+        if args.report_only:
+            analyzer.report_from_db(args.db, args.output_file)
+        else:
+            analyzer.update_db(
+                args.db,
+                args.input_dir,
+                args.output_file,
+                args.batch_size,
+                args.memory_limit,
+                args.workers
+            )
+        return
+    
     analyzer.analyze_directory(
         args.input_dir,
         args.output_file,
         args.batch_size,
-        args.memory_limit
+        args.memory_limit,
+        args.workers,
+        args.shard,
+        args.resume
     )
 
 if __name__ == '__main__':
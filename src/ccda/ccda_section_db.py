@@ -0,0 +1,134 @@
+"""
+CCDA Section Index Database
+
+Persistent section statistics that grow with each new drop of CCDAs.
+
+Layout of the database directory:
+- section_index.json: the merged SectionIndex (counts, sums, value sets and
+  example files per section) and the size of the file log it covers
+- section_files.tsv: FileFingerprints of every ingested file
+- section_matrix/: with matrix enabled, the SectionMatrix row of every
+  ingested file, in ingestion order; each commit appends the new rows
+
+Adding a directory only analyzes files whose path and content are not in the
+database (a moved or re-delivered copy of an ingested document is skipped) and
+merges them into the stored index, so counts, sums and example lists are
+updated incrementally. Reports are built from the stored index alone, in
+O(#sections).
+
+The file log is appended and synced before the index is replaced, and the
+index records the log size it covers. After a crash between the two, the
+extra log lines are dropped on open and those files are ingested again.
+The matrix is saved first and cut back to the index's file count on open.
+
+Section statistics cannot be retracted, so a file whose content changed
+after it was ingested is reported and skipped; rebuild the database to
+refresh it.
+"""
+
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from ccda_document_source import document_digest, document_stat
+from ccda_file_fingerprints import FileFingerprints, Fingerprint
+from ccda_section_index import SectionIndex
+from ccda_section_matrix import SectionMatrix
+
+logger = logging.getLogger(__name__)
+
+class SectionIndexDB:
+    """A SectionIndex on disk plus the files it was built from."""
+
+    def __init__(self, db_dir: str, max_values: Optional[int] = None, matrix: bool = False,
+                 top_k: Optional[int] = None):
+        self.db_dir = Path(db_dir)
+        self.db_dir.mkdir(exist_ok=True, parents=True)
+        self.index_file = self.db_dir / 'section_index.json'
+        self.files_log = self.db_dir / 'section_files.tsv'
+        self.matrix_dir = self.db_dir / 'section_matrix'
+        self.index = SectionIndex(max_values, matrix, top_k)
+
+        files_size = 0
+        if self.index_file.exists():
+            with open(self.index_file) as f:
+                data = json.load(f)
+            self.index = SectionIndex.from_json(data['index'], max_values, top_k)
+            files_size = data['files_size']
+            logger.info(f"Loaded section index of {self.index.total_files} files "
+                        f"({len(self.index)} sections) from {self.db_dir}")
+
+        if matrix:
+            self._load_matrix()
+
+        self._rollback_files(files_size)
+        self.files = FileFingerprints(str(self.db_dir), 'section_files')
+
+    def _load_matrix(self):
+        """Attach the stored matrix, without rows the index does not cover."""
+        if (self.matrix_dir / 'meta.json').exists():
+            self.index.matrix = SectionMatrix.load(self.matrix_dir)
+            self.index.matrix.truncate(self.index.total_files)
+        else:
+            self.index.matrix = SectionMatrix()
+        if len(self.index.matrix) != self.index.total_files:
+            raise ValueError(f"Section matrix in {self.db_dir} covers {len(self.index.matrix)} of "
+                             f"{self.index.total_files} files; rebuild the database with the matrix enabled")
+
+    def _rollback_files(self, files_size: int):
+        """Drop file records written after the last index commit."""
+        if self.files_log.exists() and self.files_log.stat().st_size > files_size:
+            logger.warning(f"Dropping file records in {self.files_log} that are not in the "
+                           f"stored index; those files will be ingested again")
+            with open(self.files_log, 'r+b') as f:
+                f.truncate(files_size)
+
+    def pending(self, xml_files: Sequence[str]) -> Tuple[List[str], Dict[str, Fingerprint]]:
+        """
+        Return the files not yet in the database, in order, and their fingerprints.
+        A file with the content of an ingested file, or of one earlier in
+        xml_files (a moved, re-delivered or repackaged document), is skipped
+        so its sections are not counted twice.
+        """
+        new_files = []
+        fingerprints = {}
+        new_digests = set()
+        duplicates = 0
+        for file_path in xml_files:
+            stat = document_stat(file_path)
+            recorded = self.files.by_path.get(file_path)
+            if recorded is not None:
+                if not self.files.is_unchanged(file_path, stat) and document_digest(file_path) != recorded[2]:
+                    logger.warning(f"{file_path} changed since it was ingested; its statistics "
+                                   f"cannot be updated in place, rebuild the database to refresh it")
+                continue
+            digest = document_digest(file_path)
+            if self.files.has_digest(digest) or digest in new_digests:
+                logger.debug(f"{file_path} has the content of an ingested file, skipping it")
+                duplicates += 1
+                continue
+            new_digests.add(digest)
+            new_files.append(file_path)
+            fingerprints[file_path] = (stat.st_size, stat.st_mtime_ns, digest)
+        if duplicates:
+            logger.info(f"Skipped {duplicates} files whose content is already in {self.db_dir}")
+        return new_files, fingerprints
+
+    def commit(self, fingerprints: Dict[str, Fingerprint]):
+        """
+        Persist the index after the files in fingerprints were merged into it.
+        """
+        if self.index.matrix is not None:
+            self.index.matrix.save(self.matrix_dir)
+        self.files.record(fingerprints)
+        files_size = self.files_log.stat().st_size if self.files_log.exists() else 0
+
+        tmp_file = self.index_file.with_name(self.index_file.name + '.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump({'files_size': files_size, 'index': self.index.to_json()}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.index_file)
+        logger.debug(f"Committed section index of {self.index.total_files} files to {self.db_dir}")
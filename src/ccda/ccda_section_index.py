@@ -0,0 +1,278 @@
+"""
+CCDA Section Index
+
+Mergeable partial section index for the section analyzer.
+
+Each section ID maps to a SectionStats aggregate (counts, templateId/code/title
+sets, entry/coded element/word/character/token totals and example files). Two partial indexes built over disjoint sets
+of files combine with merge(), so indexing can be split across worker
+processes or machine shards and reduced at the end. Merging is associative;
+example files keep the first five in merge order, so reducing partials in file
+order gives the same index as a single sequential run.
+
+Memory stays bounded on large corpora:
+- File membership is only ever reported as a count, so each section keeps the
+  number of distinct files it appears in, not their paths.
+- templateIds, codes and titles are insertion-ordered sets. With max_values
+  set, codes and titles stop growing at that many values per section and the
+  section is flagged as truncated in the report.
+- With top_k set they are fixed-size sketches instead (see
+  ccda_section_sketches): the report lists each section's top_k most frequent
+  values and estimates how many distinct values it has.
+
+Partial indexes can be written to JSON (to_json/from_json) to be merged on
+another machine. An index can also carry a SectionMatrix of per-file rows,
+which merge() appends; it is saved separately (see SectionMatrix.save).
+"""
+
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ccda_section_matrix import SectionMatrix
+from ccda_section_sketches import ValueSketch
+
+# Example files kept per section
+MAX_EXAMPLE_FILES = 5
+
+def _hashable(value):
+    """JSON turns (code, codeSystem) pairs into lists; make them tuples again."""
+    return tuple(value) if isinstance(value, list) else value
+
+def _add_values(values: Dict, new_values: Iterable, max_values: Optional[int] = None) -> bool:
+    """
+    Add new_values to an insertion-ordered set (a dict with None values).
+    Returns True if values were dropped because the set holds max_values.
+    """
+    for value in new_values:
+        if value in values:
+            continue
+        if max_values is not None and len(values) >= max_values:
+            return True
+        values[value] = None
+    return False
+
+class SectionStats:
+    """Aggregated metadata and metrics for one section ID."""
+
+    __slots__ = ('count', 'file_count', 'template_ids', 'codes', 'titles',
+                 'codes_truncated', 'titles_truncated',
+                 'total_entries', 'total_coded_elements', 'total_text_length',
+                 'total_chars', 'total_tokens', 'example_files', 'top_k')
+
+    def __init__(self, top_k: Optional[int] = None):
+        self.count = 0
+        self.file_count = 0
+        # Insertion-ordered sets, or sketches of the top_k values
+        self.top_k = top_k
+        if top_k is None:
+            self.template_ids: Dict[str, None] = {}
+            self.codes: Dict = {}
+            self.titles: Dict[str, None] = {}
+        else:
+            self.template_ids = ValueSketch(top_k)
+            self.codes = ValueSketch(top_k)
+            self.titles = ValueSketch(top_k)
+        self.codes_truncated = False
+        self.titles_truncated = False
+        self.total_entries = 0
+        self.total_coded_elements = 0
+        self.total_text_length = 0
+        self.total_chars = 0
+        self.total_tokens = 0
+        self.example_files: List[str] = []
+
+    def add(self, section_data: Dict, file_path: str, first_in_file: bool = True,
+            max_values: Optional[int] = None):
+        """
+        Add one occurrence of the section, as returned by analyze_section.
+        first_in_file is False for repeats of the section within the same file.
+        """
+        self.count += 1
+        if first_in_file:
+            self.file_count += 1
+        if self.top_k is not None:
+            self.template_ids.update(section_data['template_ids'])
+            self.codes.update(section_data['codes'])
+            self.titles.update(section_data['titles'])
+        else:
+            _add_values(self.template_ids, section_data['template_ids'])
+            if _add_values(self.codes, section_data['codes'], max_values):
+                self.codes_truncated = True
+            if _add_values(self.titles, section_data['titles'], max_values):
+                self.titles_truncated = True
+        self.total_entries += section_data['entry_count']
+        self.total_coded_elements += section_data['coded_element_count']
+        self.total_text_length += section_data['text_length']
+        self.total_chars += section_data['char_count']
+        self.total_tokens += section_data['token_count']
+
+        if len(self.example_files) < MAX_EXAMPLE_FILES:
+            self.example_files.append(file_path)
+
+    def merge(self, other: 'SectionStats', max_values: Optional[int] = None):
+        """Fold in the stats of files that come after this partial's files."""
+        self.count += other.count
+        self.file_count += other.file_count
+        if self.top_k is not None:
+            self.template_ids.merge(other.template_ids)
+            self.codes.merge(other.codes)
+            self.titles.merge(other.titles)
+        else:
+            _add_values(self.template_ids, other.template_ids)
+            if _add_values(self.codes, other.codes, max_values) or other.codes_truncated:
+                self.codes_truncated = True
+            if _add_values(self.titles, other.titles, max_values) or other.titles_truncated:
+                self.titles_truncated = True
+        self.total_entries += other.total_entries
+        self.total_coded_elements += other.total_coded_elements
+        self.total_text_length += other.total_text_length
+        self.total_chars += other.total_chars
+        self.total_tokens += other.total_tokens
+
+        missing = MAX_EXAMPLE_FILES - len(self.example_files)
+        if missing > 0:
+            self.example_files.extend(other.example_files[:missing])
+
+    def summary(self, total_files: int) -> Dict:
+        """Build the section_analysis.json entry for this section."""
+        count = self.count
+        summary = {
+            'count': count,
+            'frequency': count / total_files,
+            'files': self.file_count,
+            'template_ids': list(self.template_ids),
+            'codes': list(self.codes),
+            'titles': list(self.titles),
+            'total_entries': self.total_entries,
+            'avg_entries': self.total_entries / count if count > 0 else 0,
+            'total_coded_elements': self.total_coded_elements,
+            'avg_coded_elements': self.total_coded_elements / count if count > 0 else 0,
+            'total_text_length': self.total_text_length,
+            'avg_text_length': self.total_text_length / count if count > 0 else 0,
+            'total_chars': self.total_chars,
+            'avg_chars': self.total_chars / count if count > 0 else 0,
+            'total_tokens': self.total_tokens,
+            'avg_tokens': self.total_tokens / count if count > 0 else 0,
+            'example_files': self.example_files[:MAX_EXAMPLE_FILES]
+        }
+        if self.codes_truncated:
+            summary['codes_truncated'] = True
+        if self.titles_truncated:
+            summary['titles_truncated'] = True
+        if self.top_k is not None:
+            summary['distinct_template_ids'] = self.template_ids.distinct.estimate()
+            summary['distinct_codes'] = self.codes.distinct.estimate()
+            summary['distinct_titles'] = self.titles.distinct.estimate()
+        return summary
+
+    def _values_json(self, values):
+        return values.to_json() if self.top_k is not None else list(values)
+
+    def to_json(self) -> Dict:
+        """Serialize the full partial state."""
+        return {
+            'count': self.count,
+            'files': self.file_count,
+            'template_ids': self._values_json(self.template_ids),
+            'codes': self._values_json(self.codes),
+            'titles': self._values_json(self.titles),
+            'codes_truncated': self.codes_truncated,
+            'titles_truncated': self.titles_truncated,
+            'total_entries': self.total_entries,
+            'total_coded_elements': self.total_coded_elements,
+            'total_text_length': self.total_text_length,
+            'total_chars': self.total_chars,
+            'total_tokens': self.total_tokens,
+            'example_files': self.example_files
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict, top_k: Optional[int] = None) -> 'SectionStats':
+        """Rebuild partial stats written by to_json with the same top_k."""
+        stats = cls(top_k)
+        stats.count = data['count']
+        stats.file_count = data['files']
+        if top_k is not None:
+            stats.template_ids = ValueSketch.from_json(top_k, data['template_ids'])
+            stats.codes = ValueSketch.from_json(top_k, data['codes'])
+            stats.titles = ValueSketch.from_json(top_k, data['titles'])
+        else:
+            stats.template_ids = dict.fromkeys(data['template_ids'])
+            stats.codes = dict.fromkeys(_hashable(code) for code in data['codes'])
+            stats.titles = dict.fromkeys(data['titles'])
+        stats.codes_truncated = data.get('codes_truncated', False)
+        stats.titles_truncated = data.get('titles_truncated', False)
+        stats.total_entries = data['total_entries']
+        stats.total_coded_elements = data['total_coded_elements']
+        stats.total_text_length = data['total_text_length']
+        # Partials written before character and token counts were kept
+        stats.total_chars = data.get('total_chars', 0)
+        stats.total_tokens = data.get('total_tokens', 0)
+        stats.example_files = list(data['example_files'])
+        return stats
+
+class SectionIndex:
+    """Section ID -> SectionStats over a set of analyzed files."""
+
+    __slots__ = ('sections', 'total_files', 'max_values', 'top_k', 'matrix')
+
+    def __init__(self, max_values: Optional[int] = None, matrix: bool = False,
+                 top_k: Optional[int] = None):
+        self.sections: Dict[str, SectionStats] = {}
+        self.total_files = 0
+        # Per-section cap on distinct codes and titles; None keeps them all
+        self.max_values = max_values
+        # Per-section sketches of the top_k values instead of value sets
+        self.top_k = top_k
+        # Optional file x section rows, one per indexed file
+        self.matrix: Optional[SectionMatrix] = SectionMatrix() if matrix else None
+
+    def add(self, section_id: str, section_data: Dict, file_path: str, first_in_file: bool = True):
+        """Add one section occurrence found in file_path."""
+        stats = self.sections.get(section_id)
+        if stats is None:
+            stats = self.sections[section_id] = SectionStats(self.top_k)
+        stats.add(section_data, file_path, first_in_file, self.max_values)
+
+    def merge(self, other: 'SectionIndex') -> 'SectionIndex':
+        """
+        Fold another partial index into this one and return self.
+        The other index must cover files that come after this one's.
+        """
+        for section_id, other_stats in other.sections.items():
+            stats = self.sections.get(section_id)
+            if stats is None:
+                stats = self.sections[section_id] = SectionStats(self.top_k)
+            stats.merge(other_stats, self.max_values)
+        self.total_files += other.total_files
+        if self.matrix is not None and other.matrix is not None:
+            self.matrix.append(other.matrix)
+        return self
+
+    def __len__(self) -> int:
+        return len(self.sections)
+
+    def items(self) -> Iterator[Tuple[str, SectionStats]]:
+        return iter(self.sections.items())
+
+    def to_json(self) -> Dict:
+        """Serialize this partial index for merging elsewhere."""
+        return {
+            'total_files': self.total_files,
+            'top_k': self.top_k,
+            'sections': {
+                section_id: stats.to_json()
+                for section_id, stats in self.sections.items()
+            }
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict, max_values: Optional[int] = None,
+                  top_k: Optional[int] = None) -> 'SectionIndex':
+        """Rebuild a partial index written by to_json (without its matrix)."""
+        if data.get('top_k') != top_k:
+            raise ValueError(f"Index was built with top_k={data.get('top_k')}, not top_k={top_k}")
+        index = cls(max_values, top_k=top_k)
+        index.total_files = data['total_files']
+        for section_id, stats in data['sections'].items():
+            index.sections[section_id] = SectionStats.from_json(stats, top_k)
+        return index
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+CCDA Section Matrix
+
+Sparse file x section matrix kept by the section analyzer (--matrix), so
+questions about which sections appear together can be answered without
+rescanning the corpus.
+
+The matrix is stored in CSR form: indptr (one offset per file row), indices
+(section columns) and one value array per metric layer, all parallel to
+indices. Each stored cell is a section present in a file; its layers hold the
+section's occurrences in the file and its summed entries, coded elements,
+words, characters and tokens. Rows are files in the order they were indexed;
+columns are section IDs in first-seen order, matching the section index.
+
+Partial matrices built over consecutive sets of files combine with append(),
+alongside SectionIndex.merge(). Matrices are saved in a .matrix directory
+next to the JSON they belong to (save/load), one raw file per array:
+- meta.json: the committed length of each array, replaced last on every save
+- files.bin / file_ends.bin: UTF-8 file paths and the end offset of each one
+- sections.bin / section_ends.bin: section IDs, likewise
+- row_ends.bin, indices.bin, layer_<name>.bin: the CSR arrays (indptr
+  without its leading 0)
+Saving a matrix again to the directory it was loaded from or last saved to
+only appends the rows added since, after cutting each file back to its
+committed length, so snapshots and database commits cost O(new files).
+
+The analytics below run vectorized over chunks of rows, so memory is bounded
+by the chunk size and section count:
+- co-occurrence counts (files containing both sections)
+- conditional frequencies P(section B | section A)
+- section bundles: the most common exact sets of sections per file
+"""
+
+import argparse
+import json
+import logging
+import os
+import uuid
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Metric layer -> section_data key it sums (occurrences counts sections)
+LAYERS = (
+    ('occurrences', None),
+    ('entries', 'entry_count'),
+    ('coded_elements', 'coded_element_count'),
+    ('words', 'text_length'),
+    ('chars', 'char_count'),
+    ('tokens', 'token_count'),
+)
+
+# Rows densified at a time by the analytics
+CHUNK_ROWS = 65536
+
+def matrix_path(json_file: str) -> Path:
+    """The directory holding the matrix that belongs with a JSON output."""
+    return Path(json_file).with_suffix('.matrix')
+
+def _encode_strings(strings: List[str], start: int) -> Tuple[bytes, np.ndarray]:
+    """UTF-8 bytes of strings and their end offsets, counted from start."""
+    encoded = [string.encode('utf-8', 'surrogateescape') for string in strings]
+    ends = np.cumsum([len(data) for data in encoded], dtype=np.int64) + start
+    return b''.join(encoded), ends
+
+def _decode_strings(data: bytes, ends: np.ndarray) -> List[str]:
+    starts = [0] + ends[:-1].tolist()
+    return [data[start:end].decode('utf-8', 'surrogateescape')
+            for start, end in zip(starts, ends.tolist())]
+
+def _append_file(path: Path, committed: int, data: bytes):
+    """Cut path back to its committed length, then append and sync data."""
+    with open(path, 'ab') as f:
+        f.truncate(committed)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+def _read_array(path: Path, dtype, count: int) -> np.ndarray:
+    return np.fromfile(path, dtype=dtype, count=count) if count else np.zeros(0, dtype=dtype)
+
+class SectionMatrix:
+    """File x section CSR matrix with one value array per metric layer."""
+
+    __slots__ = ('files', 'section_ids', 'columns', 'indptr', 'indices', 'layers', 'synced')
+
+    def __init__(self):
+        self.files: List[str] = []
+        self.section_ids: List[str] = []
+        self.columns: Dict[str, int] = {}
+        self.indptr = array('q', [0])
+        self.indices = array('i')
+        self.layers = [array('I') for _ in LAYERS]
+        # (directory, store ID, rows) of the directory whose first rows match ours
+        self.synced: Optional[Tuple[Path, str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def _column(self, section_id: str) -> int:
+        column = self.columns.get(section_id)
+        if column is None:
+            column = self.columns[section_id] = len(self.section_ids)
+            self.section_ids.append(section_id)
+        return column
+
+    def add_file(self, file_path: str, occurrences: Iterable[Tuple[str, Dict]]):
+        """
+        Add a file's row from its (section ID, section_data) occurrences, as
+        built by analyze_section. A file without sections adds an empty row.
+        """
+        row: Dict[int, List[int]] = {}
+        for section_id, section_data in occurrences:
+            column = self._column(section_id)
+            values = row.get(column)
+            if values is None:
+                values = row[column] = [0] * len(LAYERS)
+            values[0] += 1
+            for i, (_, key) in enumerate(LAYERS[1:], 1):
+                values[i] += section_data[key]
+
+        for column in sorted(row):
+            self.indices.append(column)
+            for layer, value in zip(self.layers, row[column]):
+                layer.append(value)
+        self.indptr.append(len(self.indices))
+        self.files.append(file_path)
+
+    def append(self, other: 'SectionMatrix') -> 'SectionMatrix':
+        """
+        Append the rows of a matrix over the files that come after this
+        one's and return self. Columns are remapped to this matrix's.
+        """
+        if not len(other):
+            return self
+        remap = np.array([self._column(section_id) for section_id in other.section_ids], dtype=np.int32)
+        other_indptr = np.frombuffer(other.indptr, dtype=np.int64)
+        columns = remap[np.frombuffer(other.indices, dtype=np.int32)]
+        # Keep columns sorted within each row
+        rows = np.repeat(np.arange(len(other)), np.diff(other_indptr))
+        order = np.lexsort((columns, rows))
+
+        offset = self.indptr[-1]
+        self.indptr.extend((other_indptr[1:] + offset).tolist())
+        self.indices.frombytes(columns[order].tobytes())
+        for layer, other_layer in zip(self.layers, other.layers):
+            layer.frombytes(np.frombuffer(other_layer, dtype=np.uint32)[order].tobytes())
+        self.files.extend(other.files)
+        return self
+
+    def truncate(self, n_files: int):
+        """Drop rows past the first n_files (written after the last commit)."""
+        if n_files >= len(self):
+            return
+        # Slices are copies, so NumPy views of the old arrays stay valid
+        end = self.indptr[n_files]
+        del self.files[n_files:]
+        self.indptr = self.indptr[:n_files + 1]
+        self.indices = self.indices[:end]
+        self.layers = [layer[:end] for layer in self.layers]
+        if self.synced is not None:
+            self.synced = self.synced[:2] + (min(self.synced[2], n_files),)
+
+    def save(self, path: Path):
+        """
+        Write the matrix to a .matrix directory. If the directory holds an
+        earlier save of this matrix, only the rows added since are appended.
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        meta_file = path / 'meta.json'
+        meta = None
+        if self.synced is not None and self.synced[0] == path and meta_file.exists():
+            with open(meta_file) as f:
+                meta = json.load(f)
+            if meta['store_id'] != self.synced[1]:
+                meta = None
+
+        if meta is None:
+            # A new store: written from the first row
+            meta = {'store_id': uuid.uuid4().hex, 'files': 0, 'file_bytes': 0,
+                    'sections': 0, 'section_bytes': 0, 'cells': 0}
+            rows = 0
+        else:
+            rows = self.synced[2]
+            if rows < meta['files']:
+                # Rows past ours were cut by truncate; drop them on disk too
+                meta['file_bytes'] = int(_read_array(path / 'file_ends.bin', np.int64, rows)[-1]) if rows else 0
+                meta['files'] = rows
+                meta['cells'] = self.indptr[rows]
+        cells = meta['cells']
+        sections = meta['sections']
+
+        file_data, file_ends = _encode_strings(self.files[rows:], meta['file_bytes'])
+        _append_file(path / 'files.bin', meta['file_bytes'], file_data)
+        _append_file(path / 'file_ends.bin', rows * 8, file_ends.tobytes())
+        section_data, section_ends = _encode_strings(self.section_ids[sections:], meta['section_bytes'])
+        _append_file(path / 'sections.bin', meta['section_bytes'], section_data)
+        _append_file(path / 'section_ends.bin', sections * 8, section_ends.tobytes())
+        _append_file(path / 'row_ends.bin', rows * 8, self.indptr[rows + 1:].tobytes())
+        _append_file(path / 'indices.bin', cells * 4, self.indices[cells:].tobytes())
+        for (name, _), layer in zip(LAYERS, self.layers):
+            _append_file(path / f'layer_{name}.bin', cells * 4, layer[cells:].tobytes())
+
+        # The new lengths only count once meta.json is replaced
+        meta.update({
+            'files': len(self),
+            'file_bytes': meta['file_bytes'] + len(file_data),
+            'sections': len(self.section_ids),
+            'section_bytes': meta['section_bytes'] + len(section_data),
+            'cells': len(self.indices)
+        })
+        tmp_file = meta_file.with_name(meta_file.name + '.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, meta_file)
+        self.synced = (path, meta['store_id'], len(self))
+        logger.debug(f"Saved {len(self)} x {len(self.section_ids)} section matrix to {path} "
+                     f"({len(self) - rows} new rows)")
+
+    @classmethod
+    def load(cls, path: Path) -> 'SectionMatrix':
+        """Read a matrix written by save, up to its last committed save."""
+        path = Path(path)
+        with open(path / 'meta.json') as f:
+            meta = json.load(f)
+        matrix = cls()
+        with open(path / 'files.bin', 'rb') as f:
+            matrix.files = _decode_strings(f.read(meta['file_bytes']),
+                                           _read_array(path / 'file_ends.bin', np.int64, meta['files']))
+        with open(path / 'sections.bin', 'rb') as f:
+            section_ids = _decode_strings(f.read(meta['section_bytes']),
+                                          _read_array(path / 'section_ends.bin', np.int64, meta['sections']))
+        for section_id in section_ids:
+            matrix._column(section_id)
+        matrix.indptr.frombytes(_read_array(path / 'row_ends.bin', np.int64, meta['files']).tobytes())
+        matrix.indices = array('i', _read_array(path / 'indices.bin', np.int32, meta['cells']).tobytes())
+        matrix.layers = [array('I', _read_array(path / f'layer_{name}.bin', np.uint32, meta['cells']).tobytes())
+                         for name, _ in LAYERS]
+        matrix.synced = (path, meta['store_id'], len(matrix))
+        return matrix
+
+    # Analytics
+
+    def layer(self, name: str) -> np.ndarray:
+        """Values of a metric layer, parallel to the stored cells."""
+        names = [layer_name for layer_name, _ in LAYERS]
+        return np.frombuffer(self.layers[names.index(name)], dtype=np.uint32)
+
+    def file_counts(self) -> np.ndarray:
+        """Number of files containing each section."""
+        return np.bincount(np.frombuffer(self.indices, dtype=np.int32),
+                           minlength=len(self.section_ids))
+
+    def layer_totals(self, name: str) -> np.ndarray:
+        """Sum of a metric layer over all files, per section."""
+        return np.bincount(np.frombuffer(self.indices, dtype=np.int32),
+                           weights=self.layer(name), minlength=len(self.section_ids))
+
+    def _presence_chunks(self, chunk_rows: int = CHUNK_ROWS) -> Iterator[np.ndarray]:
+        """Dense 0/1 file x section blocks of at most chunk_rows rows."""
+        indptr = np.frombuffer(self.indptr, dtype=np.int64)
+        indices = np.frombuffer(self.indices, dtype=np.int32)
+        for start in range(0, len(self), chunk_rows):
+            end = min(start + chunk_rows, len(self))
+            lo, hi = indptr[start], indptr[end]
+            rows = np.repeat(np.arange(end - start), np.diff(indptr[start:end + 1]))
+            block = np.zeros((end - start, len(self.section_ids)), dtype=np.uint8)
+            block[rows, indices[lo:hi]] = 1
+            yield block
+
+    def cooccurrence(self) -> np.ndarray:
+        """
+        Section x section counts of files containing both sections; the
+        diagonal holds each section's file count.
+        """
+        k = len(self.section_ids)
+        counts = np.zeros((k, k), dtype=np.int64)
+        for block in self._presence_chunks():
+            # float32 sums are exact up to 2**24 rows per block
+            block = block.astype(np.float32)
+            counts += (block.T @ block).astype(np.int64)
+        return counts
+
+    def conditional_frequencies(self, counts: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        P(column section | row section): the share of files containing the
+        row section that also contain the column section.
+        """
+        if counts is None:
+            counts = self.cooccurrence()
+        totals = np.diag(counts).astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(totals[:, None] > 0, counts / totals[:, None], 0.0)
+
+    def bundles(self) -> List[Tuple[Tuple[str, ...], int]]:
+        """Exact sets of sections per file and their file counts, most common first."""
+        k = len(self.section_ids)
+        patterns = Counter()
+        for block in self._presence_chunks():
+            keys, counts = np.unique(np.packbits(block, axis=1), axis=0, return_counts=True)
+            for key, count in zip(keys, counts):
+                patterns[key.tobytes()] += int(count)
+
+        bundles = []
+        for key, count in patterns.items():
+            present = np.unpackbits(np.frombuffer(key, dtype=np.uint8))[:k]
+            bundles.append((tuple(self.section_ids[i] for i in np.flatnonzero(present)), count))
+        bundles.sort(key=lambda bundle: (-bundle[1], len(bundle[0]), bundle[0]))
+        return bundles
+
+def build_report(matrix: SectionMatrix, top: int = 20, min_files: int = 1) -> Dict:
+    """Co-occurrence and bundle report for the top section pairs and bundles."""
+    n_files = len(matrix)
+    counts = matrix.cooccurrence()
+    conditional = matrix.conditional_frequencies(counts)
+    file_counts = np.diag(counts)
+    tokens = matrix.layer_totals('tokens')
+
+    sections = {
+        section_id: {
+            'files': int(file_counts[i]),
+            'frequency': file_counts[i] / n_files if n_files else 0,
+            'avg_tokens': tokens[i] / file_counts[i] if file_counts[i] else 0
+        }
+        for i, section_id in enumerate(matrix.section_ids)
+    }
+
+    # Section pairs, most files first
+    a, b = np.triu_indices(len(matrix.section_ids), 1)
+    pair_counts = counts[a, b]
+    keep = pair_counts >= min_files
+    a, b, pair_counts = a[keep], b[keep], pair_counts[keep]
+    order = np.argsort(-pair_counts, kind='stable')[:top]
+    pairs = []
+    for i, j, both in zip(a[order], b[order], pair_counts[order]):
+        pairs.append({
+            'sections': [matrix.section_ids[i], matrix.section_ids[j]],
+            'files': int(both),
+            'p_second_given_first': float(conditional[i, j]),
+            'p_first_given_second': float(conditional[j, i]),
+            'lift': float(both * n_files / (file_counts[i] * file_counts[j]))
+        })
+
+    bundles = [
+        {'sections': list(section_ids), 'files': count, 'share': count / n_files}
+        for section_ids, count in matrix.bundles()[:top]
+        if count >= min_files
+    ]
+
+    return {
+        'files': n_files,
+        'sections': sections,
+        'cooccurrence': pairs,
+        'bundles': bundles
+    }
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Section co-occurrence and bundle analytics from a saved section matrix'
+    )
+    parser.add_argument(
+        '--matrix-dir',
+        default='output/analysis/metrics/section_analysis.matrix',
+        help='Section matrix directory written by ccda_section_analyzer.py --matrix'
+    )
+    parser.add_argument(
+        '--output-file',
+        default='output/analysis/metrics/section_cooccurrence.json',
+        help='Output JSON file for the co-occurrence report'
+    )
+    parser.add_argument(
+        '--top',
+        type=int,
+        default=20,
+        help='Number of section pairs and bundles to report'
+    )
+    parser.add_argument(
+        '--min-files',
+        type=int,
+        default=1,
+        help='Only report pairs and bundles found in at least this many files'
+    )
+
+    args = parser.parse_args()
+
+    # Configured here rather than at import, as the section analyzer, index
+    # and database import this module
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    matrix = SectionMatrix.load(args.matrix_dir)
+    logger.info(f"Loaded section matrix of {len(matrix)} files and {len(matrix.section_ids)} sections")
+    report = build_report(matrix, args.top, args.min_files)
+    with open(args.output_file, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Co-occurrence report saved to {args.output_file}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+CCDA Section Sampling
+
+Confidence intervals for section statistics estimated from a random sample
+of files, used by the section analyzer's --sample mode.
+
+The config generator only needs each section's frequency (occurrences per
+file) and its average entries, coded elements, text length and tokens per
+occurrence. For every section the sampler keeps running sums and sums of
+squares of:
+- occurrences per sampled file, for the frequency
+- entries, coded elements, words and tokens per occurrence, for the averages
+
+Half-widths use a normal approximation with a finite population correction,
+so they shrink to zero as the sample approaches the whole corpus. Sampling
+has converged once, after a minimum sample, every frequency is within the
+absolute precision and every average of a section seen often enough is
+within the relative precision.
+"""
+
+import math
+import random
+from statistics import NormalDist
+from typing import Dict, List, Sequence
+
+# Averages of sections seen fewer times than this are not checked for
+# convergence; their frequency interval still is
+MIN_OCCURRENCES = 30
+
+# section_data key -> section_analysis.json average it estimates
+METRICS = (
+    ('entry_count', 'avg_entries'),
+    ('coded_element_count', 'avg_coded_elements'),
+    ('text_length', 'avg_text_length'),
+    ('token_count', 'avg_tokens'),
+)
+
+def sample_order(files: Sequence, seed: int = 0) -> List:
+    """Return the files in a reproducible random order."""
+    ordered = list(files)
+    random.Random(seed).shuffle(ordered)
+    return ordered
+
+class _SectionSums:
+    """Running sums for one section."""
+
+    __slots__ = ('file_sum', 'file_sumsq', 'occurrences', 'metric_sums', 'metric_sumsqs')
+
+    def __init__(self):
+        self.file_sum = 0           # occurrences over all sampled files
+        self.file_sumsq = 0         # sum of squared occurrences per file
+        self.occurrences = 0
+        self.metric_sums = [0] * len(METRICS)
+        self.metric_sumsqs = [0] * len(METRICS)
+
+class SectionSampler:
+    """Tracks per-section confidence intervals while files are sampled."""
+
+    def __init__(self,
+                 population: int,
+                 precision: float = 0.01,
+                 relative_precision: float = 0.05,
+                 confidence: float = 0.95,
+                 min_sample: int = 500):
+        self.population = population
+        self.precision = precision
+        self.relative_precision = relative_precision
+        self.confidence = confidence
+        self.min_sample = min_sample
+        self.z = NormalDist().inv_cdf((1 + confidence) / 2)
+        self.sampled_files = 0
+        self.sections: Dict[str, _SectionSums] = {}
+        self._file_counts: Dict[str, int] = {}
+
+    def add_occurrence(self, section_id: str, section_data: Dict):
+        """Record one section occurrence in the file being analyzed."""
+        sums = self.sections.get(section_id)
+        if sums is None:
+            sums = self.sections[section_id] = _SectionSums()
+        sums.occurrences += 1
+        for i, (key, _) in enumerate(METRICS):
+            value = section_data[key]
+            sums.metric_sums[i] += value
+            sums.metric_sumsqs[i] += value * value
+        self._file_counts[section_id] = self._file_counts.get(section_id, 0) + 1
+
+    def end_file(self):
+        """Close the current file, including files that yielded no sections."""
+        for section_id, count in self._file_counts.items():
+            sums = self.sections[section_id]
+            sums.file_sum += count
+            sums.file_sumsq += count * count
+        self._file_counts = {}
+        self.sampled_files += 1
+
+    def _fpc(self, n: int) -> float:
+        """Finite population correction for a sample of n files."""
+        if self.population <= 1 or n >= self.population:
+            return 0.0
+        return math.sqrt((self.population - n) / (self.population - 1))
+
+    def _half_width(self, total: float, sumsq: float, n: int) -> float:
+        """Confidence half-width of a mean from its sum and sum of squares."""
+        if n < 2:
+            return math.inf
+        mean = total / n
+        variance = max(0.0, (sumsq - n * mean * mean) / (n - 1))
+        return self.z * math.sqrt(variance / n) * self._fpc(self.sampled_files)
+
+    def intervals(self, section_id: str) -> Dict[str, float]:
+        """Half-widths of the frequency and average estimates of a section."""
+        sums = self.sections[section_id]
+        result = {
+            'frequency': self._half_width(sums.file_sum, sums.file_sumsq, self.sampled_files)
+        }
+        for i, (_, name) in enumerate(METRICS):
+            result[name] = self._half_width(
+                sums.metric_sums[i], sums.metric_sumsqs[i], sums.occurrences
+            )
+        return result
+
+    def converged(self) -> bool:
+        """True once every estimate is within the target precision."""
+        if self.sampled_files < min(self.min_sample, self.population):
+            return False
+        for section_id, sums in self.sections.items():
+            half_widths = self.intervals(section_id)
+            if half_widths['frequency'] > self.precision:
+                return False
+            if sums.occurrences < MIN_OCCURRENCES:
+                continue
+            for i, (_, name) in enumerate(METRICS):
+                mean = sums.metric_sums[i] / sums.occurrences
+                if half_widths[name] > self.relative_precision * mean:
+                    return False
+        return True
@@ -0,0 +1,157 @@
+"""
+CCDA Section Sketches
+
+Fixed-size summaries of a section's templateIds, codes and titles, used by the
+section index in top-k mode (--top-k) instead of exact value sets:
+- HyperLogLog estimates the number of distinct values (2**HLL_PRECISION
+  one-byte registers, about 1.6% standard error)
+- Space-Saving keeps the top_k most frequent values with their counts; any
+  value seen more than 1/top_k of the time is guaranteed to be kept
+
+Each value counts once per section occurrence, so entry-level templateIds
+repeated inside one section do not crowd out the section's own IDs.
+
+Both summaries merge (partials from workers, shards or the section database)
+and round-trip through JSON. Merged Space-Saving counts are upper bounds, so
+the kept values of a merged run can differ slightly from a sequential run.
+"""
+
+import base64
+import hashlib
+from typing import Dict, Hashable, Iterable, List
+
+import numpy as np
+
+# 4096 registers
+HLL_PRECISION = 12
+
+class HyperLogLog:
+    """Distinct count estimate in 2**HLL_PRECISION bytes."""
+
+    __slots__ = ('registers',)
+
+    def __init__(self):
+        self.registers = bytearray(1 << HLL_PRECISION)
+
+    def add(self, value: Hashable):
+        # Unlike hash(), the same in every process, so partials can merge
+        h = int.from_bytes(hashlib.blake2b(repr(value).encode(), digest_size=8).digest(), 'big')
+        index = h >> (64 - HLL_PRECISION)
+        rest = h & ((1 << (64 - HLL_PRECISION)) - 1)
+        rank = (64 - HLL_PRECISION) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog'):
+        self.registers = bytearray(np.maximum(
+            np.frombuffer(self.registers, dtype=np.uint8),
+            np.frombuffer(other.registers, dtype=np.uint8)
+        ).tobytes())
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        registers = np.frombuffer(self.registers, dtype=np.uint8)
+        raw = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int32)))
+        zeros = int(np.count_nonzero(registers == 0))
+        # Linear counting is more accurate for small cardinalities
+        if raw <= 2.5 * m and zeros:
+            return round(m * np.log(m / zeros))
+        return round(raw)
+
+    def to_json(self) -> str:
+        return base64.b64encode(bytes(self.registers)).decode('ascii')
+
+    @classmethod
+    def from_json(cls, data: str) -> 'HyperLogLog':
+        sketch = cls()
+        sketch.registers = bytearray(base64.b64decode(data))
+        return sketch
+
+class SpaceSaving:
+    """The top_k most frequent values, with count upper bounds and errors."""
+
+    __slots__ = ('top_k', 'counters')
+
+    def __init__(self, top_k: int):
+        self.top_k = top_k
+        # value -> [count, overestimation]
+        self.counters: Dict[Hashable, List[int]] = {}
+
+    def add(self, value: Hashable):
+        counter = self.counters.get(value)
+        if counter is not None:
+            counter[0] += 1
+        elif len(self.counters) < self.top_k:
+            self.counters[value] = [1, 0]
+        else:
+            # Replace the least frequent value; the newcomer inherits its count
+            evicted = min(self.counters, key=lambda v: self.counters[v][0])
+            floor = self.counters.pop(evicted)[0]
+            self.counters[value] = [floor + 1, floor]
+
+    def _floor(self) -> int:
+        """Count any value missing from a full summary may have had."""
+        if len(self.counters) < self.top_k:
+            return 0
+        return min(counter[0] for counter in self.counters.values())
+
+    def merge(self, other: 'SpaceSaving'):
+        floor, other_floor = self._floor(), other._floor()
+        merged = {}
+        for value, (count, error) in self.counters.items():
+            other_count, other_error = other.counters.get(value, (other_floor, other_floor))
+            merged[value] = [count + other_count, error + other_error]
+        for value, (count, error) in other.counters.items():
+            if value not in merged:
+                merged[value] = [count + floor, error + floor]
+        ranked = sorted(merged.items(), key=lambda item: -item[1][0])[:self.top_k]
+        self.counters = dict(ranked)
+
+    def top(self) -> List[Hashable]:
+        """Kept values, most frequent first (ties in first-seen order)."""
+        return sorted(self.counters, key=lambda v: -self.counters[v][0])
+
+    def to_json(self) -> List:
+        return [[value, count, error] for value, (count, error) in self.counters.items()]
+
+    @classmethod
+    def from_json(cls, top_k: int, data: List) -> 'SpaceSaving':
+        sketch = cls(top_k)
+        # JSON turns (code, codeSystem) pairs into lists
+        sketch.counters = {
+            tuple(value) if isinstance(value, list) else value: [count, error]
+            for value, count, error in data
+        }
+        return sketch
+
+class ValueSketch:
+    """Distinct count and heavy hitters of one section's values."""
+
+    __slots__ = ('distinct', 'heavy_hitters')
+
+    def __init__(self, top_k: int):
+        self.distinct = HyperLogLog()
+        self.heavy_hitters = SpaceSaving(top_k)
+
+    def update(self, values: Iterable[Hashable]):
+        """Add the values of one section occurrence, each counted once."""
+        for value in dict.fromkeys(values):
+            self.distinct.add(value)
+            self.heavy_hitters.add(value)
+
+    def merge(self, other: 'ValueSketch'):
+        self.distinct.merge(other.distinct)
+        self.heavy_hitters.merge(other.heavy_hitters)
+
+    def __iter__(self):
+        return iter(self.heavy_hitters.top())
+
+    def to_json(self) -> Dict:
+        return {'hll': self.distinct.to_json(), 'top': self.heavy_hitters.to_json()}
+
+    @classmethod
+    def from_json(cls, top_k: int, data: Dict) -> 'ValueSketch':
+        sketch = cls(top_k)
+        sketch.distinct = HyperLogLog.from_json(data['hll'])
+        sketch.heavy_hitters = SpaceSaving.from_json(top_k, data['top'])
+        return sketch
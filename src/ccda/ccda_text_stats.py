@@ -0,0 +1,102 @@
+"""
+CCDA Text Statistics
+
+Streaming word, character and model-token counts for narrative text.
+
+Counts are accumulated one text node at a time, so a section's narrative is
+never joined into one string. Each node is whitespace-normalized (words joined
+by single spaces) before it is measured:
+- words: whitespace-separated words
+- chars: characters of the normalized node
+- tokens: tokens of the normalized node under TOKEN_ENCODING
+
+Token counts use tiktoken when it is installed. The encoder is loaded once per
+process and counts of recurring strings (table headers, boilerplate) are
+memoized. Without tiktoken, or when its encoding cannot be loaded, tokens are
+estimated as one per four characters.
+Summing per-node counts can differ from tokenizing the joined text by a token
+at some node boundaries, which does not matter for ranking documents.
+"""
+
+import logging
+from functools import lru_cache
+from typing import Callable, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# tiktoken encoding used for token counts
+TOKEN_ENCODING = 'cl100k_base'
+
+# Memoized token counts of recent distinct strings
+TOKEN_CACHE_SIZE = 65536
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count: one token per four characters."""
+    return (len(text) + 3) // 4
+
+@lru_cache(maxsize=None)
+def get_token_counter(encoding: str = TOKEN_ENCODING) -> Callable[[str], int]:
+    """Return this process's cached token counting function for an encoding."""
+    try:
+        import tiktoken
+    except ImportError:
+        logger.warning("tiktoken is not installed; estimating token counts from characters")
+        return estimate_tokens
+
+    try:
+        encoder = tiktoken.get_encoding(encoding)
+    except Exception as e:
+        # e.g. the BPE file cannot be downloaded on an offline host
+        logger.warning(f"Cannot load tiktoken encoding {encoding} ({e}); "
+                       f"estimating token counts from characters")
+        return estimate_tokens
+
+    @lru_cache(maxsize=TOKEN_CACHE_SIZE)
+    def count_tokens(text: str) -> int:
+        return len(encoder.encode_ordinary(text))
+
+    return count_tokens
+
+def clear_token_cache():
+    """Drop this process's memoized token counts, e.g. under memory pressure."""
+    counter = get_token_counter()
+    # The character estimate keeps no cache
+    if hasattr(counter, 'cache_clear'):
+        counter.cache_clear()
+
+def text_counts(text: str) -> Tuple[int, int, int]:
+    """(words, chars, tokens) of one text node."""
+    words = text.split()
+    if not words:
+        return 0, 0, 0
+    normalized = ' '.join(words)
+    return len(words), len(normalized), get_token_counter()(normalized)
+
+class TextStats:
+    """Running word, character and token counts."""
+
+    __slots__ = ('words', 'chars', 'tokens')
+
+    def __init__(self):
+        self.words = 0
+        self.chars = 0
+        self.tokens = 0
+
+    def add(self, text: str):
+        """Count one text node."""
+        words, chars, tokens = text_counts(text)
+        self.words += words
+        self.chars += chars
+        self.tokens += tokens
+
+    def add_counts(self, counts: Tuple[int, int, int]):
+        """Add counts already computed by text_counts."""
+        self.words += counts[0]
+        self.chars += counts[1]
+        self.tokens += counts[2]
+
+    def update(self, texts: Iterable[str]) -> 'TextStats':
+        """Count every text node in texts and return self."""
+        for text in texts:
+            self.add(text)
+        return self
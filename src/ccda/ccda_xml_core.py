@@ -0,0 +1,134 @@
+"""
+CCDA XML Core
+
+Shared XML plumbing for the CCDA scripts, so namespaces, XPath compilation and
+parser setup are done once per process instead of on every call:
+- CCDA_NS and Clark-notation tags for streaming (iterparse/iterwalk) code
+- Precompiled etree.XPath objects for the common queries; xpath() compiles
+  and caches any other query
+- A reusable parser per process and thread (pool workers each get their own)
+- Helpers for section IDs, patient demographics and narrative text
+
+remove_blank_text only ever drops text nodes made of XML whitespace. Section
+titles and patient names treat such text as empty, so they read the same from
+trees parsed with or without it (see ccda_pipeline.py).
+"""
+
+import threading
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from lxml import etree
+
+from ccda_text_stats import TextStats
+
+HL7_NS = 'urn:hl7-org:v3'
+
+# CCDA namespace
+CCDA_NS = {
+    'h': HL7_NS,
+    'xsi': 'http://www.w3.org/2001/XMLSchema-instance'
+}
+
+# Clark-notation tags
+SECTION_TAG = f'{{{HL7_NS}}}section'
+TEMPLATE_ID_TAG = f'{{{HL7_NS}}}templateId'
+CODE_TAG = f'{{{HL7_NS}}}code'
+TITLE_TAG = f'{{{HL7_NS}}}title'
+ENTRY_TAG = f'{{{HL7_NS}}}entry'
+TEXT_TAG = f'{{{HL7_NS}}}text'
+RECORD_TARGET_TAG = f'{{{HL7_NS}}}recordTarget'
+
+# Characters of the blank text remove_blank_text drops
+XML_WHITESPACE = ' \t\r\n'
+
+@lru_cache(maxsize=None)
+def xpath(expr: str) -> etree.XPath:
+    """Return expr compiled with the CCDA namespaces; each query is compiled once."""
+    return etree.XPath(expr, namespaces=CCDA_NS)
+
+# Document queries
+SECTIONS = xpath('//h:section')
+PATIENT_ROLE = xpath('./h:recordTarget/h:patientRole')
+PATIENT = xpath('.//h:recordTarget/h:patientRole/h:patient')
+
+# Section queries (relative to a section element)
+SECTION_TEMPLATE_IDS = xpath('.//h:templateId/@root')
+SECTION_CODES = xpath('./h:code/@code')
+SECTION_CODE_SYSTEMS = xpath('./h:code/@codeSystem')
+SECTION_TITLES = xpath('./h:title/text()[normalize-space()]')
+SECTION_ENTRIES = xpath('.//h:entry')
+CODED_ELEMENTS = xpath('.//*[@code]')
+NARRATIVE_TEXT = xpath('.//h:text//text()')
+
+# Patient queries (relative to a patient element)
+PATIENT_NAME = xpath('.//h:name')
+NAME_GIVEN = xpath('.//h:given')
+NAME_FAMILY = xpath('.//h:family')
+BIRTH_TIME = xpath('.//h:birthTime')
+
+_parsers = threading.local()
+
+def get_parser(remove_blank_text: bool = True) -> etree.XMLParser:
+    """Return this thread's reusable parser (lxml parsers are not thread-safe)."""
+    cache = getattr(_parsers, 'cache', None)
+    if cache is None:
+        cache = _parsers.cache = {}
+    parser = cache.get(remove_blank_text)
+    if parser is None:
+        parser = cache[remove_blank_text] = etree.XMLParser(remove_blank_text=remove_blank_text)
+    return parser
+
+def parse(source, remove_blank_text: bool = True) -> etree._ElementTree:
+    """Parse a CCDA document with the reusable parser."""
+    return etree.parse(source, get_parser(remove_blank_text))
+
+def section_id(section: etree._Element) -> Optional[str]:
+    """Section identifier: the first templateId root, else the section code."""
+    template_ids = SECTION_TEMPLATE_IDS(section)
+    if template_ids:
+        return template_ids[0]
+    codes = SECTION_CODES(section)
+    return codes[0] if codes else None
+
+def narrative_stats(section: etree._Element) -> TextStats:
+    """Word, character and token counts of the narrative <text> blocks of a
+    section and its subsections."""
+    return TextStats().update(NARRATIVE_TEXT(section))
+
+def is_blank(text: str) -> bool:
+    """Whether text is only XML whitespace, as remove_blank_text may drop."""
+    return not text.strip(XML_WHITESPACE)
+
+def _first(elements: List[etree._Element]) -> Optional[etree._Element]:
+    return elements[0] if elements else None
+
+def _name_part(element: etree._Element) -> str:
+    text = element.text
+    return '' if text is None or is_blank(text) else text
+
+def find_patient(root: etree._Element) -> Optional[etree._Element]:
+    """The recordTarget patient element of a document."""
+    return _first(PATIENT(root))
+
+def patient_name(patient: etree._Element) -> Optional[Tuple[Optional[str], Optional[str]]]:
+    """(given, family) of the patient's first name, or None without a name."""
+    name = _first(PATIENT_NAME(patient))
+    if name is None:
+        return None
+    # As findtext: '' for an empty (or blank) element, None for a missing one
+    given = _first(NAME_GIVEN(name))
+    family = _first(NAME_FAMILY(name))
+    return (
+        None if given is None else _name_part(given),
+        None if family is None else _name_part(family)
+    )
+
+def birth_date(patient: etree._Element) -> Optional[str]:
+    """Patient birth date as YYYY-MM-DD, or None without a birthTime value."""
+    birth_time = _first(BIRTH_TIME(patient))
+    if birth_time is None or 'value' not in birth_time.attrib:
+        return None
+    # Convert CCDA date format (YYYYMMDD) to ISO format (YYYY-MM-DD)
+    value = birth_time.get('value')
+    return f"{value[:4]}-{value[4:6]}-{value[6:8]}"
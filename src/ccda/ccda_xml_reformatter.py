@@ -8,25 +8,42 @@ This script:
 3. Creates a new directory with reformatted files
 
 Features:
-- Memory-efficient processing using iterparse
-- No data loss or content modification
+- Constant-memory streaming: documents are read with iterparse and written
+  incrementally, so multi-hundred-MB files are never held as a whole tree
+- No data loss or content modification: only whitespace between elements is
+  replaced by indentation
 - Proper XML indentation and whitespace
-- Batch processing with memory monitoring
+- Batch processing: the output manifest is flushed after every batch
+- Idempotent runs: an output manifest records each output's source hash,
+  settings and output hash, and outputs that are up to date are skipped
+- Storage mode (--mode storage): canonical, whitespace-minimized XML (see
+  ccda_canonical_xml) compressed with zstd or gzip, written as one file per
+  document or as zip bundles of --bundle-size documents, for the documents we
+  keep and upload
 """
 
+import gzip
+import io
 import os
 import sys
-import json
 import logging
 import shutil
+import tempfile
+import zipfile
 import psutil
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Set, Tuple
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 from lxml import etree
 from tqdm import tqdm
 import argparse
-import gc
+
+from ccda_canonical_xml import write_canonical
+from ccda_document_source import document_name, open_document
+from ccda_reformat_manifest import ReformatManifest
+from ccda_score_index import top_n as load_top_n
+from ccda_xml_core import parse
 
 # Configure logging
 logging.basicConfig(
@@ -40,112 +57,539 @@ def get_memory_usage():
     process = psutil.Process(os.getpid())
     return process.memory_info().rss / 1024 / 1024
 
-def clear_memory():
-    """Aggressive memory cleanup."""
-    gc.collect()
-    gc.collect()
-    if hasattr(gc, 'freeze'):
-        gc.freeze()
+# Bump when the output for the same input changes, so manifests treat old
+# outputs as stale
+FORMAT_VERSION = 1
+
+# Storage mode: file suffix and default level per compression codec
+COMPRESSION_SUFFIXES = {'zstd': '.zst', 'gzip': '.gz'}
+DEFAULT_COMPRESSION_LEVELS = {'zstd': 10, 'gzip': 6}
+
+BUNDLE_NAME = 'ccda_bundle_{:05d}.zip'
+
+# A document is compressed in memory up to this size before it goes into a
+# bundle (larger ones spill to a temporary file)
+SPOOL_SIZE = 16 * 1024 * 1024
+
+# Indentation per level; like libxml2, indentation stops growing past 30 levels
+INDENT = '  '
+MAX_INDENT_LEVEL = 30
+
+XML_NS = 'http://www.w3.org/XML/1998/namespace'
+
+def escape_text(text: str) -> str:
+    """Escape character data the way libxml2 serializes it."""
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    if '\r' in text:
+        text = text.replace('\r', '&#13;')
+    return text
+
+def escape_attribute(value: str) -> str:
+    """Escape an attribute value the way libxml2 serializes it."""
+    value = escape_text(value)
+    if '"' in value:
+        value = value.replace('"', '&quot;')
+    if '\n' in value:
+        value = value.replace('\n', '&#10;')
+    if '\t' in value:
+        value = value.replace('\t', '&#9;')
+    return value
+
+class InternalSubsetError(Exception):
+    """A document has an internal DTD subset, which iterparse does not expose."""
+
+def _qualified_name(name: str, nsmap: Dict[Optional[str], str], attribute: bool = False) -> str:
+    """prefix:local for a Clark-notation name, using the in-scope namespaces."""
+    if name[0] != '{':
+        return name
+    uri, local = name[1:].split('}', 1)
+    if uri == XML_NS:
+        return f'xml:{local}'
+    for prefix, ns_uri in nsmap.items():
+        # Unprefixed attributes are never in the default namespace
+        if ns_uri == uri and (prefix is not None or not attribute):
+            return f'{prefix}:{local}' if prefix else local
+    raise ValueError(f"No prefix in scope for namespace {uri}")
+
+class _OpenElement:
+    """An element being streamed whose end tag has not been written yet."""
+
+    __slots__ = ('elem', 'depth', 'name', 'start_tag', 'formatted', 'started',
+                 'last_child', 'mark')
+
+    def __init__(self, elem: etree._Element, depth: int, namespaces: List[Tuple[str, str]],
+                 formatted: bool):
+        self.elem = elem
+        self.depth = depth
+        # The prefix the source uses, which may share its namespace with another
+        local = elem.tag.split('}', 1)[-1]
+        self.name = f'{elem.prefix}:{local}' if elem.prefix else local
+        
+        # Start tag without its closing '>', with the declarations made on the
+        # element in the source (even those repeating an ancestor's)
+        parts = [f'<{self.name}']
+        for prefix, uri in namespaces:
+            parts.append(f' xmlns:{prefix}="{escape_attribute(uri)}"' if prefix
+                         else f' xmlns="{escape_attribute(uri)}"')
+        nsmap = None
+        for name, value in elem.attrib.items():
+            if name[0] == '{':
+                # Built from the ancestors on every access, so only when needed
+                if nsmap is None:
+                    nsmap = elem.nsmap
+                name = _qualified_name(name, nsmap, True)
+            parts.append(f' {name}="{escape_attribute(value)}"')
+        self.start_tag = ''.join(parts)
+        
+        # False once the element or an ancestor has text of its own
+        self.formatted = formatted
+        self.started = False        # start tag written
+        self.last_child = None      # previous child node, whose tail is pending
+        self.mark = None            # buffer position of its content while undecided
+
+class StreamingPrettyPrinter:
+    """
+    Writes a document with pretty printing while reading it with iterparse,
+    without building its tree.
+    
+    The output matches parsing with remove_blank_text and writing with
+    pretty_print: children are indented, unless their parent or an ancestor
+    has text of its own (mixed content), which is written exactly as parsed.
+    Whether an element has text is only known once a tail turns up or the
+    element ends, so an element whose first child is an element is undecided
+    until then. Its output is buffered with indentation kept as markers,
+    dropped if text turns up and rendered once it ends. Past LOOKAHEAD_CHARS
+    of buffered output the outermost undecided element is written out as
+    indented; if it has text after all, only whitespace before that text
+    differs from the tree-based output.
+    
+    A DOCTYPE is written from its public and system IDs. A document with an
+    internal DTD subset raises InternalSubsetError before anything but the
+    XML declaration is written, so the caller can use the tree writer.
+    
+    Elements are cleared and released once written, so memory is bounded by
+    the document depth and the lookahead.
+    """
+    
+    LOOKAHEAD_CHARS = 4 * 1024 * 1024
+    
+    def __init__(self, out: io.TextIOBase):
+        self.out = out
+        self.stack: List[_OpenElement] = []
+        # Undecided elements, outermost first, and their buffered output:
+        # strings, and ints for the indentation level of a new line
+        self.undecided: List[_OpenElement] = []
+        self.buffer: List = []
+        self.buffered_chars = 0
+    
+    def write_document(self, source):
+        """Stream a document (a path or binary stream) to the output."""
+        self.out.write("<?xml version='1.0' encoding='UTF-8'?>\n")
+        stack = self.stack
+        # Declarations of the next element, reported before its start event
+        namespaces = []
+        
+        for event, node in etree.iterparse(source, events=('start-ns', 'start', 'end', 'comment', 'pi'),
+                                           remove_blank_text=True):
+            if event == 'start-ns':
+                namespaces.append(node)
+                continue
+            
+            if event == 'end':
+                self.close(stack.pop(), node)
+                if stack:
+                    stack[-1].last_child = node
+                else:
+                    self.out.write('\n')
+                # Written; the parent still needs the tail
+                node.clear(keep_tail=True)
+                continue
+            
+            if stack:
+                self.open_child(stack[-1], node)
+            elif event == 'start':
+                docinfo = node.getroottree().docinfo
+                if docinfo.internalDTD is not None:
+                    raise InternalSubsetError(docinfo.doctype)
+                if docinfo.doctype:
+                    self.out.write(docinfo.doctype + '\n')
+            
+            if event == 'start':
+                parent = stack[-1] if stack else None
+                stack.append(_OpenElement(
+                    node,
+                    len(stack),
+                    namespaces,
+                    parent.formatted if parent else True
+                ))
+                namespaces = []
+            else:
+                # Comments and processing instructions arrive complete
+                self.write(etree.tostring(node, encoding='unicode', with_tail=False))
+                if stack:
+                    stack[-1].last_child = node
+                else:
+                    self.out.write('\n')
+    
+    def open_child(self, parent: _OpenElement, child):
+        """
+        Write what precedes a child node that just started: the parent's start
+        tag and text for its first child, otherwise the previous sibling's tail,
+        then the child's indentation.
+        """
+        if not parent.started:
+            # The parent's own text is complete once its first child starts
+            preceding = parent.elem.text
+            self.write(parent.start_tag + '>')
+            parent.started = True
+            if preceding is None and parent.formatted:
+                parent.mark = len(self.buffer)
+                self.undecided.append(parent)
+        else:
+            preceding = parent.last_child.tail
+            # Earlier siblings are written; release them
+            elem = parent.elem
+            while elem[0] is not child:
+                del elem[0]
+        
+        if preceding is not None:
+            self.has_text(parent)
+            self.write(escape_text(preceding))
+        elif parent.formatted:
+            self.indent(parent.depth + 1)
+    
+    def close(self, current: _OpenElement, elem: etree._Element):
+        """Write the end of an element."""
+        if not current.started:
+            # A leaf: its text is complete
+            if elem.text is None:
+                self.write(f'{current.start_tag}/>')
+            else:
+                self.write(f'{current.start_tag}>{escape_text(elem.text)}</{current.name}>')
+            return
+        
+        tail = current.last_child.tail
+        if tail is not None:
+            self.has_text(current)
+            self.write(escape_text(tail))
+        elif current.formatted:
+            self.indent(current.depth)
+        self.write(f'</{current.name}>')
+        
+        if current.mark is not None:
+            # No text: the indentation stands (unless an ancestor has text)
+            self.undecided.pop()
+            current.mark = None
+            if not self.undecided:
+                self.flush(len(self.buffer))
+    
+    def has_text(self, current: _OpenElement):
+        """The element has text of its own: nothing inside it is indented."""
+        current.formatted = False
+        if current.mark is not None:
+            # Earlier children are closed, so it is the innermost undecided element
+            self.undecided.pop()
+            self.buffer[current.mark:] = [item for item in self.buffer[current.mark:]
+                                          if isinstance(item, str)]
+            current.mark = None
+            if not self.undecided:
+                self.flush(len(self.buffer))
+    
+    def write(self, text: str):
+        if self.undecided:
+            self.buffer.append(text)
+            self.buffered_chars += len(text)
+            if self.buffered_chars > self.LOOKAHEAD_CHARS:
+                self.commit_outermost()
+        else:
+            self.out.write(text)
+    
+    def indent(self, level: int):
+        if self.undecided:
+            self.buffer.append(level)
+        else:
+            self.out.write('\n' + INDENT * min(level, MAX_INDENT_LEVEL))
+    
+    def flush(self, end: int):
+        """Write buffer[:end], rendering indentation markers."""
+        flushed = 0
+        parts = []
+        for item in self.buffer[:end]:
+            if isinstance(item, str):
+                flushed += len(item)
+                parts.append(item)
+            else:
+                parts.append('\n' + INDENT * min(item, MAX_INDENT_LEVEL))
+        self.out.write(''.join(parts))
+        del self.buffer[:end]
+        self.buffered_chars -= flushed
+    
+    def commit_outermost(self):
+        """Stop waiting for the outermost undecided element and write it as indented."""
+        while self.undecided and self.buffered_chars > self.LOOKAHEAD_CHARS:
+            self.undecided.pop(0).mark = None
+            end = self.undecided[0].mark if self.undecided else len(self.buffer)
+            self.flush(end)
+            for current in self.undecided:
+                current.mark -= end
 
 class CCDAReformatter:
-    """Reformats CCDA XML files with proper indentation and structure."""
+    """
+    Reformats CCDA XML files with proper indentation and structure, or in
+    storage mode writes them in compressed canonical form.
+    """
     
-    def __init__(self):
+    def __init__(self,
+                 mode: str = 'pretty',
+                 compression: str = 'zstd',
+                 compression_level: Optional[int] = None,
+                 bundle_size: int = 0):
+        self.mode = mode
+        self.compression = compression
+        self.compression_level = (DEFAULT_COMPRESSION_LEVELS[compression]
+                                  if compression_level is None else compression_level)
+        self.bundle_size = bundle_size
         self.processed_files = 0
+        self.skipped_files = 0
         self.total_size = 0
     
+    @property
+    def settings(self) -> Dict:
+        """Settings that determine the output, as recorded in the manifest."""
+        if self.mode == 'pretty':
+            return {'format': 'pretty', 'version': FORMAT_VERSION}
+        return {
+            'format': 'storage',
+            'version': FORMAT_VERSION,
+            'compression': self.compression,
+            'level': self.compression_level
+        }
+    
+    def output_name(self, xml_path: str) -> str:
+        """File (or bundle member) name of a document's output."""
+        name = document_name(xml_path)
+        if self.mode == 'storage':
+            name += COMPRESSION_SUFFIXES[self.compression]
+        return name
+    
     def load_analysis_results(self, analysis_file: str, top_n: int) -> List[str]:
         """Load analysis results and return paths of top N files."""
-        with open(analysis_file) as f:
-            analysis = json.load(f)
-        
-        # Sort files by information score
-        sorted_files = sorted(
-            analysis.items(),
-            key=lambda x: x[1].get('total_score', 0),
-            reverse=True
-        )
-        
-        # Get top N files and clear memory
-        top_files = [file_path for file_path, _ in sorted_files[:top_n]]
-        del sorted_files
-        del analysis
-        clear_memory()
+        # Streams only the first N entries of the score index
+        top_files = [file_path for file_path, _ in load_top_n(analysis_file, top_n)]
         
         logger.info(f"Selected top {len(top_files)} files from analysis")
         return top_files
     
     def reformat_xml(self, xml_path: str, output_path: str) -> bool:
         """Reformat a CCDA XML file with proper indentation."""
+        # Written under a temporary name, so a failed run never leaves a partial output
+        tmp_path = f'{output_path}.tmp'
         try:
-            # Parse and write with pretty printing
-            parser = etree.XMLParser(remove_blank_text=True)
-            tree = etree.parse(xml_path, parser)
-            tree.write(
-                output_path,
-                pretty_print=True,
-                xml_declaration=True,
-                encoding='UTF-8'
-            )
-            
-            # Update metrics
-            self.processed_files += 1
-            self.total_size += os.path.getsize(output_path)
-            
-            # Clear memory
-            del tree
-            clear_memory()
+            try:
+                with open(tmp_path, 'w', encoding='utf-8', newline='', buffering=1024 * 1024) as out, \
+                        open_document(xml_path) as source:
+                    self.stream_pretty_print(source, out)
+            except InternalSubsetError:
+                # Only libxml2's serializer reproduces the DTD subset
+                with open_document(xml_path) as source:
+                    tree = parse(source)
+                self.write_tree(tree, tmp_path)
+                del tree
+            os.replace(tmp_path, output_path)
+            self.record_output(output_path)
+            return True
             
+        except Exception as e:
+            logger.error(f"Failed to process {xml_path}: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+    
+    def store_xml(self, xml_path: str, output_path: str) -> bool:
+        """Write a CCDA XML file in compressed canonical form."""
+        tmp_path = f'{output_path}.tmp'
+        try:
+            with open(tmp_path, 'wb') as raw, open_document(xml_path) as source, \
+                    self.compressed_text(raw) as out:
+                write_canonical(source, out.write)
+            os.replace(tmp_path, output_path)
+            self.record_output(output_path)
             return True
             
         except Exception as e:
             logger.error(f"Failed to process {xml_path}: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
             return False
     
+    def write_output(self, xml_path: str, output_path: str) -> bool:
+        """Write a document's output in the configured mode."""
+        if self.mode == 'storage':
+            return self.store_xml(xml_path, output_path)
+        return self.reformat_xml(xml_path, output_path)
+    
+    @contextmanager
+    def compressed_text(self, raw: io.BufferedIOBase) -> Iterator[io.TextIOBase]:
+        """Text stream whose UTF-8 is compressed into raw with the storage codec."""
+        if self.compression == 'zstd':
+            try:
+                import zstandard
+            except ImportError:
+                raise ImportError("zstandard is required for zstd compression (pip install zstandard)")
+            compressor = zstandard.ZstdCompressor(level=self.compression_level, write_checksum=True)
+            stream = compressor.stream_writer(raw, closefd=False)
+        else:
+            # No name or timestamp in the header, so the same input gives the same bytes
+            stream = gzip.GzipFile(filename='', mode='wb', fileobj=raw,
+                                   compresslevel=self.compression_level, mtime=0)
+        out = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+        try:
+            yield out
+        finally:
+            out.detach()
+            stream.close()
+    
+    def write_bundle(self, members: List[Tuple[str, str, Tuple]], bundle_path: str) -> List[Tuple]:
+        """
+        Write (member name, source path, fingerprint) documents in compressed
+        canonical form into a zip bundle and return the members written.
+        Members are stored as they are, so each is read like a compressed file.
+        """
+        tmp_path = f'{bundle_path}.tmp'
+        written = []
+        with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_STORED, allowZip64=True) as bundle:
+            for member in tqdm(members, desc=os.path.basename(bundle_path), leave=False):
+                name, xml_path, _ = member
+                with tempfile.SpooledTemporaryFile(SPOOL_SIZE) as buffer:
+                    # Compressed aside first, so a failed document leaves no partial member
+                    try:
+                        with open_document(xml_path) as source, self.compressed_text(buffer) as out:
+                            write_canonical(source, out.write)
+                    except Exception as e:
+                        logger.error(f"Failed to process {xml_path}: {str(e)}")
+                        continue
+                    buffer.seek(0)
+                    with bundle.open(name, 'w', force_zip64=True) as f:
+                        shutil.copyfileobj(buffer, f, 1024 * 1024)
+                written.append(member)
+                self.processed_files += 1
+        os.replace(tmp_path, bundle_path)
+        self.total_size += os.path.getsize(bundle_path)
+        return written
+    
+    def stream_pretty_print(self, source, out: io.TextIOBase):
+        """
+        Write a document to out with pretty printing, streaming it with
+        constant memory (see StreamingPrettyPrinter).
+        """
+        StreamingPrettyPrinter(out).write_document(source)
+    
+    def write_tree(self, tree: etree._ElementTree, output_path: str):
+        """
+        Write a parsed (blank text removed) document with pretty printing,
+        for documents the streaming writer cannot handle and for trees the
+        pipeline has already parsed. Metrics are left to the caller.
+        """
+        tree.write(
+            output_path,
+            pretty_print=True,
+            xml_declaration=True,
+            encoding='UTF-8'
+        )
+    
+    def record_output(self, output_path: str):
+        """Update metrics for a written file."""
+        self.processed_files += 1
+        self.total_size += os.path.getsize(output_path)
+    
     def process_files(self, 
                      analysis_file: str,
                      top_n: int,
                      output_dir: str,
                      batch_size: int = 15,
-                     memory_limit_mb: int = 8000) -> None:
-        """Process the top N most information-rich files in batches."""
+                     force: bool = False) -> None:
+        """
+        Process the top N most information-rich files in batches. Outputs the
+        manifest shows to be up to date are skipped unless force is set.
+        Documents are streamed one at a time, so memory does not depend on
+        the batch size; it only sets how often the manifest is flushed.
+        """
         output_path = Path(output_dir)
         output_path.mkdir(exist_ok=True)
+        manifest = ReformatManifest(output_dir)
+        settings = self.settings
         
         # Get top files from analysis
         top_files = self.load_analysis_results(analysis_file, top_n)
         
+        if self.mode == 'storage' and self.bundle_size:
+            self.process_bundles(top_files, output_path, manifest, force)
+            self.log_summary()
+            return
+        
         # Process files in batches
-        for i in range(0, len(top_files), batch_size):
-            batch = top_files[i:i+batch_size]
-            batch_num = i//batch_size + 1
-            current_memory = get_memory_usage()
-            
+        for batch_num, start in enumerate(range(0, len(top_files), batch_size), 1):
+            batch = top_files[start:start + batch_size]
             logger.debug(f"Processing batch {batch_num} ({len(batch)} files)")
-            logger.debug(f"Memory usage: {current_memory:.1f} MB")
-            
-            # Check memory limit
-            if current_memory > memory_limit_mb:
-                logger.warning(f"Memory usage ({current_memory:.1f} MB) exceeded limit ({memory_limit_mb} MB)")
-                logger.warning("Saving progress and exiting...")
-                break
             
             # Process each file in the batch
             for input_file in tqdm(batch, desc=f"Batch {batch_num}", leave=False):
-                output_file = output_path / os.path.basename(input_file)
-                self.reformat_xml(input_file, str(output_file))
-                
-                # Check memory after each file
-                if get_memory_usage() > memory_limit_mb:
-                    logger.warning(f"Memory limit reached during file processing")
-                    break
+                output_file = output_path / self.output_name(input_file)
+                try:
+                    source = manifest.source_fingerprint(input_file)
+                except OSError as e:
+                    logger.error(f"Failed to process {input_file}: {str(e)}")
+                    continue
+                if not force and manifest.is_current(output_file, source[2], settings):
+                    self.skipped_files += 1
+                    continue
+                if self.write_output(input_file, str(output_file)):
+                    manifest.record(output_file, input_file, source, settings)
             
-            # Clear memory between batches
-            clear_memory()
+            manifest.flush()
             logger.debug(f"After batch memory: {get_memory_usage():.1f} MB")
         
+        self.log_summary()
+    
+    def process_bundles(self,
+                        top_files: List[str],
+                        output_path: Path,
+                        manifest: ReformatManifest,
+                        force: bool = False):
+        """
+        Write the files as numbered bundles of bundle_size documents, in rank
+        order. A bundle whose members and their sources are unchanged since
+        the manifest recorded it is skipped unless force is set. Documents
+        are streamed one at a time, so memory does not depend on bundle size.
+        """
+        settings = self.settings
+        for start in range(0, len(top_files), self.bundle_size):
+            bundle_file = output_path / BUNDLE_NAME.format(start // self.bundle_size)
+            members = []
+            for input_file in top_files[start:start + self.bundle_size]:
+                try:
+                    members.append((self.output_name(input_file), input_file,
+                                    manifest.source_fingerprint(input_file)))
+                except OSError as e:
+                    logger.error(f"Failed to process {input_file}: {str(e)}")
+            if not members:
+                continue
+            if not force and manifest.is_current(bundle_file, manifest.bundle_digest(members), settings):
+                self.skipped_files += len(members)
+                continue
+            written = self.write_bundle(members, str(bundle_file))
+            manifest.record_bundle(bundle_file, written, settings)
+            manifest.flush()
+    
+    def log_summary(self):
         logger.info(f"\nReformatting complete:")
         logger.info(f"- Processed files: {self.processed_files}")
+        logger.info(f"- Up-to-date files skipped: {self.skipped_files}")
         logger.info(f"- Total size: {self.total_size / (1024*1024):.2f} MB")
 
 def main():
@@ -168,6 +612,29 @@ def main():
         default='output/reformatted',
         help='Output directory for reformatted files'
     )
+    parser.add_argument(
+        '--mode',
+        choices=['pretty', 'storage'],
+        default='pretty',
+        help='pretty: indented XML for reading; storage: compressed canonical XML for keeping and uploading'
+    )
+    parser.add_argument(
+        '--compression',
+        choices=sorted(COMPRESSION_SUFFIXES),
+        default='zstd',
+        help='Compression codec in storage mode'
+    )
+    parser.add_argument(
+        '--compression-level',
+        type=int,
+        help='Compression level in storage mode (default: 10 for zstd, 6 for gzip)'
+    )
+    parser.add_argument(
+        '--bundle-size',
+        type=int,
+        default=0,
+        help='In storage mode, write zip bundles of this many documents instead of one file each'
+    )
     parser.add_argument(
         '--batch-size',
         type=int,
@@ -178,7 +645,12 @@ def main():
         '--memory-limit',
         type=int,
         default=8000,
-        help='Memory limit in MB for processing'
+        help='Ignored: documents are streamed in constant memory (kept for existing scripts)'
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Reformat every selected file, even if its output is up to date'
     )
     parser.add_argument(
         '--debug',
@@ -187,17 +659,19 @@ def main():
     )
     
     args = parser.parse_args()
+    if args.mode != 'storage' and (args.bundle_size or args.compression_level is not None):
+        parser.error("--bundle-size and --compression-level apply to --mode storage")
     
     if args.debug:
         logger.setLevel(logging.DEBUG)
     
-    reformatter = CCDAReformatter()
+    reformatter = CCDAReformatter(args.mode, args.compression, args.compression_level, args.bundle_size)
     reformatter.process_files(
         args.analysis_file,
         args.top_n,
         args.output_dir,
         args.batch_size,
-        args.memory_limit
+        args.force
     )
 
 if __name__ == '__main__':
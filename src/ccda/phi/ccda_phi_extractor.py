@@ -13,7 +13,6 @@ Features:
 - Memory-efficient XML parsing
 """
 
-import os
 import sys
 import json
 import logging
@@ -23,6 +22,41 @@ from typing import Dict, List, Any, Optional
 from lxml import etree
 from tqdm import tqdm
 
+# Run as a script, the shared CCDA modules are found in the parent directory.
+# Importers (ccda_pipeline.py, ccda_phi_tokenizer.py) set up the path
+# themselves, so importing this module never changes sys.path.
+if __name__ == '__main__':
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ccda_document_source import document_name, list_documents, open_document
+from ccda_xml_core import PATIENT_ROLE, RECORD_TARGET_TAG, xpath
+
+# Child element queries, compiled once like those in ccda_xml_core
+NAME_PREFIXES = xpath('./h:prefix')
+NAME_GIVENS = xpath('./h:given')
+NAME_FAMILIES = xpath('./h:family')
+NAME_SUFFIXES = xpath('./h:suffix')
+STREET_LINES = xpath('./h:streetAddressLine')
+CITIES = xpath('./h:city')
+STATES = xpath('./h:state')
+POSTAL_CODES = xpath('./h:postalCode')
+COUNTRIES = xpath('./h:country')
+IDS = xpath('./h:id')
+ADDRESSES = xpath('./h:addr')
+TELECOMS = xpath('./h:telecom')
+NAMES = xpath('./h:name')
+PATIENTS = xpath('./h:patient')
+BIRTH_TIMES = xpath('./h:birthTime')
+GENDER_CODES = xpath('./h:administrativeGenderCode')
+MARITAL_STATUS_CODES = xpath('./h:maritalStatusCode')
+RACE_CODES = xpath('./h:raceCode')
+ETHNIC_GROUP_CODES = xpath('./h:ethnicGroupCode')
+LANGUAGE_CODES = xpath('./h:languageCommunication/h:languageCode')
+GUARDIANS = xpath('./h:guardian')
+GUARDIAN_NAMES = xpath('./h:guardianPerson/h:name')
+PROVIDER_ORGANIZATIONS = xpath('./h:providerOrganization')
+PATIENT_ROLES = xpath('./h:patientRole')
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -30,12 +64,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# CCDA namespace
-CCDA_NS = {
-    'h': 'urn:hl7-org:v3',
-    'xsi': 'http://www.w3.org/2001/XMLSchema-instance'
-}
-
 class CCDAPHIExtractor:
     """Extracts Protected Health Information (PHI) from CCDA XML files."""
     
@@ -60,10 +88,10 @@ class CCDAPHIExtractor:
         # Extract name components
         result = {
             "use": name_element.get("use", ""),
-            "prefix": [prefix.text for prefix in name_element.xpath("./h:prefix", namespaces=CCDA_NS) if prefix.text],
-            "given": [given.text for given in name_element.xpath("./h:given", namespaces=CCDA_NS) if given.text],
-            "family": [family.text for family in name_element.xpath("./h:family", namespaces=CCDA_NS) if family.text],
-            "suffix": [suffix.text for suffix in name_element.xpath("./h:suffix", namespaces=CCDA_NS) if suffix.text],
+            "prefix": [prefix.text for prefix in NAME_PREFIXES(name_element) if prefix.text],
+            "given": [given.text for given in NAME_GIVENS(name_element) if given.text],
+            "family": [family.text for family in NAME_FAMILIES(name_element) if family.text],
+            "suffix": [suffix.text for suffix in NAME_SUFFIXES(name_element) if suffix.text],
             "xpath": "/".join(name_element.getroottree().getpath(name_element).split("/")[-4:])
         }
         
@@ -95,15 +123,15 @@ class CCDAPHIExtractor:
             return {}
         
         # Extract address components
-        street_lines = [line.text for line in addr_element.xpath("./h:streetAddressLine", namespaces=CCDA_NS) if line.text]
+        street_lines = [line.text for line in STREET_LINES(addr_element) if line.text]
         
         result = {
             "use": addr_element.get("use", ""),
             "street_lines": street_lines,
-            "city": next(iter([city.text for city in addr_element.xpath("./h:city", namespaces=CCDA_NS) if city.text]), ""),
-            "state": next(iter([state.text for state in addr_element.xpath("./h:state", namespaces=CCDA_NS) if state.text]), ""),
-            "postal_code": next(iter([zip.text for zip in addr_element.xpath("./h:postalCode", namespaces=CCDA_NS) if zip.text]), ""),
-            "country": next(iter([country.text for country in addr_element.xpath("./h:country", namespaces=CCDA_NS) if country.text]), ""),
+            "city": next(iter([city.text for city in CITIES(addr_element) if city.text]), ""),
+            "state": next(iter([state.text for state in STATES(addr_element) if state.text]), ""),
+            "postal_code": next(iter([zip.text for zip in POSTAL_CODES(addr_element) if zip.text]), ""),
+            "country": next(iter([country.text for country in COUNTRIES(addr_element) if country.text]), ""),
             "xpath": "/".join(addr_element.getroottree().getpath(addr_element).split("/")[-4:])
         }
         
@@ -226,7 +254,7 @@ class CCDAPHIExtractor:
         if patient_role is None:
             return {}
         
-        patient = patient_role.xpath("./h:patient", namespaces=CCDA_NS)
+        patient = PATIENTS(patient_role)
         patient = patient[0] if patient else None
         
         phi_data = {
@@ -245,25 +273,25 @@ class CCDAPHIExtractor:
         }
         
         # Extract identifiers
-        for id_element in patient_role.xpath("./h:id", namespaces=CCDA_NS):
+        for id_element in IDS(patient_role):
             phi_data["ids"].append(self.extract_identifier(id_element))
         
         # Extract addresses
-        for addr_element in patient_role.xpath("./h:addr", namespaces=CCDA_NS):
+        for addr_element in ADDRESSES(patient_role):
             phi_data["addresses"].append(self.extract_address(addr_element))
         
         # Extract telecoms
-        for telecom_element in patient_role.xpath("./h:telecom", namespaces=CCDA_NS):
+        for telecom_element in TELECOMS(patient_role):
             phi_data["telecoms"].append(self.extract_telecom(telecom_element))
         
         # Process patient information if available
         if patient is not None:
             # Extract names
-            for name_element in patient.xpath("./h:name", namespaces=CCDA_NS):
+            for name_element in NAMES(patient):
                 phi_data["names"].append(self.extract_name(name_element))
             
             # Extract birthtime
-            birthtime = patient.xpath("./h:birthTime", namespaces=CCDA_NS)
+            birthtime = BIRTH_TIMES(patient)
             if birthtime:
                 phi_data["birthtime"] = {
                     "value": birthtime[0].get("value", ""),
@@ -271,27 +299,27 @@ class CCDAPHIExtractor:
                 }
             
             # Extract gender
-            gender = patient.xpath("./h:administrativeGenderCode", namespaces=CCDA_NS)
+            gender = GENDER_CODES(patient)
             if gender:
                 phi_data["gender"] = self.extract_coded_value(gender[0], "gender")
             
             # Extract marital status
-            marital = patient.xpath("./h:maritalStatusCode", namespaces=CCDA_NS)
+            marital = MARITAL_STATUS_CODES(patient)
             if marital:
                 phi_data["marital_status"] = self.extract_coded_value(marital[0], "marital_status")
             
             # Extract race
-            race = patient.xpath("./h:raceCode", namespaces=CCDA_NS)
+            race = RACE_CODES(patient)
             if race:
                 phi_data["race"] = self.extract_coded_value(race[0], "race")
             
             # Extract ethnicity
-            ethnicity = patient.xpath("./h:ethnicGroupCode", namespaces=CCDA_NS)
+            ethnicity = ETHNIC_GROUP_CODES(patient)
             if ethnicity:
                 phi_data["ethnicity"] = self.extract_coded_value(ethnicity[0], "ethnicity")
             
             # Extract language
-            language = patient.xpath("./h:languageCommunication/h:languageCode", namespaces=CCDA_NS)
+            language = LANGUAGE_CODES(patient)
             if language:
                 phi_data["language"] = {
                     "code": language[0].get("code", ""),
@@ -299,7 +327,7 @@ class CCDAPHIExtractor:
                 }
         
         # Extract guardian information
-        guardian = patient_role.xpath("./h:guardian", namespaces=CCDA_NS)
+        guardian = GUARDIANS(patient_role)
         if guardian:
             guardian_data = {
                 "addresses": [],
@@ -308,21 +336,21 @@ class CCDAPHIExtractor:
             }
             
             # Extract guardian addresses
-            for addr in guardian[0].xpath("./h:addr", namespaces=CCDA_NS):
+            for addr in ADDRESSES(guardian[0]):
                 guardian_data["addresses"].append(self.extract_address(addr))
             
             # Extract guardian telecoms
-            for telecom in guardian[0].xpath("./h:telecom", namespaces=CCDA_NS):
+            for telecom in TELECOMS(guardian[0]):
                 guardian_data["telecoms"].append(self.extract_telecom(telecom))
             
             # Extract guardian names
-            for name in guardian[0].xpath("./h:guardianPerson/h:name", namespaces=CCDA_NS):
+            for name in GUARDIAN_NAMES(guardian[0]):
                 guardian_data["names"].append(self.extract_name(name))
             
             phi_data["guardian"] = guardian_data
         
         # Extract provider organization information
-        provider_org = patient_role.xpath("./h:providerOrganization", namespaces=CCDA_NS)
+        provider_org = PROVIDER_ORGANIZATIONS(patient_role)
         if provider_org:
             org_data = {
                 "ids": [],
@@ -332,20 +360,20 @@ class CCDAPHIExtractor:
             }
             
             # Extract organization IDs
-            for id_element in provider_org[0].xpath("./h:id", namespaces=CCDA_NS):
+            for id_element in IDS(provider_org[0]):
                 org_data["ids"].append(self.extract_identifier(id_element))
             
             # Extract organization name
-            name = provider_org[0].xpath("./h:name", namespaces=CCDA_NS)
+            name = NAMES(provider_org[0])
             if name:
                 org_data["name"] = name[0].text
             
             # Extract organization addresses
-            for addr in provider_org[0].xpath("./h:addr", namespaces=CCDA_NS):
+            for addr in ADDRESSES(provider_org[0]):
                 org_data["addresses"].append(self.extract_address(addr))
             
             # Extract organization telecoms
-            for telecom in provider_org[0].xpath("./h:telecom", namespaces=CCDA_NS):
+            for telecom in TELECOMS(provider_org[0]):
                 org_data["telecoms"].append(self.extract_telecom(telecom))
             
             phi_data["provider_organization"] = org_data
@@ -357,41 +385,42 @@ class CCDAPHIExtractor:
         Extract PHI from a single CCDA XML file.
         
         Args:
-            file_path: Path to the CCDA XML file
+            file_path: Path or URI of the CCDA document (see ccda_document_source)
             
         Returns:
             Dictionary with extracted PHI
         """
         try:
             # Use iterparse for memory-efficient parsing
-            context = etree.iterparse(file_path, events=('end',), tag=f'{{{CCDA_NS["h"]}}}recordTarget')
-            
-            for event, elem in context:
-                if event == 'end' and elem.tag == f'{{{CCDA_NS["h"]}}}recordTarget':
-                    # Get patientRole element
-                    patient_role = elem.xpath('./h:patientRole', namespaces=CCDA_NS)
-                    
-                    if patient_role:
-                        # Extract all PHI from patientRole
-                        phi_data = self.extract_patient_phi(patient_role[0])
-                        
-                        # Add file metadata
-                        result = {
-                            "file_name": os.path.basename(file_path),
-                            "phi_data": phi_data
-                        }
+            with open_document(file_path) as source:
+                context = etree.iterparse(source, events=('end',), tag=RECORD_TARGET_TAG)
+                
+                for event, elem in context:
+                    if event == 'end' and elem.tag == RECORD_TARGET_TAG:
+                        # Get patientRole element
+                        patient_role = PATIENT_ROLES(elem)
                         
-                        # Clear element to save memory
-                        elem.clear()
-                        
-                        self.processed_files += 1
-                        return result
-            
+                        if patient_role:
+                            # Extract all PHI from patientRole
+                            phi_data = self.extract_patient_phi(patient_role[0])
+                            
+                            # Add file metadata
+                            result = {
+                                "file_name": document_name(file_path),
+                                "phi_data": phi_data
+                            }
+                            
+                            # Clear element to save memory
+                            elem.clear()
+                            
+                            self.processed_files += 1
+                            return result
+                
             # If we reach here, we didn't find a patientRole element
             logger.warning(f"No patientRole element found in {file_path}")
             self.failed_files += 1
             return {
-                "file_name": os.path.basename(file_path),
+                "file_name": document_name(file_path),
                 "phi_data": {},
                 "error": "No patientRole element found"
             }
@@ -400,11 +429,38 @@ class CCDAPHIExtractor:
             logger.error(f"Error processing {file_path}: {str(e)}")
             self.failed_files += 1
             return {
-                "file_name": os.path.basename(file_path),
+                "file_name": document_name(file_path),
                 "phi_data": {},
                 "error": str(e)
             }
     
+    def extract_phi_from_tree(self, root: etree._Element, file_path: str) -> Dict[str, Any]:
+        """
+        Extract PHI from an already parsed CCDA document.
+        
+        Args:
+            root: Root element of the parsed CCDA document
+            file_path: Path the document was read from
+            
+        Returns:
+            Dictionary with extracted PHI
+        """
+        patient_role = PATIENT_ROLE(root)
+        if not patient_role:
+            logger.warning(f"No patientRole element found in {file_path}")
+            self.failed_files += 1
+            return {
+                "file_name": document_name(file_path),
+                "phi_data": {},
+                "error": "No patientRole element found"
+            }
+        
+        self.processed_files += 1
+        return {
+            "file_name": document_name(file_path),
+            "phi_data": self.extract_patient_phi(patient_role[0])
+        }
+    
     def extract_phi_from_directory(self, input_dir: str, output_file: str = 'phi_data.json'):
         """
         Extract PHI from all CCDA XML files in a directory.
@@ -413,14 +469,13 @@ class CCDAPHIExtractor:
             input_dir: Directory containing CCDA XML files
             output_file: Path to save the extracted PHI data as JSON
         """
-        input_path = Path(input_dir)
-        xml_files = list(input_path.glob('*.xml'))
+        xml_files = list_documents(input_dir)
         
-        logger.info(f"Found {len(xml_files)} CCDA XML files to process")
+        logger.info(f"Found {len(xml_files)} CCDA documents to process")
         
         results = []
         for xml_file in tqdm(xml_files, desc="Extracting PHI"):
-            phi_data = self.extract_phi_from_file(str(xml_file))
+            phi_data = self.extract_phi_from_file(xml_file)
             results.append(phi_data)
         
         # Create output directory if it doesn't exist
@@ -6,7 +6,6 @@ This script extends the PHI extractor to prepare PHI data for tokenization.
 It ensures all PHI elements are properly extracted and structured for tokenization purposes.
 """
 
-import os
 import sys
 import json
 import logging
@@ -16,8 +15,13 @@ from typing import Dict, List, Any, Optional, Set, Tuple
 from lxml import etree
 from tqdm import tqdm
 
+# Script path setup, as in ccda_phi_extractor.py
+if __name__ == '__main__':
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
 # Import the PHI extractor
 from ccda_phi_extractor import CCDAPHIExtractor
+from ccda_document_source import document_name, list_documents
 
 # Configure logging
 logging.basicConfig(
@@ -272,7 +276,7 @@ class CCDAPHITokenizer:
             
             # Add file metadata
             result = {
-                "file_name": os.path.basename(file_path),
+                "file_name": document_name(file_path),
                 "tokenization_data": tokenization_data
             }
             
@@ -283,7 +287,7 @@ class CCDAPHITokenizer:
             logger.error(f"Error processing {file_path}: {str(e)}")
             self.failed_files += 1
             return {
-                "file_name": os.path.basename(file_path),
+                "file_name": document_name(file_path),
                 "tokenization_data": {},
                 "error": str(e)
             }
@@ -296,16 +300,15 @@ class CCDAPHITokenizer:
             input_dir: Directory containing CCDA XML files
             output_file: Path to save the tokenization data
         """
-        input_path = Path(input_dir)
-        xml_files = list(input_path.glob('*.xml'))
+        xml_files = list_documents(input_dir)
         
-        logger.info(f"Found {len(xml_files)} CCDA XML files to process")
+        logger.info(f"Found {len(xml_files)} CCDA documents to process")
         
         results = []
         unique_tokens = set()
         
         for xml_file in tqdm(xml_files, desc="Preparing for tokenization"):
-            result = self.process_file(str(xml_file))
+            result = self.process_file(xml_file)
             results.append(result)
             
             # Collect all unique tokens across files
@@ -368,8 +371,7 @@ def main():
     if args.sample_size > 0:
         # Use a subset of files
         import random
-        input_path = Path(args.input_dir)
-        xml_files = list(input_path.glob('*.xml'))
+        xml_files = list_documents(args.input_dir)
         
         if len(xml_files) <= args.sample_size:
             sampled_files = xml_files
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The CCDA scripts import their sibling modules by name
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src' / 'ccda'))
@@ -0,0 +1,23 @@
+"""Listing an input directory."""
+
+import gzip
+import logging
+
+from ccda_document_source import list_documents
+
+DOCUMENT = b'<ClinicalDocument xmlns="urn:hl7-org:v3"/>\n'
+
+def test_list_documents_warns_on_output_name_collisions(tmp_path, caplog):
+    (tmp_path / 'a.xml').write_bytes(DOCUMENT)
+    with gzip.open(tmp_path / 'a.xml.gz', 'wb') as f:
+        f.write(DOCUMENT)
+    (tmp_path / 'B.XML').write_bytes(DOCUMENT)
+    (tmp_path / 'notes.txt').write_bytes(b'not a document')
+
+    with caplog.at_level(logging.WARNING, logger='ccda_document_source'):
+        uris = list_documents(str(tmp_path))
+
+    assert [uri.rsplit('/', 1)[1] for uri in uris] == ['B.XML', 'a.xml', 'a.xml.gz']
+    collisions = [r.getMessage() for r in caplog.records if 'both write outputs' in r.getMessage()]
+    assert len(collisions) == 1
+    assert 'a.xml.gz' in collisions[0] and 'named a.xml;' in collisions[0]
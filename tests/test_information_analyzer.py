@@ -0,0 +1,129 @@
+"""Rescoring with an unchanged config must reproduce the analyzer's scores."""
+
+import json
+import logging
+import random
+
+import ccda_information_analyzer
+from ccda_information_analyzer import CCDAAnalyzer
+
+SECTION = """
+      <component>
+        <section>
+          <templateId root="2.16.840.1.113883.10.20.22.2.{number}"/>
+          <code code="{number}" codeSystem="2.16.840.1.113883.6.1"/>
+          <text>{text}</text>
+          {entries}
+        </section>
+      </component>"""
+
+ENTRY = """<entry><observation><code code="{code}" codeSystem="2.16.840.1.113883.6.96"/></observation></entry>"""
+
+def write_document(path, rng):
+    sections = ''.join(
+        SECTION.format(
+            number=number,
+            text=' '.join(['word'] * rng.randrange(0, 400)),
+            entries=''.join(ENTRY.format(code=code) for code in range(rng.randrange(0, 25)))
+        )
+        for number in range(1, rng.randrange(2, 12))
+    )
+    path.write_text(
+        '<ClinicalDocument xmlns="urn:hl7-org:v3"><component><structuredBody>'
+        f'{sections}</structuredBody></component></ClinicalDocument>'
+    )
+
+def write_config(path, rng):
+    path.write_text(json.dumps({'sections': {
+        f'2.16.840.1.113883.10.20.22.2.{number}': {'weight': round(rng.uniform(0.05, 1.5), 2)}
+        for number in range(1, 12)
+    }}))
+
+def scores(output_file):
+    with open(output_file) as f:
+        return {
+            file_path: (metrics['section_scores'], metrics['total_score'])
+            for file_path, metrics in json.load(f).items()
+        }
+
+def analyze(tmp_path, rng):
+    input_dir = tmp_path / 'ccda'
+    input_dir.mkdir()
+    for i in range(20):
+        write_document(input_dir / f'doc{i}.xml', rng)
+    config_file = tmp_path / 'ccda_config.json'
+    write_config(config_file, rng)
+    output_file = tmp_path / 'analysis.json'
+
+    analyzer = CCDAAnalyzer(str(tmp_path / 'checkpoints'), str(config_file))
+    analyzer.analyze_directory(str(input_dir), str(output_file))
+    return input_dir, config_file, output_file
+
+def test_rescore_reproduces_analysis(tmp_path, monkeypatch):
+    input_dir, config_file, output_file = analyze(tmp_path, random.Random(7))
+    analyzed = scores(output_file)
+    assert any(section_scores for section_scores, _ in analyzed.values())
+
+    # Several chunks, the last one partial
+    monkeypatch.setattr(ccda_information_analyzer, 'RESCORE_CHUNK_SIZE', 7)
+    CCDAAnalyzer(str(tmp_path / 'checkpoints'), str(config_file)).rescore(str(output_file))
+    assert scores(output_file) == analyzed
+    assert list(scores(output_file)) == list(analyzed)
+
+    # Later merges see the rescored store
+    CCDAAnalyzer(str(tmp_path / 'checkpoints'), str(config_file)).merge_checkpoints(str(output_file))
+    assert scores(output_file) == analyzed
+
+def test_rescore_filters_only_by_given_input_dir(tmp_path, caplog):
+    input_dir, config_file, output_file = analyze(tmp_path, random.Random(3))
+    analyzer = CCDAAnalyzer(str(tmp_path / 'checkpoints'), str(config_file))
+
+    analyzer.rescore(str(output_file))
+    assert len(scores(output_file)) == 20
+
+    (input_dir / 'doc0.xml').unlink()
+    analyzer.rescore(str(output_file), str(input_dir))
+    assert len(scores(output_file)) == 19
+
+    other_dir = tmp_path / 'elsewhere'
+    other_dir.mkdir()
+    with caplog.at_level(logging.WARNING):
+        analyzer.rescore(str(output_file), str(other_dir))
+    assert scores(output_file) == {}
+    assert 'None of the 20 checkpointed files' in caplog.text
+
+def test_rescore_rounds_like_section_score(tmp_path):
+    rng = random.Random(11)
+    config_file = tmp_path / 'ccda_config.json'
+    write_config(config_file, rng)
+    analyzer = CCDAAnalyzer(None, str(config_file))
+
+    records = {}
+    for i in range(500):
+        records[f'doc{i}.xml'] = {
+            'section_details': {
+                f'2.16.840.1.113883.10.20.22.2.{number}': {
+                    'word_count': rng.randrange(0, 1200),
+                    'char_count': 0,
+                    'token_count': 0,
+                    'coded_elements': rng.randrange(0, 40),
+                    'entries': rng.randrange(0, 60)
+                }
+                for number in range(1, 12)
+            },
+            'unique_sections': 11,
+            'error': None
+        }
+    output_file = tmp_path / 'analysis.json'
+    output_file.write_text(json.dumps(records))
+
+    analyzer.rescore(str(output_file))
+    with open(output_file) as f:
+        rescored = json.load(f)
+    for file_path, metrics in rescored.items():
+        expected = {
+            section_id: analyzer.calculate_section_score(section_id, details)
+            for section_id, details in records[file_path]['section_details'].items()
+        }
+        assert metrics['section_scores'] == expected
+        assert metrics['total_score'] == sum(expected.values())
@@ -0,0 +1,107 @@
+"""Pipeline consumers must see the same document text as their standalone stages."""
+
+import json
+
+import pytest
+
+import ccda_pipeline
+from ccda_pipeline import (
+    CCDAPipeline, DemographicsConsumer, PHIConsumer, ReformatConsumer,
+    ScoringConsumer, SectionIndexConsumer
+)
+from ccda_phi_extractor import CCDAPHIExtractor
+from ccda_section_analyzer import CCDASectionAnalyzer
+from ccda_xml_core import find_patient, parse, patient_name
+
+# Blank text beside a comment or processing instruction is dropped by
+# remove_blank_text, which the standalone extractor does not use
+BLANK_NAME_PARTS = b"""<ClinicalDocument xmlns="urn:hl7-org:v3">
+  <recordTarget>
+    <patientRole>
+      <id root="2.16.840.1.113883.19.5" extension="12345"/>
+      <patient>
+        <name use="L">
+          <given>Ada</given>
+          <given> <!-- preferred name withheld --> </given>
+          <family>
+            <?source registration?>
+          </family>
+        </name>
+        <birthTime value="19700101"/>
+      </patient>
+    </patientRole>
+  </recordTarget>
+  <component>
+    <structuredBody>
+      <component>
+        <section>
+          <templateId root="2.16.840.1.113883.10.20.22.2.1"/>
+          <title>
+            <!-- from the medication list -->
+          </title>
+          <text>Aspirin <content> 81 mg </content> daily</text>
+        </section>
+      </component>
+      <component>
+        <section>
+          <templateId root="2.16.840.1.113883.10.20.22.2.5"/>
+          <title>Problems <!-- active --> and history</title>
+          <text> </text>
+        </section>
+      </component>
+    </structuredBody>
+  </component>
+</ClinicalDocument>
+"""
+
+def write_corpus(tmp_path, count=1):
+    input_dir = tmp_path / 'ccda'
+    input_dir.mkdir()
+    for i in range(count):
+        (input_dir / f'patient{i}.xml').write_bytes(BLANK_NAME_PARTS)
+    return input_dir
+
+def test_phi_matches_standalone_extractor(tmp_path):
+    input_dir = write_corpus(tmp_path)
+    document = input_dir / 'patient0.xml'
+    output_file = tmp_path / 'phi_data.json'
+
+    CCDAPipeline([PHIConsumer(str(output_file))]).run(str(input_dir))
+
+    standalone = CCDAPHIExtractor().extract_phi_from_file(str(document))
+    assert json.loads(output_file.read_text()) == [standalone]
+
+@pytest.mark.parametrize('remove_blank_text', [True, False])
+def test_sections_and_demographics_ignore_blank_text(tmp_path, remove_blank_text):
+    document = str(write_corpus(tmp_path) / 'patient0.xml')
+    standalone = CCDASectionAnalyzer().analyze_stream(document)
+    assert standalone['2.16.840.1.113883.10.20.22.2.1']['titles'] == []
+
+    tree = parse(document, remove_blank_text)
+    assert CCDASectionAnalyzer().analyze_tree(tree.getroot(), document) == standalone
+    assert patient_name(find_patient(tree.getroot())) == ('Ada', '')
+
+def test_default_consumers_share_one_parse(tmp_path, monkeypatch):
+    input_dir = write_corpus(tmp_path, 3)
+    parses = []
+
+    def counting_parse(source, remove_blank_text=True):
+        parses.append(remove_blank_text)
+        return parse(source, remove_blank_text)
+
+    monkeypatch.setattr(ccda_pipeline, 'parse', counting_parse)
+    # The demographics consumer needs the AWS clients, but has no preference either
+    assert DemographicsConsumer.remove_blank_text is None
+    consumers = [
+        SectionIndexConsumer(str(tmp_path / 'section_analysis.json')),
+        ScoringConsumer(str(tmp_path / 'analysis.json'), str(tmp_path / 'checkpoints'),
+                        str(tmp_path / 'ccda_config.json')),
+        PHIConsumer(str(tmp_path / 'phi_data.json'))
+    ]
+    CCDAPipeline(consumers).run(str(input_dir))
+    assert parses == [False] * 3
+
+    parses.clear()
+    consumers.append(ReformatConsumer(str(tmp_path / 'reformatted')))
+    CCDAPipeline(consumers[2:]).run(str(input_dir))
+    assert sorted(parses) == [False] * 3 + [True] * 3
@@ -0,0 +1,33 @@
+"""Documents already in the section database must not be counted again."""
+
+import gzip
+import shutil
+
+from ccda_section_db import SectionIndexDB
+
+DOCUMENT = b"""<ClinicalDocument xmlns="urn:hl7-org:v3"><component><structuredBody>
+<component><section><templateId root="2.16.840.1.113883.10.20.22.2.1"/><title>Medications</title></section></component>
+</structuredBody></component></ClinicalDocument>
+"""
+
+def test_pending_skips_known_content(tmp_path):
+    drop = tmp_path / 'drop'
+    drop.mkdir()
+    (drop / 'a.xml').write_bytes(DOCUMENT)
+    (drop / 'other.xml').write_bytes(DOCUMENT.replace(b'Medications', b'Meds'))
+    db = SectionIndexDB(str(tmp_path / 'db'))
+    new_files, fingerprints = db.pending([str(drop / 'a.xml'), str(drop / 'other.xml')])
+    assert len(new_files) == 2
+    db.commit(fingerprints)
+
+    # Moved, renamed, compressed and repeated copies of ingested content
+    redelivered = tmp_path / 'redelivered'
+    redelivered.mkdir()
+    shutil.copy(drop / 'a.xml', redelivered / 'renamed.xml')
+    with gzip.open(redelivered / 'a.xml.gz', 'wb') as f:
+        f.write(DOCUMENT)
+    (redelivered / 'new.xml').write_bytes(DOCUMENT.replace(b'Medications', b'Drugs'))
+    (redelivered / 'new-copy.xml').write_bytes(DOCUMENT.replace(b'Medications', b'Drugs'))
+    files = [str(redelivered / name) for name in ('a.xml.gz', 'new-copy.xml', 'new.xml', 'renamed.xml')]
+    new_files, _ = SectionIndexDB(str(tmp_path / 'db')).pending(files)
+    assert new_files == [str(redelivered / 'new-copy.xml')]
@@ -0,0 +1,84 @@
+"""Saved section matrices must load back exactly and grow by appending."""
+
+import numpy as np
+
+from ccda_section_matrix import SectionMatrix
+
+def section(words):
+    return {'entry_count': 1, 'coded_element_count': 2, 'text_length': words,
+            'char_count': words * 5, 'token_count': words + 1}
+
+def add_files(matrix, start, count):
+    for i in range(start, start + count):
+        matrix.add_file(f'input/ccda/päťient_{i}{"x" * (i % 7)}.xml', [
+            (f'2.16.840.1.113883.10.20.22.2.{i % 5}', section(i)),
+            (f'2.16.840.1.113883.10.20.22.2.{i % 3 + 10}', section(2 * i)),
+        ])
+
+def same(a, b):
+    assert a.files == b.files
+    assert a.section_ids == b.section_ids
+    assert a.indptr == b.indptr and a.indices == b.indices and a.layers == b.layers
+
+def test_save_load_round_trip(tmp_path):
+    matrix = SectionMatrix()
+    add_files(matrix, 0, 20)
+    matrix.add_file('input/ccda/empty.xml', ())
+    matrix.save(tmp_path / 'm.matrix')
+    loaded = SectionMatrix.load(tmp_path / 'm.matrix')
+    same(loaded, matrix)
+    assert (loaded.cooccurrence() == matrix.cooccurrence()).all()
+
+def test_later_saves_append_new_rows(tmp_path):
+    path = tmp_path / 'm.matrix'
+    matrix = SectionMatrix()
+    add_files(matrix, 0, 10)
+    matrix.save(path)
+    first_indices = (path / 'indices.bin').read_bytes()
+
+    add_files(matrix, 10, 10)
+    matrix.save(path)
+    assert (path / 'indices.bin').read_bytes().startswith(first_indices)
+    same(SectionMatrix.load(path), matrix)
+
+def test_uncommitted_and_truncated_rows_are_dropped(tmp_path):
+    path = tmp_path / 'm.matrix'
+    matrix = SectionMatrix()
+    add_files(matrix, 0, 10)
+    matrix.save(path)
+
+    # A save that crashed before meta.json was replaced
+    with open(path / 'indices.bin', 'ab') as f:
+        f.write(np.arange(8, dtype=np.int32).tobytes())
+    with open(path / 'files.bin', 'ab') as f:
+        f.write(b'partial')
+    same(SectionMatrix.load(path), matrix)
+
+    # Rows cut back on resume are removed on disk by the next save
+    resumed = SectionMatrix.load(path)
+    resumed.truncate(6)
+    add_files(resumed, 30, 3)
+    resumed.save(path)
+    expected = SectionMatrix()
+    add_files(expected, 0, 6)
+    add_files(expected, 30, 3)
+    loaded = SectionMatrix.load(path)
+    assert loaded.files == expected.files
+    assert loaded.indptr == expected.indptr
+    assert [loaded.section_ids[c] for c in loaded.indices] == [expected.section_ids[c] for c in expected.indices]
+    assert loaded.layers == expected.layers
+
+def test_other_matrix_rewrites_the_directory(tmp_path):
+    path = tmp_path / 'm.matrix'
+    first = SectionMatrix()
+    add_files(first, 0, 10)
+    first.save(path)
+    second = SectionMatrix()
+    add_files(second, 50, 4)
+    second.save(path)
+    same(SectionMatrix.load(path), second)
+
+    # The first matrix's earlier save was replaced, so it writes everything again
+    add_files(first, 10, 2)
+    first.save(path)
+    same(SectionMatrix.load(path), first)
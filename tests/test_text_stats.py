@@ -0,0 +1,28 @@
+"""Token counting must fall back to the estimate when tiktoken cannot load."""
+
+import sys
+import types
+
+import pytest
+
+from ccda_text_stats import estimate_tokens, get_token_counter, text_counts
+
+@pytest.fixture
+def offline_tiktoken(monkeypatch):
+    calls = []
+
+    def get_encoding(name):
+        calls.append(name)
+        raise ConnectionError('cannot download BPE file')
+
+    monkeypatch.setitem(sys.modules, 'tiktoken', types.SimpleNamespace(get_encoding=get_encoding))
+    get_token_counter.cache_clear()
+    yield calls
+    get_token_counter.cache_clear()
+
+def test_encoding_load_failure_estimates_tokens(offline_tiktoken):
+    assert get_token_counter() is estimate_tokens
+    assert text_counts('  blood  pressure stable ') == (3, 21, estimate_tokens('blood pressure stable'))
+    text_counts('heart rate regular')
+    # The failed load is not retried for every text node
+    assert len(offline_tiktoken) == 1
@@ -0,0 +1,44 @@
+"""The streaming pretty printer must write what the tree-based writer writes."""
+
+import io
+
+import pytest
+from lxml import etree
+
+from ccda_xml_reformatter import CCDAReformatter, InternalSubsetError, StreamingPrettyPrinter
+
+INTERNAL_SUBSET = b"""<?xml version="1.0"?>
+<!DOCTYPE ClinicalDocument [
+<!ENTITY org "Good Health">
+<!ELEMENT note ANY>
+]>
+<ClinicalDocument xmlns="urn:hl7-org:v3"><title>&org; Clinic</title><note/></ClinicalDocument>
+"""
+
+REDECLARED_NAMESPACES = b"""<ClinicalDocument xmlns="urn:hl7-org:v3" xmlns:sdtc="urn:hl7-org:sdtc" xmlns:a="urn:a">
+  <x xmlns:sdtc="urn:hl7-org:sdtc"><sdtc:raceCode code="1"/></x>
+  <y xmlns="urn:hl7-org:v3" xmlns:a="urn:a"/>
+  <z xmlns:a="urn:z"><a:q/></z>
+</ClinicalDocument>
+"""
+
+def tree_output(path) -> bytes:
+    tree = etree.parse(str(path), etree.XMLParser(remove_blank_text=True))
+    return etree.tostring(tree, pretty_print=True, xml_declaration=True, encoding='UTF-8')
+
+def test_redeclared_namespaces_are_kept(tmp_path):
+    source = tmp_path / 'ns.xml'
+    source.write_bytes(REDECLARED_NAMESPACES)
+    out = io.StringIO()
+    StreamingPrettyPrinter(out).write_document(str(source))
+    assert out.getvalue().encode('utf-8') == tree_output(source)
+
+def test_internal_subset_falls_back_to_tree_writer(tmp_path):
+    source = tmp_path / 'dtd.xml'
+    source.write_bytes(INTERNAL_SUBSET)
+    with pytest.raises(InternalSubsetError):
+        StreamingPrettyPrinter(io.StringIO()).write_document(str(source))
+
+    output = tmp_path / 'out.xml'
+    assert CCDAReformatter().reformat_xml(str(source), str(output))
+    assert output.read_bytes() == tree_output(source)